@@ -4,20 +4,41 @@ Handles question-answering using RAG pipeline
 """
 
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from typing import List, Optional
+from datetime import datetime
+import asyncio
+import json
 
-from app.rag.query import query_documents
+from app.db.vector_store import find_document, list_shards
+from app.rag.query import query_documents, stream_query_documents
 from app.rag.prompts import create_chat_prompt
+from app.rag.summarize import generate_document_summary, stream_document_summary
+from app.rag.mcq import generate_mcqs, MAX_MCQ_QUESTIONS
+from app.utils.llm_scheduler import get_llm_scheduler, LLMOverloadedError, PRIORITY_BATCH
 
 router = APIRouter()
 
 
+class RetrievalFilters(BaseModel):
+    """Restricts the documents and pages an answer may draw on (all criteria must hold)"""
+    file_ids: Optional[List[str]] = None
+    filenames: Optional[List[str]] = None  # Glob patterns such as "physics-*.pdf"; any may match
+    subjects: Optional[List[str]] = None  # Case-insensitive; any may match
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+    page_from: Optional[int] = Field(default=None, ge=1)
+    page_to: Optional[int] = Field(default=None, ge=1)
+
+
 class ChatRequest(BaseModel):
     """Request model for chat endpoint"""
     question: str
     conversation_history: Optional[List[dict]] = []
     max_sources: Optional[int] = 3
+    shards: Optional[List[str]] = None  # Subject/grade shards to search (all if empty)
+    filters: Optional[RetrievalFilters] = None
 
 
 class ChatResponse(BaseModel):
@@ -25,6 +46,35 @@ class ChatResponse(BaseModel):
     answer: str
     sources: List[dict]
     confidence: Optional[str] = None
+    timing: Optional[dict] = None
+    prompt_tokens: Optional[dict] = None
+
+
+async def _check_shards(shards: Optional[List[str]]):
+    """Reject requests scoped to shards that do not exist"""
+    if not shards:
+        return
+    
+    unknown = sorted(set(shards) - set(await asyncio.to_thread(list_shards)))
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown shard(s): {', '.join(unknown)}. See GET /api/documents/shards"
+        )
+
+
+def _request_filters(request: ChatRequest) -> Optional[dict]:
+    """Retrieval filters of a request, rejecting an empty page range"""
+    if request.filters is None:
+        return None
+    
+    filters = request.filters.model_dump(exclude_none=True)
+    if filters.get("page_from", 0) > filters.get("page_to", float("inf")):
+        raise HTTPException(
+            status_code=400,
+            detail="filters.page_from cannot be after filters.page_to"
+        )
+    return filters
 
 
 @router.post("/ask", response_model=ChatResponse)
@@ -43,13 +93,20 @@ async def ask_question(request: ChatRequest):
             status_code=400,
             detail="Question cannot be empty"
         )
+    await _check_shards(request.shards)
+    filters = _request_filters(request)
     
     try:
+        # Reject right away when the generation queue is full
+        get_llm_scheduler().check_admission()
+        
         # Query the RAG system
         result = await query_documents(
             question=request.question,
             max_results=request.max_sources,
-            conversation_history=request.conversation_history
+            conversation_history=request.conversation_history,
+            shards=request.shards,
+            filters=filters
         )
         
         if not result:
@@ -61,11 +118,19 @@ async def ask_question(request: ChatRequest):
         return ChatResponse(
             answer=result["answer"],
             sources=result["sources"],
-            confidence=result.get("confidence", "medium")
+            confidence=result.get("confidence", "medium"),
+            timing=result.get("timing"),
+            prompt_tokens=result.get("prompt_tokens")
         )
         
     except HTTPException:
         raise
+    except LLMOverloadedError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -73,22 +138,106 @@ async def ask_question(request: ChatRequest):
         )
 
 
+@router.post("/ask/stream")
+async def ask_question_stream(request: ChatRequest):
+    """
+    Answer a question using RAG pipeline, streaming the answer
+    
+    Returns newline-delimited JSON (NDJSON) events:
+    1. {"type": "sources", ...} as soon as retrieval finishes
+    2. {"type": "token", "content": ...} for each generated fragment
+    3. {"type": "done", "confidence": ..., "timing": {...}} at the end
+    
+    If generation fails mid-stream, a {"type": "error", "detail": ...} event
+    is sent instead of "done". When the generation queue is full the request
+    is rejected with 429 before streaming starts; if no generation slot frees
+    up in time, the error event carries "retry_after" (seconds).
+    """
+    if not request.question or len(request.question.strip()) == 0:
+        raise HTTPException(
+            status_code=400,
+            detail="Question cannot be empty"
+        )
+    await _check_shards(request.shards)
+    filters = _request_filters(request)
+    
+    try:
+        get_llm_scheduler().check_admission()
+    except LLMOverloadedError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    async def event_stream():
+        try:
+            async for event in stream_query_documents(
+                question=request.question,
+                max_results=request.max_sources,
+                conversation_history=request.conversation_history,
+                shards=request.shards,
+                filters=filters
+            ):
+                yield json.dumps(event) + "\n"
+        except LLMOverloadedError as e:
+            yield json.dumps({
+                "type": "error",
+                "detail": str(e),
+                "retry_after": e.retry_after
+            }) + "\n"
+        except Exception as e:
+            yield json.dumps({
+                "type": "error",
+                "detail": f"Error processing question: {str(e)}"
+            }) + "\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def _check_batch_request(file_id: str):
+    """Reject a summary or MCQ request for an unknown document or when the batch queue is full"""
+    if await asyncio.to_thread(find_document, file_id) is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Document not found or not yet indexed"
+        )
+    
+    try:
+        get_llm_scheduler().check_admission(PRIORITY_BATCH)
+    except LLMOverloadedError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+
 @router.post("/summarize")
 async def summarize_document(file_id: str):
     """
     Generate a summary of a specific document
-    Uses the same RAG pipeline with a summarization prompt
+    
+    Map-reduce over the document's chunks (app.rag.summarize): sections are
+    summarized in parallel and combined into one summary. Partial summaries
+    are cached, so summarizing the document again, or an edited version of
+    it, only generates what changed.
     """
+    await _check_batch_request(file_id)
+    
     try:
-        # This is a placeholder for document summarization
-        # In production, retrieve all chunks for the specific document
-        # and generate a comprehensive summary
-        
-        return {
-            "message": "Summarization feature coming soon",
-            "file_id": file_id
-        }
+        return await generate_document_summary(file_id)
         
+    except LLMOverloadedError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -96,19 +245,72 @@ async def summarize_document(file_id: str):
         )
 
 
+@router.post("/summarize/stream")
+async def summarize_document_stream(file_id: str):
+    """
+    Generate a summary of a specific document, streaming progress
+    
+    Returns newline-delimited JSON (NDJSON) events:
+    1. {"type": "started", "chunks": ..., "sections": ...}
+    2. {"type": "progress", "stage": ..., "completed": ..., "total": ..., "cached": ...}
+       after each section summary and combine step
+    3. {"type": "done", "summary": ..., "steps": {...}, "timing": {...}} at the end
+    
+    If summarization fails, a {"type": "error", "detail": ...} event is sent
+    instead of "done".
+    """
+    await _check_batch_request(file_id)
+    
+    async def event_stream():
+        try:
+            async for event in stream_document_summary(file_id):
+                yield json.dumps(event) + "\n"
+        except LLMOverloadedError as e:
+            yield json.dumps({
+                "type": "error",
+                "detail": str(e),
+                "retry_after": e.retry_after
+            }) + "\n"
+        except Exception as e:
+            yield json.dumps({
+                "type": "error",
+                "detail": f"Failed to summarize document: {str(e)}"
+            }) + "\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.post("/generate-mcq")
 async def generate_mcq(file_id: str, num_questions: int = 5):
     """
     Generate multiple choice questions from a document
-    Future feature for student assessment
+    
+    Questions are generated in parallel from representative chunks across the
+    document, parsed into structured JSON and de-duplicated. They are kept in
+    a per-document question bank, so repeat requests are served without
+    calling the LLM and larger sets only generate the missing questions.
     """
+    if num_questions < 1 or num_questions > MAX_MCQ_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"num_questions must be between 1 and {MAX_MCQ_QUESTIONS}"
+        )
+    
+    await _check_batch_request(file_id)
+    
     try:
-        return {
-            "message": "MCQ generation feature coming soon",
-            "file_id": file_id,
-            "requested_questions": num_questions
-        }
+        return await generate_mcqs(file_id, num_questions)
         
+    except LLMOverloadedError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
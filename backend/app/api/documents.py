@@ -1,18 +1,33 @@
 """
 Document Management Endpoints
-Handles PDF upload, processing, and listing
+Handles PDF upload, background processing, and listing
 """
 
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from fastapi.responses import JSONResponse
-from typing import List
+from pydantic import BaseModel
+from typing import AsyncIterator, Dict, List, Optional
+from contextlib import AsyncExitStack, asynccontextmanager
+import asyncio
 import os
 import shutil
 from datetime import datetime
-import hashlib
 
-from app.rag.ingest import ingest_pdf
-from app.db.vector_store import get_vector_store
+from app.db.vector_store import (
+    DEFAULT_SHARD,
+    delete_documents_chunks,
+    find_document,
+    get_vector_store,
+    list_shards,
+    shard_name
+)
+from app.db.vector_index import get_vector_index, loaded_vector_indexes, vector_index_enabled
+from app.db.document_catalog import get_document_catalog, SORTABLE_COLUMNS, DOCUMENT_PROCESSING
+from app.jobs.ingest_jobs import get_ingest_queue, format_job, STATUS_COMPLETED
+from app.rag.answer_cache import get_answer_cache
+from app.rag.lexical_index import get_lexical_index
+from app.rag.question_bank import get_question_bank
+from app.utils.upload_utils import save_upload_to_temp, UploadTooLargeError
 
 router = APIRouter()
 
@@ -20,18 +35,74 @@ router = APIRouter()
 UPLOAD_DIR = "data/uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Maximum accepted upload size, enforced while streaming
+MAX_UPLOAD_SIZE_MB = 250
 
-@router.post("/upload")
-async def upload_document(file: UploadFile = File(...)):
+# Length of the file_id taken from the SHA-256 content hash (128 bits)
+FILE_ID_LENGTH = 32
+
+# Maximum documents removed by one bulk delete request
+MAX_BULK_DELETE = 500
+
+# Maximum page size of the document listing
+MAX_LIST_LIMIT = 500
+
+# Per-document locks so concurrent uploads of the same file ingest it only once:
+# file_id -> [lock, requests holding or waiting for it]
+_ingest_locks: Dict[str, list] = {}
+
+
+class BulkDeleteRequest(BaseModel):
+    """Request model for bulk document deletion"""
+    file_ids: List[str]
+
+
+def make_file_id(content_hash: str) -> str:
+    """Derive a document's file_id from its full SHA-256 content hash"""
+    return content_hash[:FILE_ID_LENGTH]
+
+
+@asynccontextmanager
+async def _document_lock(file_id: str) -> AsyncIterator[None]:
     """
-    Upload and process a PDF document
+    Hold a document's ingest lock
+    
+    The entry is reference counted and only removed once no request holds
+    or waits for the lock, so a later request can never create a second
+    lock for the same document while the first is still in use.
+    """
+    entry = _ingest_locks.setdefault(file_id, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _ingest_locks[file_id]
+
+
+@router.post("/upload", status_code=202)
+async def upload_document(
+    file: UploadFile = File(...),
+    subject: Optional[str] = Form(None),
+    grade: Optional[str] = Form(None)
+):
+    """
+    Upload a PDF document and queue it for processing
     
     Steps:
     1. Validate file is PDF
-    2. Save to local storage
-    3. Extract text and chunk
-    4. Generate embeddings
-    5. Store in vector database
+    2. Stream to a temporary file while hashing, enforcing the size limit
+    3. Return the existing document if the content was already ingested
+    4. Atomically move the file into local storage
+    5. Queue a background ingestion job (extract, chunk, embed, store)
+    
+    The optional subject and grade form fields select the shard the
+    document is stored in (see GET /api/documents/shards).
+    
+    Returns immediately with a job_id; poll GET /api/documents/jobs/{job_id}
+    for progress.
     """
     # Validate file type
     if not file.filename.endswith('.pdf'):
@@ -40,89 +111,413 @@ async def upload_document(file: UploadFile = File(...)):
             detail="Only PDF files are supported"
         )
     
+    file_path = None
+    temp_path = None
+    
     try:
-        # Generate unique filename using hash
-        file_content = await file.read()
-        file_hash = hashlib.md5(file_content).hexdigest()[:8]
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_filename = f"{timestamp}_{file_hash}_{file.filename}"
-        file_path = os.path.join(UPLOAD_DIR, safe_filename)
-        
-        # Save file to disk
-        with open(file_path, "wb") as buffer:
-            buffer.write(file_content)
-        
-        # Process and ingest PDF into vector store
-        result = await ingest_pdf(
-            file_path=file_path,
-            filename=file.filename,
-            file_hash=file_hash
+        # Stream to disk and identify the document by a hash of its full content
+        temp_path, content_hash, size_bytes = await save_upload_to_temp(
+            file,
+            UPLOAD_DIR,
+            max_bytes=MAX_UPLOAD_SIZE_MB * 1024 * 1024
         )
+        file_hash = make_file_id(content_hash)
+        
+        async with _document_lock(file_hash):
+            # Identical content was already ingested: skip extraction and embedding
+            existing = find_document(file_hash)
+            if existing is not None:
+                print(f"♻️  Duplicate upload of {file.filename}, reusing {file_hash}")
+                return JSONResponse(
+                    status_code=200,
+                    content={
+                        "message": "Document already uploaded and processed",
+                        "filename": existing.get("filename", file.filename),
+                        "file_id": file_hash,
+                        "chunks_created": existing.get("total_chunks", 0),
+                        "shard": existing.get("shard", DEFAULT_SHARD),
+                        "status": STATUS_COMPLETED,
+                        "duplicate": True
+                    }
+                )
+            
+            # Identical content is already being ingested: report that job
+            job_queue = get_ingest_queue()
+            active_job = job_queue.store.find_active(file_hash)
+            if active_job is not None:
+                return JSONResponse(
+                    status_code=202,
+                    content={
+                        "message": "Document is already being processed",
+                        "filename": active_job["filename"],
+                        "file_id": file_hash,
+                        "job_id": active_job["job_id"],
+                        "status": active_job["status"],
+                        "duplicate": True
+                    }
+                )
+            
+            # A previous ingestion failed part-way: resume it instead of starting over
+            failed_job = job_queue.store.find_failed(file_hash)
+            if failed_job is not None:
+                if not os.path.exists(failed_job["file_path"]):
+                    os.replace(temp_path, failed_job["file_path"])
+                    temp_path = None
+                job = job_queue.retry(failed_job["job_id"])
+                get_document_catalog().update(file_hash, status=DOCUMENT_PROCESSING, error=None)
+                return JSONResponse(
+                    status_code=202,
+                    content={
+                        "message": "Resuming previously failed processing",
+                        "filename": job["filename"],
+                        "file_id": file_hash,
+                        "job_id": job["job_id"],
+                        "status": job["status"],
+                        "duplicate": True
+                    }
+                )
+            
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            safe_filename = f"{timestamp}_{file_hash}_{file.filename}"
+            file_path = os.path.join(UPLOAD_DIR, safe_filename)
+            
+            # Move the fully written file into place
+            os.replace(temp_path, file_path)
+            temp_path = None
+            
+            # Queue ingestion into the shard's collection
+            shard = shard_name(subject, grade)
+            get_document_catalog().add(
+                file_id=file_hash,
+                filename=file.filename,
+                file_path=file_path,
+                size_bytes=size_bytes,
+                content_hash=content_hash,
+                subject=subject,
+                grade=grade,
+                shard=shard
+            )
+            job = job_queue.submit(
+                file_id=file_hash,
+                filename=file.filename,
+                file_path=file_path
+            )
         
         return JSONResponse(
-            status_code=200,
+            status_code=202,
             content={
-                "message": "Document uploaded and processed successfully",
+                "message": "Document uploaded and queued for processing",
                 "filename": file.filename,
                 "file_id": file_hash,
-                "chunks_created": result.get("chunks_count", 0),
-                "upload_time": timestamp
+                "shard": shard,
+                "job_id": job["job_id"],
+                "status": job["status"],
+                "upload_time": timestamp,
+                "duplicate": False
             }
         )
         
+    except UploadTooLargeError as e:
+        raise HTTPException(
+            status_code=413,
+            detail=str(e)
+        )
     except Exception as e:
-        # Clean up file if processing failed
-        if os.path.exists(file_path):
+        # Clean up file if it could not be queued
+        if file_path and os.path.exists(file_path):
             os.remove(file_path)
         
         raise HTTPException(
             status_code=500,
             detail=f"Failed to process document: {str(e)}"
         )
+    finally:
+        # Duplicate uploads (and failures) leave the temporary file behind
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+@router.get("/jobs")
+async def list_jobs(limit: int = 50, status: Optional[str] = None):
+    """
+    List recent ingestion jobs with their progress
+    Optionally filter by status (queued, running, completed, failed)
+    """
+    jobs = get_ingest_queue().store.list(limit=limit, status=status)
+    return {
+        "total_jobs": len(jobs),
+        "queue_depth": get_ingest_queue().queue_depth(),
+        "jobs": [format_job(job) for job in jobs]
+    }
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Get progress of an ingestion job
+    Reports stage, pages/chunks processed, throughput and errors
+    """
+    job = get_ingest_queue().store.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Job with ID {job_id} not found"
+        )
+    
+    return format_job(job)
+
+
+@router.post("/jobs/{job_id}/retry", status_code=202)
+async def retry_job(job_id: str):
+    """
+    Retry a failed ingestion job
+    Resumes after the last batch of chunks that was stored
+    """
+    job_queue = get_ingest_queue()
+    job = job_queue.store.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Job with ID {job_id} not found"
+        )
+    
+    retried = job_queue.retry(job_id)
+    if retried is None:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Job {job_id} is {job['status']}; only failed jobs can be retried"
+        )
+    
+    return format_job(retried)
 
 
 @router.get("/list")
-async def list_documents():
+async def list_documents(
+    limit: int = 50,
+    offset: int = 0,
+    sort: str = "uploaded_at",
+    order: str = "desc",
+    status: Optional[str] = None,
+    search: Optional[str] = None,
+    shard: Optional[str] = None
+):
+    """
+    List uploaded documents, one page at a time
+    Reads the document catalog (an indexed SQLite query), sortable by
+    uploaded_at, filename, size_bytes, page_count, chunk_count or
+    ingest_seconds, and filterable by status, shard and filename text
+    """
+    if sort not in SORTABLE_COLUMNS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"sort must be one of: {', '.join(SORTABLE_COLUMNS)}"
+        )
+    if order not in ("asc", "desc"):
+        raise HTTPException(
+            status_code=400,
+            detail="order must be asc or desc"
+        )
+    
+    try:
+        # Clamp the page, and report the values actually used
+        limit = max(1, min(limit, MAX_LIST_LIMIT))
+        offset = max(offset, 0)
+        documents, total = get_document_catalog().list(
+            limit=limit,
+            offset=offset,
+            sort=sort,
+            descending=order == "desc",
+            status=status,
+            search=search,
+            shard=shard
+        )
+        
+        return {
+            "total_documents": total,
+            "offset": offset,
+            "limit": limit,
+            "documents": [
+                {
+                    "id": doc["file_id"],
+                    "filename": doc["filename"],
+                    "upload_date": datetime.fromtimestamp(doc["uploaded_at"]).isoformat(timespec="seconds"),
+                    "size_bytes": doc["size_bytes"],
+                    "size_mb": round(doc["size_bytes"] / (1024 * 1024), 2),
+                    "status": doc["status"],
+                    "subject": doc["subject"],
+                    "grade": doc["grade"],
+                    "shard": doc["shard"],
+                    "page_count": doc["page_count"],
+                    "chunk_count": doc["chunk_count"],
+                    "embedding_model": doc["embedding_model"],
+                    "ingest_seconds": doc["ingest_seconds"],
+                    "error": doc["error"]
+                }
+                for doc in documents
+            ]
+        }
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to list documents: {str(e)}"
+        )
+
+
+@router.get("/shards")
+async def list_document_shards():
     """
-    List all uploaded documents
-    Returns metadata about each document in the system
+    List the subject/grade shards and their chunk counts
+    Shard names can be passed to /api/chat/ask to scope retrieval
     """
     try:
-        vector_store = get_vector_store()
+        shards = await asyncio.to_thread(list_shards)
+        counts = await asyncio.to_thread(lambda: [get_vector_store(shard).count() for shard in shards])
+        loaded = loaded_vector_indexes()
+        
+        return {
+            "total_shards": len(shards),
+            "shards": [
+                {
+                    "shard": shard,
+                    "chunks": count,
+                    "vector_index_loaded": shard in loaded
+                }
+                for shard, count in zip(shards, counts)
+            ]
+        }
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to list shards: {str(e)}"
+        )
+
+
+def _upload_paths(file_id: str) -> List[str]:
+    """Stored PDFs of a document (saved as {date}_{time}_{file_id}_{filename})"""
+    if not os.path.exists(UPLOAD_DIR):
+        return []
+    marker = f"_{file_id}_"
+    return [
+        os.path.join(UPLOAD_DIR, filename)
+        for filename in os.listdir(UPLOAD_DIR)
+        if marker in filename and filename.endswith('.pdf')
+    ]
+
+
+async def _delete_documents(file_ids: List[str]) -> Dict:
+    """
+    Remove documents from storage, the vector store and every derived index
+    
+    Documents that are still being ingested are skipped, since their job
+    would store chunks again after the delete. The documents' ingest locks
+    are held throughout, so an upload of the same content cannot queue a
+    job between the check and the delete.
+    
+    Args:
+        file_ids: Unique identifiers of the documents
+    
+    Returns:
+        Dictionary with deleted, not_found and processing file_ids and the
+        number of chunks removed
+    """
+    async with AsyncExitStack() as stack:
+        # Sorted, so two bulk deletes never wait on each other's locks in opposite order
+        for file_id in sorted(set(file_ids)):
+            await stack.enter_async_context(_document_lock(file_id))
+        return await _delete_documents_locked(file_ids)
+
+
+async def _delete_documents_locked(file_ids: List[str]) -> Dict:
+    # Catalog, SQLite and ChromaDB calls block, so the whole delete runs in one worker thread
+    return await asyncio.to_thread(_delete_documents_sync, file_ids)
+
+
+def _delete_documents_sync(file_ids: List[str]) -> Dict:
+    job_queue = get_ingest_queue()
+    catalog = get_document_catalog()
+    lexical_index = get_lexical_index()
+    deleted, not_found, processing = [], [], []
+    shards = set()
+    
+    for file_id in dict.fromkeys(file_ids):
+        if job_queue.store.find_active(file_id) is not None:
+            processing.append(file_id)
+            continue
         
-        # Get all documents from vector store metadata
-        # This is a simplified version - in production, maintain a separate metadata DB
-        documents = []
+        record = catalog.get(file_id)
+        if record is not None and record["file_path"] and os.path.exists(record["file_path"]):
+            paths = [record["file_path"]]
+        else:
+            paths = _upload_paths(file_id)
+        if record is None:
+            # Documents ingested before the catalog existed: their shard is unknown
+            indexed = bool(lexical_index.document_chunk_ids(file_id)) or find_document(file_id) is not None
+            if not paths and not indexed:
+                not_found.append(file_id)
+                continue
+            shards.update(list_shards())
+        else:
+            shards.add(record["shard"])
         
-        if os.path.exists(UPLOAD_DIR):
-            for filename in os.listdir(UPLOAD_DIR):
-                if filename.endswith('.pdf'):
-                    file_path = os.path.join(UPLOAD_DIR, filename)
-                    file_stats = os.stat(file_path)
-                    
-                    # Parse filename to extract metadata
-                    parts = filename.split('_')
-                    timestamp = parts[0] if len(parts) > 0 else "unknown"
-                    file_hash = parts[1] if len(parts) > 1 else "unknown"
-                    original_name = '_'.join(parts[2:]) if len(parts) > 2 else filename
-                    
-                    documents.append({
-                        "id": file_hash,
-                        "filename": original_name,
-                        "upload_date": timestamp,
-                        "size_bytes": file_stats.st_size,
-                        "size_mb": round(file_stats.st_size / (1024 * 1024), 2)
-                    })
+        for path in paths:
+            os.remove(path)
+        job_queue.discard_checkpoints(file_id)
+        deleted.append(file_id)
+    
+    chunks_deleted = 0
+    if deleted:
+        # One filtered delete per shard the documents are stored in
+        chunks_deleted = delete_documents_chunks(deleted, shards=sorted(shards))
         
+        # Drop catalog rows, keyword postings, question banks and cached answers that cited these documents
+        catalog.remove(deleted)
+        lexical_index.remove_documents(deleted)
+        get_question_bank().remove(deleted)
+        if vector_index_enabled():
+            for shard in sorted(shards):
+                get_vector_index(shard).remove_documents(deleted)
+        answer_cache = get_answer_cache()
+        for file_id in deleted:
+            answer_cache.invalidate_document(file_id)
+    
+    return {
+        "deleted": deleted,
+        "not_found": not_found,
+        "processing": processing,
+        "chunks_deleted": chunks_deleted
+    }
+
+
+@router.post("/bulk-delete")
+async def bulk_delete_documents(request: BulkDeleteRequest):
+    """
+    Delete many documents in one call
+    Chunks of all documents are removed with a single vector store delete
+    """
+    if not request.file_ids:
+        raise HTTPException(
+            status_code=400,
+            detail="file_ids cannot be empty"
+        )
+    if len(request.file_ids) > MAX_BULK_DELETE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BULK_DELETE} documents can be deleted per request"
+        )
+    
+    try:
+        result = await _delete_documents(request.file_ids)
         return {
-            "total_documents": len(documents),
-            "documents": sorted(documents, key=lambda x: x["upload_date"], reverse=True)
+            "message": f"Deleted {len(result['deleted'])} document(s)",
+            **result
         }
         
     except Exception as e:
         raise HTTPException(
             status_code=500,
-            detail=f"Failed to list documents: {str(e)}"
+            detail=f"Failed to delete documents: {str(e)}"
         )
 
 
@@ -130,31 +525,26 @@ async def list_documents():
 async def delete_document(file_id: str):
     """
     Delete a document by its ID
-    Removes from both storage and vector database
+    Removes the stored PDF, its catalog entry, vector store chunks, keyword postings, question bank and cached answers
     """
     try:
-        # Find and delete file
-        deleted = False
-        if os.path.exists(UPLOAD_DIR):
-            for filename in os.listdir(UPLOAD_DIR):
-                if file_id in filename and filename.endswith('.pdf'):
-                    file_path = os.path.join(UPLOAD_DIR, filename)
-                    os.remove(file_path)
-                    deleted = True
-                    break
+        result = await _delete_documents([file_id])
         
-        if not deleted:
+        if result["processing"]:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Document {file_id} is still being processed"
+            )
+        if not result["deleted"]:
             raise HTTPException(
                 status_code=404,
                 detail=f"Document with ID {file_id} not found"
             )
         
-        # TODO: Remove from vector store
-        # This requires tracking document chunks by file_id in metadata
-        
         return {
             "message": "Document deleted successfully",
-            "file_id": file_id
+            "file_id": file_id,
+            "chunks_deleted": result["chunks_deleted"]
         }
         
     except HTTPException:
@@ -7,6 +7,22 @@ from fastapi import APIRouter, HTTPException
 import httpx
 from datetime import datetime
 
+from app.utils.ollama_client import (
+    OLLAMA_BASE_URL,
+    HEALTH_TIMEOUT,
+    get_http_client,
+    get_pool_stats,
+    get_chat_stats
+)
+from app.utils.embedding_cache import get_embedding_cache
+from app.rag.answer_cache import get_answer_cache
+from app.rag.lexical_index import get_lexical_index
+from app.rag.coalescing import get_request_coalescer
+from app.rag.summary_cache import get_summary_cache
+from app.rag.question_bank import get_question_bank
+from app.utils.llm_scheduler import get_llm_scheduler
+from app.db.vector_index import loaded_vector_indexes, vector_index_enabled
+
 router = APIRouter()
 
 
@@ -26,19 +42,18 @@ async def health_check():
     
     # Check Ollama connectivity
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get("http://localhost:11434/api/tags")
-            if response.status_code == 200:
-                health_status["services"]["ollama"] = {
-                    "status": "connected",
-                    "models": response.json().get("models", [])
-                }
-            else:
-                health_status["services"]["ollama"] = {
-                    "status": "error",
-                    "message": f"HTTP {response.status_code}"
-                }
-                health_status["status"] = "degraded"
+        response = await get_http_client().get("/api/tags", timeout=HEALTH_TIMEOUT)
+        if response.status_code == 200:
+            health_status["services"]["ollama"] = {
+                "status": "connected",
+                "models": response.json().get("models", [])
+            }
+        else:
+            health_status["services"]["ollama"] = {
+                "status": "error",
+                "message": f"HTTP {response.status_code}"
+            }
+            health_status["status"] = "degraded"
     except Exception as e:
         health_status["services"]["ollama"] = {
             "status": "disconnected",
@@ -71,25 +86,49 @@ async def check_ollama():
     Returns available models and version info
     """
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get("http://localhost:11434/api/tags")
-            if response.status_code == 200:
-                return {
-                    "status": "connected",
-                    "data": response.json()
-                }
-            else:
-                raise HTTPException(
-                    status_code=503,
-                    detail=f"Ollama returned status {response.status_code}"
-                )
+        response = await get_http_client().get("/api/tags", timeout=HEALTH_TIMEOUT)
+        if response.status_code == 200:
+            return {
+                "status": "connected",
+                "data": response.json()
+            }
+        else:
+            raise HTTPException(
+                status_code=503,
+                detail=f"Ollama returned status {response.status_code}"
+            )
+    except HTTPException:
+        raise
     except httpx.ConnectError:
         raise HTTPException(
             status_code=503,
-            detail="Cannot connect to Ollama. Ensure Ollama is running at http://localhost:11434"
+            detail=f"Cannot connect to Ollama. Ensure Ollama is running at {OLLAMA_BASE_URL}"
         )
     except Exception as e:
         raise HTTPException(
             status_code=503,
             detail=f"Ollama health check failed: {str(e)}"
         )
+
+
+@router.get("/health/metrics")
+async def get_metrics():
+    """
+    Runtime metrics for performance tuning
+    Reports shared HTTP connection pool usage, chat prefill time and cache effectiveness
+    """
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "http_pool": get_pool_stats(),
+        "chat": get_chat_stats(),
+        "llm_scheduler": get_llm_scheduler().stats(),
+        "embedding_cache": get_embedding_cache().stats(),
+        "answer_cache": get_answer_cache().stats(),
+        "request_coalescing": get_request_coalescer().stats(),
+        "summary_cache": get_summary_cache().stats(),
+        "question_bank": get_question_bank().stats(),
+        "lexical_index": get_lexical_index().stats(),
+        "vector_index": {
+            shard: vector_index.stats() for shard, vector_index in loaded_vector_indexes().items()
+        } if vector_index_enabled() else None
+    }
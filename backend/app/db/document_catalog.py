@@ -0,0 +1,402 @@
+"""
+Document Catalog
+SQLite table of uploaded documents and their ingestion results
+
+Listing documents used to walk the upload directory and parse metadata back
+out of filenames. The catalog keeps one row per document instead (original
+name, content hash, size, page and chunk counts, embedding model, ingestion
+time and status), so listing is an indexed, paginated query whatever the
+size of the library. It also records each document's subject, grade and the
+shard its chunks are stored in.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Collection, Dict, List, Optional, Sequence, Tuple
+
+from app.db.vector_store import DEFAULT_SHARD, find_document
+
+
+# Catalog configuration
+DOCUMENT_CATALOG_PATH = "data/documents.sqlite3"
+
+# Document statuses
+DOCUMENT_PROCESSING = "processing"
+DOCUMENT_READY = "ready"
+DOCUMENT_FAILED = "failed"
+
+# Columns the listing can be sorted by
+SORTABLE_COLUMNS = ("uploaded_at", "filename", "size_bytes", "page_count", "chunk_count", "ingest_seconds")
+
+# Columns added after the first release, created on open if missing
+_ADDED_COLUMNS = {
+    "subject": "TEXT",
+    "grade": "TEXT",
+    "shard": f"TEXT NOT NULL DEFAULT '{DEFAULT_SHARD}'"
+}
+
+# Stored uploads are named {date}_{time}_{file_id}_{original filename}
+_UPLOAD_NAME_PARTS = 4
+
+# Global catalog instance
+_document_catalog = None
+_document_catalog_lock = threading.Lock()  # Retrieval opens the catalog from worker threads
+
+
+def parse_upload_filename(filename: str) -> Optional[Tuple[str, str, float]]:
+    """
+    Split a stored upload's name into (file_id, original filename, upload time)
+    
+    Only the first three underscores are separators, so original names that
+    contain underscores are kept intact.
+    
+    Args:
+        filename: Name of the file in the upload directory
+    
+    Returns:
+        Tuple of (file_id, original filename, upload timestamp), or None if
+        the name does not follow the upload naming scheme
+    """
+    parts = filename.split("_", _UPLOAD_NAME_PARTS - 1)
+    if len(parts) < _UPLOAD_NAME_PARTS:
+        return None
+    
+    date, clock, file_id, original = parts
+    try:
+        uploaded_at = datetime.strptime(f"{date}_{clock}", "%Y%m%d_%H%M%S").timestamp()
+    except ValueError:
+        return None
+    return file_id, original, uploaded_at
+
+
+class DocumentCatalog:
+    """
+    SQLite-backed document metadata
+    
+    Args:
+        path: SQLite database file
+    """
+    
+    def __init__(self, path: str = DOCUMENT_CATALOG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                file_id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                content_hash TEXT,
+                file_path TEXT,
+                size_bytes INTEGER DEFAULT 0,
+                page_count INTEGER DEFAULT 0,
+                failed_pages INTEGER DEFAULT 0,
+                chunk_count INTEGER DEFAULT 0,
+                total_characters INTEGER DEFAULT 0,
+                embedding_model TEXT,
+                status TEXT NOT NULL,
+                error TEXT,
+                uploaded_at REAL NOT NULL,
+                ingested_at REAL,
+                ingest_seconds REAL
+            )
+            """
+        )
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(documents)")}
+        for column, definition in _ADDED_COLUMNS.items():
+            if column not in columns:
+                try:
+                    self._conn.execute(f"ALTER TABLE documents ADD COLUMN {column} {definition}")
+                except sqlite3.OperationalError as e:
+                    # Another process added it since the table was read
+                    if "duplicate column" not in str(e):
+                        raise
+        # file_id breaks ties, so every sort order is fully served by an index
+        for column in SORTABLE_COLUMNS:
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_documents_{column} ON documents({column}, file_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_status ON documents(status, uploaded_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_shard ON documents(shard, uploaded_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_subject ON documents(subject COLLATE NOCASE)")
+        self._conn.commit()
+    
+    def add(
+        self,
+        file_id: str,
+        filename: str,
+        file_path: str,
+        size_bytes: int,
+        content_hash: Optional[str] = None,
+        uploaded_at: Optional[float] = None,
+        subject: Optional[str] = None,
+        grade: Optional[str] = None,
+        shard: str = DEFAULT_SHARD
+    ):
+        """
+        Record an uploaded document as processing
+        
+        Re-uploads of a document keep its ingestion results until the new
+        ingestion finishes.
+        """
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO documents (
+                    file_id, filename, content_hash, file_path, size_bytes, status, uploaded_at,
+                    subject, grade, shard
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(file_id) DO UPDATE SET
+                    filename = excluded.filename,
+                    content_hash = COALESCE(excluded.content_hash, content_hash),
+                    file_path = excluded.file_path,
+                    size_bytes = excluded.size_bytes,
+                    status = excluded.status,
+                    error = NULL,
+                    subject = excluded.subject,
+                    grade = excluded.grade,
+                    shard = excluded.shard
+                """,
+                (file_id, filename, content_hash, file_path, size_bytes, DOCUMENT_PROCESSING,
+                 uploaded_at or time.time(), subject, grade, shard)
+            )
+            self._conn.commit()
+    
+    def update(self, file_id: str, **fields):
+        """Update columns of a document"""
+        if not fields:
+            return
+        
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE documents SET {assignments} WHERE file_id = ?",
+                (*fields.values(), file_id)
+            )
+            self._conn.commit()
+    
+    def get(self, file_id: str) -> Optional[Dict]:
+        """Fetch a document by ID"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM documents WHERE file_id = ?", (file_id,)).fetchone()
+        return dict(row) if row else None
+    
+    def unfinished(self, file_ids: Sequence[str]) -> List[str]:
+        """
+        Select the documents that are not fully ingested
+        
+        Their stored chunks are partial: the document is still being
+        ingested, or its ingestion failed and is waiting to be resumed.
+        Documents missing from the catalog are treated as finished.
+        
+        Args:
+            file_ids: Unique identifiers of the documents
+        
+        Returns:
+            IDs of the documents that are processing or failed
+        """
+        file_ids = list(dict.fromkeys(file_ids))
+        if not file_ids:
+            return []
+        
+        placeholders = ", ".join("?" for _ in file_ids)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT file_id FROM documents WHERE file_id IN ({placeholders}) AND status != ?",
+                [*file_ids, DOCUMENT_READY]
+            ).fetchall()
+        return [row["file_id"] for row in rows]
+    
+    def remove(self, file_ids: Sequence[str]) -> int:
+        """
+        Delete documents from the catalog
+        
+        Args:
+            file_ids: Unique identifiers of the documents
+        
+        Returns:
+            Number of documents removed
+        """
+        with self._lock:
+            cursor = self._conn.executemany("DELETE FROM documents WHERE file_id = ?", [(f,) for f in file_ids])
+            self._conn.commit()
+            return cursor.rowcount
+    
+    def list(
+        self,
+        limit: int = 50,
+        offset: int = 0,
+        sort: str = "uploaded_at",
+        descending: bool = True,
+        status: Optional[str] = None,
+        search: Optional[str] = None,
+        shard: Optional[str] = None
+    ) -> Tuple[List[Dict], int]:
+        """
+        List documents, one page at a time
+        
+        Args:
+            limit: Maximum documents returned
+            offset: Documents skipped
+            sort: Column to sort by (one of SORTABLE_COLUMNS)
+            descending: Sort order
+            status: Only documents with this status
+            search: Only documents whose filename contains this text (case-insensitive)
+            shard: Only documents stored in this shard
+        
+        Returns:
+            Tuple of (documents on this page, total matching documents)
+        """
+        if sort not in SORTABLE_COLUMNS:
+            raise ValueError(f"Cannot sort by '{sort}', expected one of: {', '.join(SORTABLE_COLUMNS)}")
+        
+        conditions, params = [], []
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        if shard:
+            conditions.append("shard = ?")
+            params.append(shard)
+        if search:
+            escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            conditions.append("filename LIKE ? ESCAPE '\\'")
+            params.append(f"%{escaped}%")
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = "DESC" if descending else "ASC"
+        
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM documents{where}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT * FROM documents{where} ORDER BY {sort} {order}, file_id {order} LIMIT ? OFFSET ?",
+                (*params, limit, offset)
+            ).fetchall()
+        return [dict(row) for row in rows], total
+    
+    def match(
+        self,
+        file_ids: Optional[Sequence[str]] = None,
+        filenames: Optional[Sequence[str]] = None,
+        subjects: Optional[Sequence[str]] = None,
+        uploaded_after: Optional[float] = None,
+        uploaded_before: Optional[float] = None
+    ) -> Dict[str, str]:
+        """
+        Find the documents that meet every given criterion
+        
+        Args:
+            file_ids: Only these documents
+            filenames: Filename glob patterns (* and ?, case-insensitive); any may match
+            subjects: Subjects (case-insensitive); any may match
+            uploaded_after: Only documents uploaded at or after this timestamp
+            uploaded_before: Only documents uploaded at or before this timestamp
+        
+        Returns:
+            Dictionary file_id -> shard of the matching documents
+        """
+        conditions, params = [], []
+        if file_ids is not None:
+            conditions.append(f"file_id IN ({', '.join('?' for _ in file_ids)})")
+            params.extend(file_ids)
+        if filenames:
+            patterns = []
+            for pattern in filenames:
+                escaped = pattern.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                patterns.append(escaped.replace("*", "%").replace("?", "_"))
+            conditions.append("(" + " OR ".join("filename LIKE ? ESCAPE '\\'" for _ in patterns) + ")")
+            params.extend(patterns)
+        if subjects:
+            conditions.append(f"subject COLLATE NOCASE IN ({', '.join('?' for _ in subjects)})")
+            params.extend(subjects)
+        if uploaded_after is not None:
+            conditions.append("uploaded_at >= ?")
+            params.append(uploaded_after)
+        if uploaded_before is not None:
+            conditions.append("uploaded_at <= ?")
+            params.append(uploaded_before)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        
+        with self._lock:
+            rows = self._conn.execute(f"SELECT file_id, shard FROM documents{where}", params).fetchall()
+        return {row["file_id"]: row["shard"] for row in rows}
+    
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+    
+    def backfill(self, upload_dir: str, active_file_ids: Collection[str] = ()) -> int:
+        """
+        Add uploads that predate the catalog
+        
+        Chunk counts are read from the vector store, so documents that were
+        fully ingested before the catalog existed are listed as ready.
+        Documents with a queued or running ingestion job are listed as
+        processing, and the job updates the row when it finishes.
+        
+        Args:
+            upload_dir: Directory holding the stored PDFs
+            active_file_ids: Documents with a queued or running ingestion job
+        
+        Returns:
+            Number of documents added
+        """
+        if not os.path.exists(upload_dir):
+            return 0
+        
+        added = 0
+        for filename in os.listdir(upload_dir):
+            parsed = parse_upload_filename(filename) if filename.endswith('.pdf') else None
+            if parsed is None:
+                continue
+            
+            file_id, original, uploaded_at = parsed
+            if self.get(file_id) is not None:
+                continue
+            
+            file_path = os.path.join(upload_dir, filename)
+            self.add(file_id, original, file_path, os.path.getsize(file_path), uploaded_at=uploaded_at)
+            indexed = find_document(file_id)
+            if indexed is not None:
+                self.update(
+                    file_id,
+                    status=DOCUMENT_READY,
+                    chunk_count=indexed.get("total_chunks", 0),
+                    subject=indexed.get("subject"),
+                    grade=indexed.get("grade"),
+                    shard=indexed.get("shard", DEFAULT_SHARD)
+                )
+            elif file_id in active_file_ids:
+                # Unfinished jobs are re-queued on startup and update the row when they complete
+                self.update(file_id, status=DOCUMENT_PROCESSING)
+            else:
+                self.update(file_id, status=DOCUMENT_FAILED, error="Not indexed")
+            added += 1
+        
+        if added:
+            print(f"🗂️  Added {added} existing documents to the catalog")
+        return added
+
+
+def get_document_catalog() -> DocumentCatalog:
+    """
+    Get or create the document catalog instance (Singleton pattern)
+    
+    Returns:
+        DocumentCatalog instance
+    """
+    global _document_catalog
+    
+    if _document_catalog is None:
+        with _document_catalog_lock:
+            if _document_catalog is None:
+                _document_catalog = DocumentCatalog()
+    
+    return _document_catalog
@@ -0,0 +1,1002 @@
+"""
+In-Process Vector Index
+Memory-mapped embedding matrix with NumPy search, as an alternative to
+ChromaDB's query path
+
+ChromaDB's collection.query serializes every request and copies results into
+nested Python lists. This index keeps all chunk embeddings in one matrix file,
+memory-mapped from disk, with chunk IDs, texts and metadata in a SQLite
+side-table. Small corpora are searched exactly with one vectorized scan;
+above VECTOR_ANN_THRESHOLD vectors an IVF index (k-means coarse quantizer)
+limits the scan to the lists nearest the query; training rewrites the matrix
+in list order so every probed list is read contiguously. Training runs in a
+background thread started by ingestion (or a query) once it is due; the
+k-means fit happens outside the index lock, and queries scan exactly until
+the lists exist.
+
+The scanned matrix can be quantized per collection (see
+COLLECTION_QUANTIZATION in app.db.vector_store):
+- float32: the embeddings as stored by ChromaDB
+- float16: half the size
+- int8: a quarter of the size, one scale per row
+- pq: product quantization, one byte per PQ_SUBVECTORS-th of a vector
+  (32x smaller for 768 dims), searched with asymmetric distance tables
+
+Quantized modes keep the float32 originals in a separate file that is only
+read to train the quantizers and, with VECTOR_RESCORE, to rescore the best
+candidates exactly, so only the compact codes have to stay in RAM. pq
+codebooks are trained in the background, like the IVF lists; until they exist
+queries scan the originals. Quantization only applies to this index, i.e.
+with VECTOR_SEARCH_BACKEND = "numpy", and only to the collections listed in
+COLLECTION_QUANTIZATION. It does not reduce storage: ChromaDB still holds
+the float32 embeddings and its HNSW graph, and the codes are stored in
+addition to the originals.
+
+Distances are squared L2, the metric of the ChromaDB collection, so results
+are interchangeable with the ChromaDB backend. Searches accept the same
+metadata `where` filters as ChromaDB on the fields in FILTER_COLUMNS, which
+are indexed columns of the side-table: selective filters are answered by an
+exact scan of just the matching rows. Each shard's collection has
+its own index, updated on ingest and delete and back-filled from ChromaDB
+on startup.
+"""
+
+import json
+import math
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from app.db.vector_store import DEFAULT_SHARD, get_collection_quantization, shard_collection_name
+
+
+# Index configuration
+VECTOR_SEARCH_BACKEND = "chroma"  # chroma, or numpy for this in-process index
+VECTOR_INDEX_DIR = "data/vector_index"
+VECTOR_ANN_THRESHOLD = 50_000  # Live vectors above which queries use the IVF index
+IVF_PROBES = 12  # Lists scanned per query (recall vs. latency)
+IVF_TRAIN_SAMPLE = 20_000  # Vectors sampled to train the coarse quantizer
+IVF_RETRAIN_GROWTH = 2.0  # Retrain once the index has grown by this factor since training
+IVF_ITERATIONS = 8
+VECTOR_RESCORE = True  # Rescore quantized candidates with the float32 originals
+VECTOR_RESCORE_FACTOR = 16  # Candidates rescored per requested result
+PQ_SUBVECTORS = 96  # Bytes per vector in pq mode (largest divisor of the dimension up to this)
+PQ_TRAIN_MIN = 10_000  # Vectors needed before pq codebooks are trained (originals are scanned until then)
+PQ_TRAIN_SAMPLE = 10_000
+PQ_ITERATIONS = 8
+COMPACT_DELETED_SHARE = 0.25  # Rewrite the matrix when this share of rows is deleted
+FILTER_CACHE_SIZE = 64  # Metadata filters whose matching rows are kept until the next write
+
+QUANTIZATIONS = {"float32": np.float32, "float16": np.float16, "int8": np.int8, "pq": np.uint8}
+# Metadata fields kept as indexed side-table columns, so `where` filters run in SQLite
+FILTER_COLUMNS = ("file_id", "page_start", "page_end")
+_WHERE_OPERATORS = {
+    "$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<=", "$in": "IN", "$nin": "NOT IN"
+}
+
+_PQ_CENTROIDS = 256  # One byte per code
+_SCAN_BLOCK = 8192  # Rows converted to float32 at a time during scans
+_TRAIN_SUFFIX = ".train"  # Files rewritten by background training (compaction uses .tmp)
+
+# Global index instances (one per shard)
+_vector_indexes: Dict[str, "VectorIndex"] = {}
+_vector_indexes_lock = threading.Lock()
+
+
+def vector_index_enabled() -> bool:
+    """Whether queries use the in-process index (and it must be kept in sync)"""
+    return VECTOR_SEARCH_BACKEND == "numpy"
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid (squared L2) of every vector"""
+    centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+    return np.argmin(centroid_norms[None, :] - 2.0 * vectors @ centroids.T, axis=1).astype(np.int32)
+
+
+def _where_sql(where: Dict) -> Tuple[str, list]:
+    """
+    Translate a ChromaDB-style metadata filter into an SQL condition
+    
+    Supports $and/$or and the comparison operators of ChromaDB on the
+    fields in FILTER_COLUMNS.
+    
+    Returns:
+        Tuple of (SQL condition, parameters)
+    """
+    if len(where) != 1:
+        return _where_sql({"$and": [{key: value} for key, value in where.items()]})
+    
+    (key, value), = where.items()
+    if key in ("$and", "$or"):
+        parts = [_where_sql(clause) for clause in value]
+        condition = f" {key[1:].upper()} ".join(f"({sql})" for sql, _ in parts)
+        return condition, [param for _, params in parts for param in params]
+    if key not in FILTER_COLUMNS:
+        raise ValueError(f"Cannot filter the vector index on '{key}', expected one of: {', '.join(FILTER_COLUMNS)}")
+    
+    if not isinstance(value, dict):
+        value = {"$eq": value}
+    (operator, operand), = value.items()
+    if operator not in _WHERE_OPERATORS:
+        raise ValueError(f"Unsupported filter operator '{operator}'")
+    if operator in ("$in", "$nin"):
+        if not operand:
+            return ("0", []) if operator == "$in" else ("1", [])
+        return f"{key} {_WHERE_OPERATORS[operator]} ({', '.join('?' for _ in operand)})", list(operand)
+    return f"{key} {_WHERE_OPERATORS[operator]} ?", [operand]
+
+
+def _pq_encode(vectors: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+    """pq codes of float32 vectors: the nearest codebook entry per sub-vector"""
+    subvectors, _, width = codebooks.shape
+    codes = np.empty((len(vectors), subvectors), dtype=np.uint8)
+    for m in range(subvectors):
+        codes[:, m] = _nearest(vectors[:, m * width:(m + 1) * width], codebooks[m])
+    return codes
+
+
+def _kmeans(sample: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """L2 k-means (Lloyd) seeded with random sample vectors"""
+    centroids = sample[rng.choice(len(sample), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _nearest(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=k)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+class VectorIndex:
+    """
+    Memory-mapped vector matrix with exact and IVF search
+    
+    Args:
+        path: Directory holding the matrix and side-table
+        quantization: Storage of the scanned matrix, one of QUANTIZATIONS
+        ann_threshold: Live vectors above which the IVF index is used
+    """
+    
+    def __init__(
+        self,
+        path: str = VECTOR_INDEX_DIR,
+        quantization: str = "float32",
+        ann_threshold: int = VECTOR_ANN_THRESHOLD
+    ):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(
+                f"Unknown vector quantization '{quantization}', expected one of: {', '.join(QUANTIZATIONS)}"
+            )
+        
+        self.path = path
+        self.quantization = quantization
+        self.ann_threshold = ann_threshold
+        self._lock = threading.Lock()
+        self._centroids_path = os.path.join(path, "centroids.npy")
+        self._codebooks_path = os.path.join(path, "codebooks.npy")
+        
+        self.dim: Optional[int] = None
+        self._arrays: Dict[str, np.ndarray] = {}  # Memory maps of the per-row files
+        self._codebooks: Optional[np.ndarray] = None  # pq only: (subvectors, 256, sub-dim)
+        self._code_columns: Optional[np.ndarray] = None  # pq codes by subvector, rebuilt lazily
+        self._norms = np.zeros(0, dtype=np.float32)  # Squared norms of the original vectors
+        self._live = np.zeros(0, dtype=bool)
+        self._ids: List[Optional[str]] = []  # row -> chunk_id (None once deleted)
+        self._rows: Dict[str, int] = {}
+        self._files: Dict[str, Set[str]] = {}  # file_id -> chunk_ids
+        self._chunk_files: Dict[str, str] = {}  # chunk_id -> file_id
+        
+        # IVF state
+        self._centroids: Optional[np.ndarray] = None
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._lists: Optional[List[List[Tuple[int, int]]]] = None  # Row ranges per list, rebuilt lazily
+        self._trained_size = 0
+        self._training_lock = threading.Lock()  # Serializes training runs (taken before self._lock, never inside it)
+        self._training: Optional[threading.Thread] = None
+        self._version = 0  # Bumped when existing rows move or change, so training can tell its snapshot is stale
+        self._filter_rows: Dict[str, np.ndarray] = {}  # Filter -> matching live rows, cleared on writes
+        self._stats = {
+            "queries": 0, "exact_queries": 0, "ivf_queries": 0, "filtered_queries": 0, "rescored_queries": 0,
+            "compactions": 0
+        }
+        
+        os.makedirs(path, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(path, "index.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                row INTEGER NOT NULL,
+                file_id TEXT,
+                document TEXT,
+                metadata TEXT,
+                page_start INTEGER,
+                page_end INTEGER
+            )
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")}
+        if "page_start" not in columns:
+            # Indexes built before filtering was supported keep pages only in the metadata
+            self._conn.execute("ALTER TABLE chunks ADD COLUMN page_start INTEGER")
+            self._conn.execute("ALTER TABLE chunks ADD COLUMN page_end INTEGER")
+            self._conn.execute(
+                "UPDATE chunks SET page_start = json_extract(metadata, '$.page_start'), "
+                "page_end = json_extract(metadata, '$.page_end')"
+            )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_file ON chunks(file_id)")
+        # Covering indexes: filters are answered without reading the chunk text
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_file_page ON chunks(file_id, page_start, page_end, row)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_page ON chunks(page_start, page_end, row)")
+        self._conn.commit()
+        self._load()
+    
+    def _row_files(self) -> Dict[str, Tuple[str, np.dtype, int]]:
+        """Per-row files of the storage mode: name -> (path, dtype, values per row)"""
+        files = {}
+        if self.quantization != "float32":
+            files["originals"] = (os.path.join(self.path, "originals.float32"), np.float32, self.dim)
+        if self.quantization != "pq":
+            files["codes"] = (os.path.join(self.path, f"vectors.{self.quantization}"), QUANTIZATIONS[self.quantization], self.dim)
+        elif self._codebooks is not None:
+            files["codes"] = (os.path.join(self.path, "codes.pq"), np.uint8, len(self._codebooks))
+        if self.quantization == "int8":
+            files["scales"] = (os.path.join(self.path, "scales.float32"), np.float32, 1)
+        return files
+    
+    def _load(self):
+        """Map the matrix and rebuild the in-memory ID tables"""
+        info = dict(self._conn.execute("SELECT key, value FROM info").fetchall())
+        if info and info.get("quantization") != self.quantization:
+            # Stored in another format; start over and let the startup sync refill it
+            print(f"⚠️  Vector index stored as {info.get('quantization')}, rebuilding as {self.quantization}")
+            self._reset_storage()
+            return
+        
+        if "dim" not in info:
+            self._reset_storage()
+            return
+        
+        self.dim = int(info["dim"])
+        if os.path.exists(self._codebooks_path):
+            self._codebooks = np.load(self._codebooks_path)
+            originals, codes = self._row_files()["originals"], self._row_files()["codes"]
+            rows = os.path.getsize(originals[0]) // (4 * self.dim) if os.path.exists(originals[0]) else 0
+            if not os.path.exists(codes[0]) or os.path.getsize(codes[0]) != rows * codes[2]:
+                # Interrupted while training; train again from the originals
+                self._codebooks = None
+                os.remove(self._codebooks_path)
+        self._remap()
+        rows = len(self._originals_array()) if self._arrays else 0
+        self._ids = [None] * rows
+        self._live = np.zeros(rows, dtype=bool)
+        for chunk_id, row, file_id in self._conn.execute("SELECT chunk_id, row, file_id FROM chunks"):
+            if row < rows:
+                self._ids[row] = chunk_id
+                self._rows[chunk_id] = row
+                self._live[row] = True
+                self._files.setdefault(file_id, set()).add(chunk_id)
+                self._chunk_files[chunk_id] = file_id
+        self._norms = self._squared_norms(0, rows)
+        self._assign = np.full(rows, -1, dtype=np.int32)
+        
+        if os.path.exists(self._centroids_path) and rows:
+            # Rows were written in list order when the index was trained
+            self._centroids = np.load(self._centroids_path)
+            self._trained_size = int(info.get("trained_size", len(self._rows)))
+            for start in range(0, rows, _SCAN_BLOCK):
+                stop = min(start + _SCAN_BLOCK, rows)
+                self._assign[start:stop] = _nearest(self._originals(start, stop), self._centroids)
+    
+    def _reset_storage(self):
+        self._arrays = {}
+        for name in os.listdir(self.path):
+            if not name.startswith("index.sqlite3"):
+                os.remove(os.path.join(self.path, name))
+        self._conn.execute("DELETE FROM info")
+        self._conn.execute("DELETE FROM chunks")
+        self._conn.commit()
+        self._filter_rows.clear()
+    
+    def _remap(self):
+        """(Re)open the memory maps after the files changed size"""
+        self._arrays = {}
+        self._code_columns = None
+        if self.dim is None:
+            return
+        
+        for name, (path, dtype, width) in self._row_files().items():
+            if not os.path.exists(path):
+                continue
+            rows = os.path.getsize(path) // (np.dtype(dtype).itemsize * width)
+            if rows:
+                self._arrays[name] = np.memmap(path, dtype=dtype, mode="r+", shape=(rows, width))
+    
+    def _originals_array(self) -> np.ndarray:
+        return self._arrays["originals" if self.quantization != "float32" else "codes"]
+    
+    def _originals(self, start: int, stop: int) -> np.ndarray:
+        """Original vectors of rows start:stop as float32"""
+        return np.asarray(self._originals_array()[start:stop], dtype=np.float32)
+    
+    def _original_rows(self, rows: np.ndarray) -> np.ndarray:
+        return np.asarray(self._originals_array()[rows], dtype=np.float32)
+    
+    def _squared_norms(self, start: int, stop: int) -> np.ndarray:
+        norms = np.empty(stop - start, dtype=np.float32)
+        for offset in range(start, stop, _SCAN_BLOCK):
+            block = self._originals(offset, min(offset + _SCAN_BLOCK, stop))
+            norms[offset - start:offset - start + len(block)] = np.einsum("ij,ij->i", block, block)
+        return norms
+    
+    def _encode(self, vectors: np.ndarray) -> Dict[str, np.ndarray]:
+        """Contents of every per-row file for float32 vectors"""
+        encoded = {}
+        if self.quantization != "float32":
+            encoded["originals"] = vectors
+        if self.quantization == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            encoded["codes"] = np.round(vectors / scales[:, None]).astype(np.int8)
+            encoded["scales"] = scales.astype(np.float32)[:, None]
+        elif self.quantization == "pq":
+            if self._codebooks is not None:
+                encoded["codes"] = _pq_encode(vectors, self._codebooks)
+        else:
+            encoded["codes"] = vectors.astype(QUANTIZATIONS[self.quantization])
+        return encoded
+    
+    def _needs_codebooks(self) -> bool:
+        return self.quantization == "pq" and self._codebooks is None and len(self._ids) >= PQ_TRAIN_MIN
+    
+    def _train_codebooks(self):
+        """
+        Fit the pq codebooks on a sample of the originals and encode every row
+        
+        The fit and the encoding run without the index lock, with further
+        passes for rows appended meanwhile; the lock is held to encode the
+        last few rows and swap the codes in (or to encode every row, if rows
+        moved or changed in the meantime).
+        """
+        with self._lock:
+            if not self._needs_codebooks():
+                return
+            rows, dim, version = len(self._ids), self.dim, self._version
+            rng = np.random.default_rng(0)
+            sample = self._original_rows(np.sort(rng.choice(rows, size=min(PQ_TRAIN_SAMPLE, rows), replace=False)))
+            originals = self._originals_array()
+        
+        subvectors = max(m for m in range(1, PQ_SUBVECTORS + 1) if dim % m == 0)
+        width = dim // subvectors
+        codebooks = np.stack([
+            _kmeans(np.ascontiguousarray(sample[:, m * width:(m + 1) * width]), _PQ_CENTROIDS, PQ_ITERATIONS, rng)
+            for m in range(subvectors)
+        ])
+        
+        path = os.path.join(self.path, "codes.pq")
+        encoded = 0
+        with open(path + _TRAIN_SUFFIX, "wb") as f:
+            while True:
+                for start in range(encoded, rows, _SCAN_BLOCK):
+                    block = np.asarray(originals[start:min(start + _SCAN_BLOCK, rows)], dtype=np.float32)
+                    f.write(_pq_encode(block, codebooks).tobytes())
+                encoded = rows
+                with self._lock:
+                    if self._version != version or self.dim != dim or len(self._ids) - encoded <= _SCAN_BLOCK:
+                        break
+                    rows, originals = len(self._ids), self._originals_array()
+        del originals
+        
+        with self._lock:
+            if self.dim != dim or self._codebooks is not None:
+                os.remove(path + _TRAIN_SUFFIX)  # Cleared while training
+                return
+            stale = self._version != version
+            with open(path + _TRAIN_SUFFIX, "r+b" if not stale else "wb") as f:
+                f.seek(0 if stale else encoded * subvectors)
+                for start in range(0 if stale else encoded, len(self._ids), _SCAN_BLOCK):
+                    f.write(_pq_encode(self._originals(start, min(start + _SCAN_BLOCK, len(self._ids))), codebooks).tobytes())
+            
+            # Codes first: codebooks without a complete codes file are discarded on load
+            self._arrays = {}
+            os.replace(path + _TRAIN_SUFFIX, path)
+            with open(self._codebooks_path + _TRAIN_SUFFIX, "wb") as f:
+                np.save(f, codebooks)
+            os.replace(self._codebooks_path + _TRAIN_SUFFIX, self._codebooks_path)
+            self._codebooks = codebooks
+            self._remap()
+            self._version += 1
+            print(f"🧩 Trained pq codebooks: {subvectors} bytes per vector over {len(self._ids)} vectors")
+    
+    def _pq_columns(self) -> np.ndarray:
+        """
+        pq codes as (subvectors, rows), so each table lookup reads one
+        contiguous column (about 2.5x faster than gathering row-major codes)
+        """
+        if self._code_columns is None:
+            self._code_columns = np.ascontiguousarray(self._arrays["codes"].T)
+        return self._code_columns
+    
+    def _adc_table(self, query: np.ndarray) -> np.ndarray:
+        """
+        Asymmetric distance table of a query: squared L2 between each query
+        sub-vector and every codebook entry, shape (subvectors, 256)
+        """
+        subvectors, _, width = self._codebooks.shape
+        parts = query.reshape(subvectors, width)
+        table = (
+            np.einsum("mcd,mcd->mc", self._codebooks, self._codebooks)
+            - 2.0 * np.einsum("mcd,md->mc", self._codebooks, parts)
+            + np.einsum("md,md->m", parts, parts)[:, None]
+        )
+        return table.astype(np.float32)
+    
+    def _scan(self, start: int, stop: int, query: np.ndarray, table: Optional[np.ndarray]) -> np.ndarray:
+        """Approximate squared L2 distances between the query and rows start:stop"""
+        if table is not None:
+            distances = np.zeros(stop - start, dtype=np.float32)
+            for subtable, column in zip(table, self._pq_columns()[:, start:stop]):
+                distances += subtable.take(column)
+            return distances
+        
+        if self.quantization == "pq":
+            products = self._originals(start, stop) @ query  # Codebooks not trained yet
+        else:
+            products = np.asarray(self._arrays["codes"][start:stop], dtype=np.float32) @ query
+            if "scales" in self._arrays:
+                products *= self._arrays["scales"][start:stop, 0]
+        return self._norms[start:stop] - 2.0 * products + float(query @ query)
+    
+    def _scan_rows(self, rows: np.ndarray, query: np.ndarray, table: Optional[np.ndarray]) -> np.ndarray:
+        """Approximate squared L2 distances between the query and the given (sorted) rows"""
+        distances = np.empty(len(rows), dtype=np.float32)
+        for offset in range(0, len(rows), _SCAN_BLOCK):
+            block = rows[offset:offset + _SCAN_BLOCK]
+            if table is not None:
+                block_distances = np.zeros(len(block), dtype=np.float32)
+                for subtable, column in zip(table, self._pq_columns()[:, block]):
+                    block_distances += subtable.take(column)
+                distances[offset:offset + len(block)] = block_distances
+                continue
+            
+            if self.quantization == "pq":
+                products = self._original_rows(block) @ query
+            else:
+                products = np.asarray(self._arrays["codes"][block], dtype=np.float32) @ query
+                if "scales" in self._arrays:
+                    products *= self._arrays["scales"][block, 0]
+            distances[offset:offset + len(block)] = self._norms[block] - 2.0 * products + float(query @ query)
+        return distances
+    
+    def _where_rows_locked(self, where: Dict) -> np.ndarray:
+        """Live rows whose chunk matches a metadata filter, in file order"""
+        key = json.dumps(where, sort_keys=True)
+        rows = self._filter_rows.get(key)
+        if rows is not None:
+            return rows
+        
+        condition, params = _where_sql(where)
+        rows = np.fromiter(
+            (row for (row,) in self._conn.execute(f"SELECT row FROM chunks WHERE {condition}", params)),
+            dtype=np.int64
+        )
+        rows = rows[rows < len(self._ids)]
+        rows = np.sort(rows[self._live[rows]])
+        
+        if len(self._filter_rows) >= FILTER_CACHE_SIZE:
+            del self._filter_rows[next(iter(self._filter_rows))]
+        self._filter_rows[key] = rows
+        return rows
+    
+    def upsert(
+        self,
+        ids: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        documents: Sequence[str],
+        metadatas: Sequence[Optional[Dict]]
+    ):
+        """
+        Add or replace chunks (same arguments as collection.upsert)
+        
+        Existing chunks are overwritten in place; new ones are appended to
+        the matrix files.
+        """
+        if not ids:
+            return
+        
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)",
+                    [("dim", str(self.dim)), ("quantization", self.quantization)]
+                )
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the index ({self.dim})")
+            
+            encoded = self._encode(vectors)
+            existing = [(i, self._rows[chunk_id]) for i, chunk_id in enumerate(ids) if chunk_id in self._rows]
+            if existing:
+                positions, rows = zip(*existing)
+                for name, data in encoded.items():
+                    self._arrays[name][list(rows)] = data[list(positions)]
+                    self._arrays[name].flush()
+                self._code_columns = None
+                self._version += 1
+            
+            new, seen = [], set()
+            for i, chunk_id in enumerate(ids):
+                if chunk_id not in self._rows and chunk_id not in seen:
+                    seen.add(chunk_id)
+                    new.append(i)
+            first_row = len(self._ids)
+            if new:
+                files = self._row_files()
+                self._arrays = {}
+                for name, data in encoded.items():
+                    with open(files[name][0], "ab") as f:
+                        f.write(np.ascontiguousarray(data[new]).tobytes())
+                self._remap()
+                
+                for offset, i in enumerate(new):
+                    self._ids.append(ids[i])
+                    self._rows[ids[i]] = first_row + offset
+                self._live = np.concatenate([self._live, np.ones(len(new), dtype=bool)])
+                self._norms = np.concatenate([self._norms, np.zeros(len(new), dtype=np.float32)])
+                self._assign = np.concatenate([self._assign, np.full(len(new), -1, dtype=np.int32)])
+            
+            rows = np.array([self._rows[chunk_id] for chunk_id in ids], dtype=np.int64)
+            self._norms[rows] = np.einsum("ij,ij->i", vectors, vectors)
+            if self._centroids is not None:
+                self._assign[rows] = _nearest(vectors, self._centroids)
+                self._lists = None
+            
+            chunk_rows = []
+            for chunk_id, row, document, metadata in zip(ids, rows.tolist(), documents, metadatas):
+                file_id = (metadata or {}).get("file_id")
+                previous = self._chunk_files.get(chunk_id)
+                if previous is not None and previous != file_id:
+                    self._files[previous].discard(chunk_id)
+                self._files.setdefault(file_id, set()).add(chunk_id)
+                self._chunk_files[chunk_id] = file_id
+                chunk_rows.append((
+                    chunk_id, row, file_id, document, json.dumps(metadata or {}, ensure_ascii=False),
+                    (metadata or {}).get("page_start"), (metadata or {}).get("page_end")
+                ))
+            self._conn.executemany(
+                """
+                INSERT OR REPLACE INTO chunks (chunk_id, row, file_id, document, metadata, page_start, page_end)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                chunk_rows
+            )
+            self._conn.commit()
+            self._filter_rows.clear()
+            self._start_training_locked()
+    
+    def _remove_locked(self, chunk_ids: Sequence[str]) -> int:
+        removed = 0
+        for chunk_id in chunk_ids:
+            row = self._rows.pop(chunk_id, None)
+            if row is None:
+                continue
+            self._ids[row] = None
+            self._live[row] = False
+            removed += 1
+            
+            file_id = self._chunk_files.pop(chunk_id)
+            file_chunks = self._files.get(file_id)
+            if file_chunks is not None:
+                file_chunks.discard(chunk_id)
+                if not file_chunks:
+                    del self._files[file_id]
+        
+        self._conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(c,) for c in chunk_ids])
+        self._conn.commit()
+        
+        if len(self._ids) > 1000 and 1 - len(self._rows) / len(self._ids) > COMPACT_DELETED_SHARE:
+            self._compact(np.flatnonzero(self._live))
+            self._stats["compactions"] += 1
+        self._filter_rows.clear()
+        return removed
+    
+    def remove_chunks(self, chunk_ids: Sequence[str]) -> int:
+        """Remove chunks from the index"""
+        with self._lock:
+            return self._remove_locked(list(chunk_ids))
+    
+    def remove_documents(self, file_ids: Sequence[str]) -> int:
+        """
+        Remove every chunk of several documents
+        
+        Args:
+            file_ids: Unique identifiers of the documents
+        
+        Returns:
+            Number of chunks removed
+        """
+        with self._lock:
+            chunk_ids = [chunk_id for file_id in file_ids for chunk_id in self._files.get(file_id, ())]
+            return self._remove_locked(chunk_ids)
+    
+    def chunk_ids(self) -> Set[str]:
+        """IDs of every indexed chunk"""
+        with self._lock:
+            return set(self._rows)
+    
+    def document_chunk_ids(self, file_id: str) -> Set[str]:
+        """IDs of the indexed chunks of a document"""
+        with self._lock:
+            return set(self._files.get(file_id, ()))
+    
+    def _write_rows(self, arrays: Dict[str, np.ndarray], rows: np.ndarray, suffix: str = ".tmp", append: bool = False):
+        """Write the given rows of each per-row file, in that order, to a rewrite of the file (path + suffix)"""
+        files = self._row_files()
+        for name, array in arrays.items():
+            with open(files[name][0] + suffix, "ab" if append else "wb") as f:
+                for start in range(0, len(rows), _SCAN_BLOCK):
+                    f.write(np.ascontiguousarray(array[rows[start:start + _SCAN_BLOCK]]).tobytes())
+    
+    def _discard_rewrites(self, suffix: str):
+        for path, _, _ in self._row_files().values():
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    
+    def _swap_rows(self, order: np.ndarray, suffix: str = ".tmp"):
+        """Replace the per-row files by their rewrites, which hold the old rows `order` (lock held)"""
+        files = self._row_files()
+        self._arrays = {}
+        for name in files:
+            if os.path.exists(files[name][0] + suffix):
+                os.replace(files[name][0] + suffix, files[name][0])
+        self._remap()
+        
+        self._ids = [self._ids[row] for row in order]
+        self._rows = {chunk_id: row for row, chunk_id in enumerate(self._ids) if chunk_id is not None}
+        self._norms = self._norms[order]
+        self._assign = self._assign[order]
+        self._live = self._live[order]
+        self._lists = None
+        self._version += 1
+        self._filter_rows.clear()
+        self._conn.executemany("UPDATE chunks SET row = ? WHERE chunk_id = ?", [(r, c) for c, r in self._rows.items()])
+        self._conn.commit()
+    
+    def _compact(self, live_rows: np.ndarray):
+        """Rewrite the matrix files with only the given live rows, in that order (lock held)"""
+        self._write_rows(self._arrays, live_rows)
+        self._swap_rows(live_rows)
+    
+    def clear(self):
+        """Remove every vector"""
+        with self._lock:
+            self._reset_storage()
+            self.dim = None
+            self._codebooks = None
+            self._ids, self._rows, self._files, self._chunk_files = [], {}, {}, {}
+            self._live = np.zeros(0, dtype=bool)
+            self._norms = np.zeros(0, dtype=np.float32)
+            self._assign = np.zeros(0, dtype=np.int32)
+            self._centroids, self._lists, self._trained_size = None, None, 0
+            self._version += 1
+    
+    def _train_ivf(self):
+        """
+        Fit the coarse quantizer on a sample and assign every row to a list
+        
+        The fit, the assignment and the rewrite of the matrix in list order
+        run without the index lock, with further passes for rows appended
+        meanwhile. The lock is held to append the last few rows and swap the
+        files in (or to redo everything, if rows moved or changed in the
+        meantime).
+        """
+        with self._lock:
+            if not self._needs_training():
+                return
+            live_rows = np.flatnonzero(self._live)
+            rows, dim, version = len(self._ids), self.dim, self._version
+            rng = np.random.default_rng(0)
+            sample = self._original_rows(np.sort(rng.choice(live_rows, size=min(IVF_TRAIN_SAMPLE, len(live_rows)), replace=False)))
+            arrays, originals = dict(self._arrays), self._originals_array()
+        
+        nlist = max(16, int(math.sqrt(len(live_rows))))
+        centroids = _kmeans(sample, nlist, IVF_ITERATIONS, rng)
+        assign = np.empty(rows, dtype=np.int32)
+        for start in range(0, rows, _SCAN_BLOCK):
+            stop = min(start + _SCAN_BLOCK, rows)
+            assign[start:stop] = _nearest(np.asarray(originals[start:stop], dtype=np.float32), centroids)
+        order = live_rows[np.argsort(assign[live_rows], kind="stable")]
+        self._write_rows(arrays, order, _TRAIN_SUFFIX)
+        
+        # Rows appended meanwhile go after the lists, in further passes while many are left
+        while True:
+            with self._lock:
+                if self._version != version or self.dim != dim or len(self._ids) - rows <= _SCAN_BLOCK:
+                    break
+                appended = np.arange(rows, len(self._ids))
+                arrays, originals = dict(self._arrays), self._originals_array()
+            assign = np.concatenate([assign, _nearest(np.asarray(originals[appended], dtype=np.float32), centroids)])
+            self._write_rows(arrays, appended, _TRAIN_SUFFIX, append=True)
+            order = np.concatenate([order, appended])
+            rows = len(assign)
+        del arrays, originals
+        
+        with self._lock:
+            if self.dim != dim:
+                self._discard_rewrites(_TRAIN_SUFFIX)  # Cleared while training
+                return
+            
+            if self._version != version:
+                for start in range(0, len(self._ids), _SCAN_BLOCK):
+                    stop = min(start + _SCAN_BLOCK, len(self._ids))
+                    self._assign[start:stop] = _nearest(self._originals(start, stop), centroids)
+                live_rows = np.flatnonzero(self._live)
+                order = live_rows[np.argsort(self._assign[live_rows], kind="stable")]
+                self._write_rows(self._arrays, order, _TRAIN_SUFFIX)
+            else:
+                # Rows deleted meanwhile stay in the rewrite, masked
+                self._assign[:rows] = assign
+                appended = np.arange(rows, len(self._ids))
+                if len(appended):
+                    self._assign[appended] = _nearest(self._original_rows(appended), centroids)
+                    self._write_rows(self._arrays, appended, _TRAIN_SUFFIX, append=True)
+                    order = np.concatenate([order, appended])
+            
+            self._centroids = centroids
+            self._swap_rows(order, _TRAIN_SUFFIX)
+            self._trained_size = len(self._rows)
+            
+            np.save(self._centroids_path, self._centroids)
+            self._conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('trained_size', ?)", (str(self._trained_size),))
+            self._conn.commit()
+            print(f"🧭 Trained IVF vector index: {nlist} lists over {self._trained_size} vectors")
+    
+    def _needs_training(self) -> bool:
+        live = len(self._rows)
+        return live > self.ann_threshold and (
+            self._centroids is None or live > self._trained_size * IVF_RETRAIN_GROWTH
+        )
+    
+    def _start_training_locked(self):
+        """Train in a background thread if the pq codebooks or the IVF index are due (and no run is active)"""
+        if not (self._needs_codebooks() or self._needs_training()):
+            return
+        if self._training is not None and self._training.is_alive():
+            return
+        self._training = threading.Thread(target=self.train, name=f"train-{os.path.basename(self.path)}", daemon=True)
+        self._training.start()
+    
+    def train(self):
+        """
+        Train the pq codebooks and the IVF index if they are due
+        
+        Called in a background thread after ingestion and by queries that
+        find training due; call it directly to train synchronously (startup
+        sync, benchmarks). Until it finishes, pq indexes scan the originals
+        and large indexes are searched exactly (or with the previous lists).
+        """
+        with self._training_lock:
+            self._train_codebooks()
+            self._train_ivf()
+    
+    def _ivf_lists(self) -> List[List[Tuple[int, int]]]:
+        """
+        Contiguous row ranges of every list
+        
+        A list is one range after training; rows appended or overwritten
+        since then add short ranges. Deleted rows stay in their range and are
+        masked during the scan.
+        """
+        if self._lists is None:
+            rows = np.flatnonzero(self._assign >= 0)
+            order = rows[np.argsort(self._assign[rows], kind="stable")]
+            bounds = np.searchsorted(self._assign[order], np.arange(len(self._centroids) + 1))
+            self._lists = []
+            for i in range(len(self._centroids)):
+                members = order[bounds[i]:bounds[i + 1]]
+                breaks = np.flatnonzero(np.diff(members) != 1) + 1
+                self._lists.append([
+                    (int(run[0]), int(run[-1]) + 1) for run in np.split(members, breaks) if len(run)
+                ])
+        return self._lists
+    
+    def search(
+        self,
+        query_embedding: Sequence[float],
+        k: int,
+        where: Optional[Dict] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Find the nearest chunks to a query embedding
+        
+        Args:
+            query_embedding: Query vector
+            k: Number of results
+            where: Only consider chunks matching this metadata filter
+                (ChromaDB syntax, on the fields in FILTER_COLUMNS)
+        
+        Returns:
+            List of (chunk_id, squared L2 distance), nearest first
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        with self._lock:
+            live = len(self._rows)
+            if not live or k <= 0:
+                return []
+            self._stats["queries"] += 1
+            
+            allowed = self._where_rows_locked(where) if where else None
+            if allowed is not None and not len(allowed):
+                return []
+            
+            self._start_training_locked()
+            table = self._adc_table(query) if self._codebooks is not None else None
+            if allowed is not None and len(allowed) <= self.ann_threshold:
+                # Selective filter: scan only the matching rows, exactly
+                self._stats["filtered_queries"] += 1
+                rows = allowed
+                distances = self._scan_rows(rows, query, table)
+                ranges = None
+            elif live > self.ann_threshold and self._centroids is not None:
+                self._stats["ivf_queries"] += 1
+                centroid_distances = np.einsum("ij,ij->i", self._centroids, self._centroids) - 2.0 * self._centroids @ query
+                probes = np.argsort(centroid_distances)[:IVF_PROBES]
+                lists = self._ivf_lists()
+                ranges = [run for i in probes for run in lists[i]]
+                if not ranges:
+                    return []
+            else:
+                self._stats["exact_queries"] += 1
+                ranges = [(start, min(start + _SCAN_BLOCK, len(self._ids))) for start in range(0, len(self._ids), _SCAN_BLOCK)]
+            
+            if ranges is not None:
+                rows = np.concatenate([np.arange(start, stop) for start, stop in ranges])
+                distances = np.concatenate([self._scan(start, stop, query, table) for start, stop in ranges])
+                distances[~self._live[rows]] = np.inf
+                if allowed is not None:
+                    mask = np.zeros(len(self._ids), dtype=bool)
+                    mask[allowed] = True
+                    distances[~mask[rows]] = np.inf
+            
+            rescore = VECTOR_RESCORE and self.quantization != "float32"
+            candidates = min(k * VECTOR_RESCORE_FACTOR if rescore else k, int(np.isfinite(distances).sum()))
+            if candidates == 0:
+                return []
+            top = np.argpartition(distances, candidates - 1)[:candidates] if candidates < len(distances) else np.arange(len(distances))
+            
+            if rescore:
+                self._stats["rescored_queries"] += 1
+                top = top[np.argsort(rows[top])]  # Read the originals in file order
+                difference = self._original_rows(rows[top]) - query
+                distances[top] = np.einsum("ij,ij->i", difference, difference)
+            
+            top = top[np.argsort(distances[top])][:k]
+            return [(self._ids[rows[i]], max(float(distances[i]), 0.0)) for i in top]
+    
+    def get(self, chunk_ids: Sequence[str], include_embeddings: bool = False) -> Dict[str, Dict]:
+        """
+        Fetch stored chunks by ID
+        
+        Args:
+            chunk_ids: Chunk IDs
+            include_embeddings: Also return each chunk's (original) embedding
+        
+        Returns:
+            Dictionary chunk_id -> {document, metadata[, embedding]}; unknown IDs are skipped
+        """
+        if not chunk_ids:
+            return {}
+        
+        with self._lock:
+            placeholders = ", ".join("?" for _ in chunk_ids)
+            rows = self._conn.execute(
+                f"SELECT chunk_id, row, document, metadata FROM chunks WHERE chunk_id IN ({placeholders})",
+                list(chunk_ids)
+            ).fetchall()
+            
+            chunks = {}
+            for chunk_id, row, document, metadata in rows:
+                chunk = {"document": document, "metadata": json.loads(metadata)}
+                if include_embeddings:
+                    chunk["embedding"] = self._originals(row, row + 1)[0].tolist()
+                chunks[chunk_id] = chunk
+            return chunks
+    
+    def filter_ids(self, chunk_ids: Sequence[str], where: Dict) -> Set[str]:
+        """
+        Select the chunks that match a metadata filter
+        
+        Args:
+            chunk_ids: Chunk IDs
+            where: Metadata filter (ChromaDB syntax, on the fields in FILTER_COLUMNS)
+        
+        Returns:
+            IDs of the matching chunks
+        """
+        if not chunk_ids:
+            return set()
+        
+        condition, params = _where_sql(where)
+        placeholders = ", ".join("?" for _ in chunk_ids)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT chunk_id FROM chunks WHERE chunk_id IN ({placeholders}) AND ({condition})",
+                [*chunk_ids, *params]
+            ).fetchall()
+        return {chunk_id for (chunk_id,) in rows}
+    
+    def count(self) -> int:
+        with self._lock:
+            return len(self._rows)
+    
+    def stats(self) -> Dict:
+        """
+        Get index statistics
+        
+        Returns:
+            Dictionary with vector counts, storage mode and sizes, and query counters
+        """
+        with self._lock:
+            sizes = {name: array.nbytes for name, array in self._arrays.items()}
+            scanned = sizes.get("codes", sizes.get("originals", 0)) + sizes.get("scales", 0)
+            return {
+                **self._stats,
+                "backend": VECTOR_SEARCH_BACKEND,
+                "vectors": len(self._rows),
+                "rows": len(self._ids),
+                "dim": self.dim,
+                "quantization": self.quantization,
+                "pq_trained": self._codebooks is not None,
+                "training": self._training is not None and self._training.is_alive(),
+                "scanned_mb": round(scanned / (1024 * 1024), 2),
+                "originals_mb": round(sizes.get("originals", sizes.get("codes", 0)) / (1024 * 1024), 2),
+                "ivf_lists": len(self._centroids) if self._centroids is not None else 0
+            }
+
+
+def vector_index_exists(shard: str = DEFAULT_SHARD) -> bool:
+    """Whether the shard has an index on disk (without opening or creating it)"""
+    return os.path.isdir(os.path.join(VECTOR_INDEX_DIR, shard_collection_name(shard)))
+
+
+def get_vector_index(shard: str = DEFAULT_SHARD) -> VectorIndex:
+    """
+    Get or create the vector index of a shard (Singleton pattern)
+    
+    Shard indexes are opened on first use, so shards that are never queried
+    keep nothing in memory.
+    
+    Args:
+        shard: Shard name (see app.db.vector_store.shard_name)
+    
+    Returns:
+        VectorIndex of the shard's collection, stored as configured for it
+        in COLLECTION_QUANTIZATION
+    """
+    with _vector_indexes_lock:
+        vector_index = _vector_indexes.get(shard)
+        
+        if vector_index is None:
+            collection_name = shard_collection_name(shard)
+            vector_index = VectorIndex(
+                path=os.path.join(VECTOR_INDEX_DIR, collection_name),
+                quantization=get_collection_quantization(collection_name)
+            )
+            _vector_indexes[shard] = vector_index
+    
+    return vector_index
+
+
+def loaded_vector_indexes() -> Dict[str, VectorIndex]:
+    """Shard indexes opened so far, by shard name"""
+    with _vector_indexes_lock:
+        return dict(_vector_indexes)
@@ -1,76 +1,191 @@
 """
 ChromaDB Vector Store
 Manages document embeddings and similarity search
+
+Documents are sharded by subject and grade: each shard is its own
+collection, so a query scoped to one subject only searches that subject's
+chunks. Documents uploaded without a subject or grade go to the default
+shard, which is the original COLLECTION_NAME collection. Shard collections
+are opened on first use, and ChromaDB unloads the HNSW indexes of the least
+recently used shards once CHROMA_SHARD_CACHE_MB is exceeded.
 """
 
 import chromadb
 from chromadb.config import Settings
+import hashlib
 import os
-from typing import List, Dict, Optional
+import re
+import threading
+from typing import List, Dict, Optional, Sequence, Set
 
 
 # ChromaDB configuration
 CHROMA_DB_DIR = "data/chroma_db"
 COLLECTION_NAME = "qnix_documents"
+CHROMA_SHARD_CACHE_MB = 4096  # Shard HNSW indexes kept in memory (0 keeps every loaded shard)
+
+# Sharding configuration
+DEFAULT_SHARD = "general"  # Shard of documents without a subject or grade
+MAX_SHARD_NAME_LENGTH = 48  # Collection names are limited to 63 characters
+EMBEDDINGS_NORMALIZED = "embeddings_normalized"  # Collection metadata key: every stored vector is unit length
+
+# Storage of each collection's embeddings in the in-process vector index
+# (app.db.vector_index): float32, float16, int8 or pq. Only used when
+# VECTOR_SEARCH_BACKEND is "numpy"; ChromaDB always stores float32. Shard
+# collections (qnix_documents_<shard>) not listed here use float32
+COLLECTION_QUANTIZATION = {
+    COLLECTION_NAME: "float32"
+}
 
 # Ensure directory exists
 os.makedirs(CHROMA_DB_DIR, exist_ok=True)
 
-# Global vector store instance
-_vector_store = None
+_SHARD_SEPARATORS = re.compile(r"[^a-z0-9]+")
 
+# Global client and collection instances (one per shard)
+_client = None
+_vector_stores: Dict[str, object] = {}
+_shard_names: Optional[Set[str]] = None  # Listed from the client once, then kept up to date
+_vector_stores_lock = threading.RLock()  # Retrieval opens shards from worker threads
 
-def get_vector_store():
+
+def shard_name(subject: Optional[str] = None, grade: Optional[str] = None) -> str:
     """
-    Get or create ChromaDB vector store instance (Singleton pattern)
+    Name of the shard documents of a subject and grade are stored in
+    
+    Args:
+        subject: Subject, e.g. "Chemistry"
+        grade: Grade or exam level, e.g. "A/L"
     
     Returns:
-        ChromaDB collection instance
+        Lowercase slug of grade and subject ("a-l-chemistry"), a hash-based
+        name when neither contains Latin letters or digits, or DEFAULT_SHARD
+        when both are empty
     """
-    global _vector_store
+    label = " ".join(part.strip() for part in (grade, subject) if part and part.strip())
+    if not label:
+        return DEFAULT_SHARD
     
-    if _vector_store is None:
-        print(f"🔧 Initializing ChromaDB at {CHROMA_DB_DIR}")
-        
-        # Initialize ChromaDB client with persistent storage
-        client = chromadb.PersistentClient(
-            path=CHROMA_DB_DIR,
-            settings=Settings(
-                anonymized_telemetry=False,
-                allow_reset=True
+    slug = _SHARD_SEPARATORS.sub("-", label.casefold()).strip("-")[:MAX_SHARD_NAME_LENGTH].strip("-")
+    return slug or "shard-" + hashlib.sha256(label.encode("utf-8")).hexdigest()[:12]
+
+
+def shard_collection_name(shard: str = DEFAULT_SHARD) -> str:
+    """Name of the ChromaDB collection holding a shard"""
+    return COLLECTION_NAME if shard == DEFAULT_SHARD else f"{COLLECTION_NAME}_{shard}"
+
+
+def _get_client():
+    """Get or create the persistent ChromaDB client (Singleton pattern)"""
+    global _client
+    
+    with _vector_stores_lock:
+        if _client is None:
+            print(f"🔧 Initializing ChromaDB at {CHROMA_DB_DIR}")
+            
+            # Initialize ChromaDB client with persistent storage; shards beyond the
+            # memory limit are unloaded least recently used first
+            _client = chromadb.PersistentClient(
+                path=CHROMA_DB_DIR,
+                settings=Settings(
+                    anonymized_telemetry=False,
+                    allow_reset=True,
+                    chroma_segment_cache_policy="LRU" if CHROMA_SHARD_CACHE_MB else None,
+                    chroma_memory_limit_bytes=CHROMA_SHARD_CACHE_MB * 1024 * 1024
+                )
             )
-        )
+    
+    return _client
+
+
+def get_vector_store(shard: str = DEFAULT_SHARD):
+    """
+    Get or create the ChromaDB collection of a shard (Singleton pattern)
+    
+    Args:
+        shard: Shard name (see shard_name)
+    
+    Returns:
+        ChromaDB collection instance
+    """
+    with _vector_stores_lock:
+        vector_store = _vector_stores.get(shard)
         
-        # Get or create collection
-        try:
-            _vector_store = client.get_collection(name=COLLECTION_NAME)
-            print(f"   Loaded existing collection: {COLLECTION_NAME}")
-        except:
-            _vector_store = client.create_collection(
-                name=COLLECTION_NAME,
-                metadata={"description": "Qnix AI document embeddings"}
-            )
-            print(f"   Created new collection: {COLLECTION_NAME}")
+        if vector_store is None:
+            client = _get_client()
+            collection_name = shard_collection_name(shard)
+            
+            # Get or create collection
+            try:
+                vector_store = client.get_collection(name=collection_name)
+                print(f"   Loaded existing collection: {collection_name}")
+            except:
+                vector_store = client.create_collection(
+                    name=collection_name,
+                    metadata={"description": "Qnix AI document embeddings", "shard": shard, EMBEDDINGS_NORMALIZED: True}
+                )
+                print(f"   Created new collection: {collection_name}")
+            _vector_stores[shard] = vector_store
+            if _shard_names is not None:
+                _shard_names.add(shard)
     
-    return _vector_store
+    return vector_store
+
+
+def list_shards() -> List[str]:
+    """
+    List the shards that hold (or have held) documents
+    
+    Returns:
+        Shard names, sorted, always including DEFAULT_SHARD
+    """
+    global _shard_names
+    
+    with _vector_stores_lock:
+        if _shard_names is None:
+            shards = {DEFAULT_SHARD}
+            prefix = f"{COLLECTION_NAME}_"
+            for collection in _get_client().list_collections():
+                name = getattr(collection, "name", collection)
+                if name.startswith(prefix):
+                    shards.add(name[len(prefix):])
+            _shard_names = shards
+        
+        return sorted(_shard_names)
+
+
+def get_collection_quantization(collection_name: str = COLLECTION_NAME) -> str:
+    """
+    Get the quantization of a collection's embeddings in the in-process vector index
+    
+    Args:
+        collection_name: Name of the collection
+    
+    Returns:
+        One of float32, float16, int8, pq (float32 if not configured)
+    """
+    return COLLECTION_QUANTIZATION.get(collection_name, "float32")
 
 
 def reset_vector_store():
     """
     Reset the vector store (delete all data)
-    WARNING: This will delete all indexed documents
+    WARNING: This will delete all indexed documents in every shard
     """
-    global _vector_store
+    global _shard_names
     
-    client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
-    
-    try:
-        client.delete_collection(name=COLLECTION_NAME)
-        print(f"🗑️  Deleted collection: {COLLECTION_NAME}")
-    except:
-        pass
+    client = _get_client()
     
-    _vector_store = None
+    with _vector_stores_lock:
+        for shard in list_shards():
+            try:
+                client.delete_collection(name=shard_collection_name(shard))
+                print(f"🗑️  Deleted collection: {shard_collection_name(shard)}")
+            except:
+                pass
+        
+        _vector_stores.clear()
+        _shard_names = None
     print("✅ Vector store reset complete")
 
 
@@ -79,16 +194,15 @@ def get_collection_stats() -> Dict:
     Get statistics about the vector store
     
     Returns:
-        Dictionary with collection statistics
+        Dictionary with collection statistics, including chunks per shard
     """
-    vector_store = get_vector_store()
-    
     try:
-        count = vector_store.count()
+        shards = {shard: get_vector_store(shard).count() for shard in list_shards()}
         
         return {
             "collection_name": COLLECTION_NAME,
-            "total_chunks": count,
+            "total_chunks": sum(shards.values()),
+            "shards": shards,
             "storage_path": CHROMA_DB_DIR
         }
     except Exception as e:
@@ -97,33 +211,112 @@ def get_collection_stats() -> Dict:
         }
 
 
-def delete_document_chunks(file_id: str) -> int:
+def find_document(file_id: str, shard: Optional[str] = None) -> Optional[Dict]:
     """
-    Delete all chunks belonging to a specific document
+    Look up an indexed document by its file_id
+    
+    Uses a metadata-filtered get limited to one chunk, so the cost does not
+    depend on how many chunks the document has. Only fully ingested documents
+    match: total_chunks is written once every chunk has been stored.
     
     Args:
         file_id: Unique identifier of the document
+        shard: Shard the document is stored in (every shard is searched if None)
         
     Returns:
-        Number of chunks deleted
+        Metadata of one of the document's chunks, or None if not indexed
     """
-    vector_store = get_vector_store()
-    
-    try:
-        # Query all chunks with this file_id
-        results = vector_store.get(
-            where={"file_id": file_id}
+    for candidate in [shard] if shard else list_shards():
+        results = get_vector_store(candidate).get(
+            where={"$and": [{"file_id": file_id}, {"total_chunks": {"$gte": 1}}]},
+            limit=1,
+            include=["metadatas"]
         )
         
-        if results and results.get('ids'):
-            # Delete all matching chunks
-            vector_store.delete(ids=results['ids'])
-            deleted_count = len(results['ids'])
-            print(f"🗑️  Deleted {deleted_count} chunks for file_id: {file_id}")
-            return deleted_count
+        if results and results.get('metadatas'):
+            return results['metadatas'][0]
+    
+    return None
+
+
+def get_document_chunks(
+    file_id: str,
+    include_embeddings: bool = False,
+    shard: Optional[str] = None
+) -> List[Dict]:
+    """
+    Fetch every chunk of a document in reading order
+    
+    Args:
+        file_id: Unique identifier of the document
+        include_embeddings: Also return each chunk's embedding
+        shard: Shard the document is stored in (every shard is searched if None)
+    
+    Returns:
+        List of chunks with id, text and metadata (and embedding), ordered by chunk_index
+    """
+    include = ["documents", "metadatas", "embeddings"] if include_embeddings else ["documents", "metadatas"]
+    results = {'ids': [], 'documents': [], 'metadatas': [], 'embeddings': []}
+    for candidate in [shard] if shard else list_shards():
+        results = get_vector_store(candidate).get(where={"file_id": file_id}, include=include)
+        if results['ids']:
+            break
+    
+    chunks = [
+        {"id": chunk_id, "text": text or "", "metadata": metadata or {}}
+        for chunk_id, text, metadata in zip(results['ids'], results['documents'], results['metadatas'])
+    ]
+    if include_embeddings:
+        for chunk, embedding in zip(chunks, results['embeddings']):
+            chunk["embedding"] = embedding
+    chunks.sort(key=lambda chunk: chunk["metadata"].get("chunk_index", 0))
+    return chunks
+
+
+def delete_documents_chunks(file_ids: List[str], shards: Optional[Sequence[str]] = None) -> int:
+    """
+    Delete all chunks belonging to one or more documents
+    
+    Fetches only the matching chunk IDs in each shard (no text or
+    embeddings) and deletes exactly those. The count reported is the number
+    of matched chunks, which stays correct while other documents are being
+    ingested into the same shard.
+    
+    Args:
+        file_ids: Unique identifiers of the documents
+        shards: Shards the documents are stored in (every shard is searched if None)
         
+    Returns:
+        Number of chunks deleted
+    """
+    if not file_ids:
         return 0
+    
+    try:
+        where = {"file_id": file_ids[0]} if len(file_ids) == 1 else {"file_id": {"$in": list(file_ids)}}
+        deleted_count = 0
+        for shard in list_shards() if shards is None else shards:
+            vector_store = get_vector_store(shard)
+            chunk_ids = vector_store.get(where=where, include=[])['ids']
+            if chunk_ids:
+                vector_store.delete(ids=chunk_ids)
+                deleted_count += len(chunk_ids)
+        print(f"🗑️  Deleted {deleted_count} chunks for {len(file_ids)} document(s)")
+        return deleted_count
         
     except Exception as e:
         print(f"❌ Error deleting chunks: {str(e)}")
         raise
+
+
+def delete_document_chunks(file_id: str) -> int:
+    """
+    Delete all chunks belonging to a specific document
+    
+    Args:
+        file_id: Unique identifier of the document
+        
+    Returns:
+        Number of chunks deleted
+    """
+    return delete_documents_chunks([file_id])
@@ -0,0 +1,459 @@
+"""
+Background Ingestion Jobs
+Runs PDF ingestion outside the HTTP request with persistent progress tracking
+
+Uploads are recorded as jobs in SQLite and processed by a bounded pool of
+asyncio workers. Each job stores its current stage and counters so clients
+can poll progress. The ingestion pipeline records how many chunks it has
+stored in a per-job checkpoint, so unfinished jobs re-queued on startup and
+failed jobs that are retried resume after the last stored batch.
+"""
+
+import asyncio
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Set
+
+from app.rag.ingest import ingest_pdf, INGEST_STAGES
+from app.db.document_catalog import get_document_catalog, DOCUMENT_READY, DOCUMENT_FAILED
+from app.utils.ollama_client import EMBEDDING_MODEL
+
+
+# Job configuration
+JOBS_DB_PATH = "data/jobs.sqlite3"
+JOBS_CHECKPOINT_DIR = "data/jobs"
+INGEST_WORKERS = 2  # Documents ingested in parallel
+PROGRESS_WRITE_INTERVAL = 1.0  # Seconds between job progress writes (stage changes are written at once)
+
+# Job statuses
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+# Counter columns that progress updates may set
+_COUNTER_FIELDS = ("pages_total", "pages_processed", "chunks_total", "chunks_processed")
+
+# Global job queue instance
+_ingest_queue = None
+
+
+class JobStore:
+    """
+    SQLite-backed storage for ingestion jobs
+    
+    Args:
+        path: SQLite database file
+    """
+    
+    def __init__(self, path: str = JOBS_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                file_id TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT,
+                completed_stage TEXT,
+                pages_total INTEGER DEFAULT 0,
+                pages_processed INTEGER DEFAULT 0,
+                chunks_total INTEGER DEFAULT 0,
+                chunks_processed INTEGER DEFAULT 0,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                updated_at REAL NOT NULL,
+                finished_at REAL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_file_id ON jobs(file_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+        self._conn.commit()
+    
+    def create(self, file_id: str, filename: str, file_path: str) -> Dict:
+        """Insert a new queued job and return it"""
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO jobs (job_id, file_id, filename, file_path, status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (job_id, file_id, filename, file_path, STATUS_QUEUED, now, now)
+            )
+            self._conn.commit()
+        
+        return self.get(job_id)
+    
+    def update(self, job_id: str, **fields):
+        """Update columns of a job"""
+        if not fields:
+            return
+        
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE job_id = ?",
+                (*fields.values(), job_id)
+            )
+            self._conn.commit()
+    
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Fetch a job by ID"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+    
+    def find_active(self, file_id: str) -> Optional[Dict]:
+        """Find a queued or running job for a document"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE file_id = ? AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+                (file_id, *ACTIVE_STATUSES)
+            ).fetchone()
+        return dict(row) if row else None
+    
+    def active_file_ids(self) -> Set[str]:
+        """Documents with a queued or running job"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT file_id FROM jobs WHERE status IN (?, ?)",
+                ACTIVE_STATUSES
+            ).fetchall()
+        return {row["file_id"] for row in rows}
+    
+    def find_failed(self, file_id: str) -> Optional[Dict]:
+        """Find the most recent failed job for a document"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE file_id = ? AND status = ? ORDER BY created_at DESC LIMIT 1",
+                (file_id, STATUS_FAILED)
+            ).fetchone()
+        return dict(row) if row else None
+    
+    def list_failed(self, file_id: str) -> List[Dict]:
+        """All failed jobs for a document"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE file_id = ? AND status = ?",
+                (file_id, STATUS_FAILED)
+            ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def list(self, limit: int = 50, status: Optional[str] = None) -> List[Dict]:
+        """List the most recent jobs, optionally filtered by status"""
+        query = "SELECT * FROM jobs"
+        params: list = []
+        if status:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [dict(row) for row in rows]
+    
+    def list_unfinished(self) -> List[Dict]:
+        """Jobs that were queued or running when the server stopped"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                ACTIVE_STATUSES
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+
+def format_job(job: Dict) -> Dict:
+    """
+    Convert a stored job row into an API response
+    
+    Adds elapsed time and embedding throughput (chunks per second).
+    """
+    end = job.get("finished_at") or time.time()
+    elapsed = end - job["started_at"] if job.get("started_at") else 0.0
+    
+    return {
+        "job_id": job["job_id"],
+        "file_id": job["file_id"],
+        "filename": job["filename"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "completed_stage": job["completed_stage"],
+        "pages_total": job["pages_total"],
+        "pages_processed": job["pages_processed"],
+        "chunks_total": job["chunks_total"],
+        "chunks_processed": job["chunks_processed"],
+        "elapsed_seconds": round(elapsed, 2),
+        "chunks_per_second": round(job["chunks_processed"] / elapsed, 2) if elapsed > 0 else 0.0,
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "finished_at": job["finished_at"]
+    }
+
+
+class IngestJobQueue:
+    """
+    Bounded worker pool that runs ingest_pdf for queued jobs
+    
+    Args:
+        store: Persistent job storage
+        workers: Number of concurrent ingestion workers
+        checkpoint_dir: Root directory for per-job pipeline checkpoints
+    """
+    
+    def __init__(
+        self,
+        store: Optional[JobStore] = None,
+        workers: int = INGEST_WORKERS,
+        checkpoint_dir: str = JOBS_CHECKPOINT_DIR
+    ):
+        self.store = store or JobStore()
+        self.workers = max(1, workers)
+        self.checkpoint_dir = checkpoint_dir
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+    
+    async def start(self):
+        """Start workers and re-queue jobs left unfinished by a previous run"""
+        if self._tasks:
+            return
+        
+        self._queue = asyncio.Queue()
+        self._tasks = [
+            asyncio.create_task(self._worker(i)) for i in range(self.workers)
+        ]
+        
+        unfinished = self.store.list_unfinished()
+        for job in unfinished:
+            self.store.update(job["job_id"], status=STATUS_QUEUED)
+            self._queue.put_nowait(job["job_id"])
+        
+        if unfinished:
+            print(f"🔁 Resuming {len(unfinished)} unfinished ingestion jobs")
+    
+    async def stop(self):
+        """Stop workers; running jobs stay 'running' and resume on next start"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+    
+    def submit(self, file_id: str, filename: str, file_path: str) -> Dict:
+        """
+        Queue a document for ingestion
+        
+        Args:
+            file_id: Unique identifier of the document
+            filename: Original filename
+            file_path: Path of the stored PDF
+        
+        Returns:
+            The created job
+        """
+        job = self.store.create(file_id, filename, file_path)
+        if self._queue is not None:
+            self._queue.put_nowait(job["job_id"])
+        return job
+    
+    def retry(self, job_id: str) -> Optional[Dict]:
+        """
+        Re-queue a failed job
+        
+        The job keeps its checkpoint, so chunks stored before the failure
+        are not embedded again.
+        
+        Args:
+            job_id: ID of the failed job
+        
+        Returns:
+            The updated job, or None if it does not exist or has not failed
+        """
+        job = self.store.get(job_id)
+        if job is None or job["status"] != STATUS_FAILED:
+            return None
+        
+        self.store.update(job_id, status=STATUS_QUEUED, error=None, finished_at=None)
+        if self._queue is not None:
+            self._queue.put_nowait(job_id)
+        return self.store.get(job_id)
+    
+    def discard_checkpoints(self, file_id: str):
+        """
+        Drop the resume checkpoints of a document's failed jobs
+        
+        Called when the document is deleted: the chunks a checkpoint counts
+        as stored are gone, so a later retry must start from the beginning.
+        
+        Args:
+            file_id: Unique identifier of the document
+        """
+        for job in self.store.list_failed(file_id):
+            shutil.rmtree(os.path.join(self.checkpoint_dir, job["job_id"]), ignore_errors=True)
+    
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+    
+    async def _worker(self, worker_id: int):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Ingestion worker {worker_id} error: {str(e)}")
+            finally:
+                self._queue.task_done()
+    
+    async def _run(self, job_id: str):
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None or job["status"] not in ACTIVE_STATUSES:
+            return
+        
+        started_at = job["started_at"] or time.time()
+        await asyncio.to_thread(
+            self.store.update,
+            job_id,
+            status=STATUS_RUNNING,
+            started_at=started_at,
+            error=None
+        )
+        checkpoint_dir = os.path.join(self.checkpoint_dir, job_id)
+        
+        # Progress is collected in memory and written by one task, at most once
+        # per PROGRESS_WRITE_INTERVAL and at once when the stage changes
+        pending: Dict = {}
+        current_stage = [job["stage"]]
+        wake = asyncio.Event()
+        done = asyncio.Event()
+        
+        def on_progress(stage: str, **counters):
+            pending.update((name, value) for name, value in counters.items() if name in _COUNTER_FIELDS)
+            if current_stage[0] != stage:
+                current_stage[0] = stage
+                pending["stage"] = stage
+                # Entering a stage means every earlier stage has completed
+                stage_index = INGEST_STAGES.index(stage)
+                if stage_index > 0:
+                    pending["completed_stage"] = INGEST_STAGES[stage_index - 1]
+                wake.set()
+        
+        async def write_progress():
+            while not done.is_set():
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout=PROGRESS_WRITE_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                wake.clear()
+                if pending:
+                    fields = dict(pending)
+                    pending.clear()
+                    await asyncio.to_thread(self.store.update, job_id, **fields)
+        
+        progress_writer = asyncio.create_task(write_progress())
+        
+        async def stop_progress():
+            # Let the writer finish its last write so it cannot land after the final status
+            done.set()
+            wake.set()
+            await progress_writer
+        
+        try:
+            # The catalog holds the subject and grade that select the document's shard
+            document = await asyncio.to_thread(get_document_catalog().get, job["file_id"]) or {}
+            result = await ingest_pdf(
+                file_path=job["file_path"],
+                filename=job["filename"],
+                file_hash=job["file_id"],
+                progress_callback=on_progress,
+                checkpoint_dir=checkpoint_dir,
+                subject=document.get("subject"),
+                grade=document.get("grade")
+            )
+            await stop_progress()
+            finished_at = time.time()
+            
+            def record_completion():
+                self.store.update(
+                    job_id,
+                    status=STATUS_COMPLETED,
+                    stage=None,
+                    completed_stage=INGEST_STAGES[-1],
+                    chunks_total=result.get("chunks_count", 0),
+                    chunks_processed=result.get("chunks_count", 0),
+                    finished_at=finished_at
+                )
+                get_document_catalog().update(
+                    job["file_id"],
+                    status=DOCUMENT_READY,
+                    error=None,
+                    page_count=result.get("pages", 0),
+                    failed_pages=len(result.get("failed_pages", [])),
+                    chunk_count=result.get("chunks_count", 0),
+                    total_characters=result.get("total_characters", 0),
+                    embedding_model=EMBEDDING_MODEL,
+                    ingested_at=finished_at,
+                    ingest_seconds=round(finished_at - started_at, 2)
+                )
+                shutil.rmtree(checkpoint_dir, ignore_errors=True)
+            
+            await asyncio.to_thread(record_completion)
+        
+        except Exception as e:
+            if not progress_writer.done():
+                await stop_progress()
+            
+            def record_failure():
+                # Keep the upload and checkpoint: batches stored so far are durable
+                # and a retry continues from there
+                self.store.update(
+                    job_id,
+                    status=STATUS_FAILED,
+                    error=str(e),
+                    finished_at=time.time(),
+                    **pending
+                )
+                get_document_catalog().update(job["file_id"], status=DOCUMENT_FAILED, error=str(e))
+            
+            await asyncio.to_thread(record_failure)
+        
+        finally:
+            progress_writer.cancel()
+
+
+def get_ingest_queue() -> IngestJobQueue:
+    """
+    Get or create the ingestion job queue (Singleton pattern)
+    
+    Returns:
+        IngestJobQueue instance
+    """
+    global _ingest_queue
+    
+    if _ingest_queue is None:
+        _ingest_queue = IngestJobQueue()
+    
+    return _ingest_queue
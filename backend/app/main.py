@@ -7,10 +7,20 @@ It handles CORS, routing, and server lifecycle events.
 """
 
 from fastapi import FastAPI
+import asyncio
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
 from app.api import chat, documents, health
+from app.utils.ollama_client import init_http_client, close_http_client, warm_chat_model
+from app.jobs.ingest_jobs import get_ingest_queue
+from app.utils.pdf_utils import shutdown_extraction_pool
+from app.rag.retrieval import normalize_stored_embeddings, sync_lexical_index, sync_vector_index
+from app.db.vector_index import vector_index_enabled
+from app.rag.prompts import SYSTEM_PROMPT
+from app.db.document_catalog import get_document_catalog
+from app.api.documents import UPLOAD_DIR, MAX_UPLOAD_SIZE_MB
+from app.utils.upload_utils import UploadSizeLimitMiddleware
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -30,6 +40,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Reject oversized uploads before their body is received
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_bytes=MAX_UPLOAD_SIZE_MB * 1024 * 1024,
+    path="/api/documents/upload"
+)
+
 # Register API routers
 app.include_router(health.router, prefix="/api", tags=["Health"])
 app.include_router(documents.router, prefix="/api/documents", tags=["Documents"])
@@ -42,6 +59,21 @@ async def startup_event():
     print("🚀 Qnix AI Backend Server Starting...")
     print("📚 Initializing vector store...")
     print("🤖 Checking Ollama connection...")
+    await init_http_client()
+    print("📏 Checking stored embeddings...")
+    await asyncio.to_thread(normalize_stored_embeddings)
+    print("🔤 Syncing lexical index...")
+    await asyncio.to_thread(sync_lexical_index)
+    if vector_index_enabled():
+        print("🧮 Syncing vector index...")
+        await asyncio.to_thread(sync_vector_index)
+    print("🗂️  Loading document catalog...")
+    active_file_ids = await asyncio.to_thread(get_ingest_queue().store.active_file_ids)
+    await asyncio.to_thread(get_document_catalog().backfill, UPLOAD_DIR, active_file_ids)
+    print("📥 Starting ingestion workers...")
+    await get_ingest_queue().start()
+    # Load the chat model and prefill the system prompt without delaying startup
+    app.state.warmup_task = asyncio.create_task(warm_chat_model(SYSTEM_PROMPT))
     print("✅ Server ready at http://localhost:8000")
     print("📖 API docs available at http://localhost:8000/docs")
 
@@ -50,6 +82,10 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup on server shutdown"""
     print("👋 Shutting down Qnix AI Backend...")
+    app.state.warmup_task.cancel()
+    await get_ingest_queue().stop()
+    shutdown_extraction_pool()
+    await close_http_client()
 
 
 @app.get("/")
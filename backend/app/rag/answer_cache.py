@@ -0,0 +1,248 @@
+"""
+Semantic Answer Cache
+Reuses generated answers for near-identical questions
+
+An entry is keyed on the set of retrieved chunk IDs plus the conversation
+history that went into the prompt. A new question hits the cache when it
+retrieved exactly the same chunks (with unchanged text) and its embedding is
+within a cosine-similarity threshold of a cached question. Entries expire
+after a TTL and are dropped whenever a contributing document is deleted or
+re-ingested.
+"""
+
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+
+# Cache configuration
+ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.95  # Minimum cosine similarity between questions
+ANSWER_CACHE_TTL_SECONDS = 6 * 60 * 60  # Entries older than this are ignored
+ANSWER_CACHE_MAX_ENTRIES = 2_000  # Least recently used entries are evicted beyond this
+
+# Global cache instance
+_answer_cache = None
+
+
+def _normalize_vector(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def _dot(a: List[float], b: List[float]) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+def history_key(conversation_history: Optional[List[dict]], turns: int = 3) -> str:
+    """Stable hash of the conversation turns that are included in the prompt"""
+    recent = [
+        [msg.get("role", "user"), msg.get("content", "")]
+        for msg in (conversation_history or [])[-turns:]
+    ]
+    return hashlib.sha256(json.dumps(recent, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def chunks_fingerprint(chunks: List[Dict]) -> str:
+    """Hash of the retrieved chunk texts, used to detect changed content"""
+    digest = hashlib.sha256()
+    for chunk in sorted(chunks, key=lambda c: c.get("id", "")):
+        digest.update(chunk.get("id", "").encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(chunk.get("text", "").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class AnswerCache:
+    """
+    In-memory semantic cache of RAG answers
+    
+    Args:
+        similarity_threshold: Minimum cosine similarity for a hit
+        ttl_seconds: Lifetime of an entry
+        max_entries: Maximum number of cached answers
+    """
+    
+    def __init__(
+        self,
+        similarity_threshold: float = ANSWER_CACHE_SIMILARITY_THRESHOLD,
+        ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self._buckets: Dict[Tuple[FrozenSet[str], str], Set[int]] = {}
+        self._by_file: Dict[str, Set[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+    
+    def _remove(self, entry_id: int):
+        """Drop an entry from every index (lock held)"""
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        
+        bucket = self._buckets.get(entry["bucket"])
+        if bucket is not None:
+            bucket.discard(entry_id)
+            if not bucket:
+                del self._buckets[entry["bucket"]]
+        
+        for file_id in entry["file_ids"]:
+            ids = self._by_file.get(file_id)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self._by_file[file_id]
+    
+    def lookup(
+        self,
+        question_embedding: List[float],
+        chunks: List[Dict],
+        conversation_history: Optional[List[dict]] = None
+    ) -> Optional[Dict]:
+        """
+        Find a cached answer for a question
+        
+        Args:
+            question_embedding: Embedding of the new question
+            chunks: Chunks retrieved for the new question (with "id" and "text")
+            conversation_history: Conversation history sent with the question
+        
+        Returns:
+            Cached result dictionary, or None on a miss
+        """
+        bucket_key = (frozenset(chunk["id"] for chunk in chunks), history_key(conversation_history))
+        fingerprint = chunks_fingerprint(chunks)
+        query = _normalize_vector(question_embedding)
+        now = time.time()
+        
+        with self._lock:
+            best_id, best_score = None, self.similarity_threshold
+            
+            for entry_id in list(self._buckets.get(bucket_key, ())):
+                entry = self._entries[entry_id]
+                
+                if now - entry["created_at"] > self.ttl_seconds:
+                    self._remove(entry_id)
+                    self._stats["expirations"] += 1
+                    continue
+                if entry["fingerprint"] != fingerprint:
+                    continue
+                
+                score = _dot(query, entry["embedding"])
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            
+            if best_id is None:
+                self._stats["misses"] += 1
+                return None
+            
+            self._entries.move_to_end(best_id)
+            self._stats["hits"] += 1
+            return {**self._entries[best_id]["result"], "similarity": round(best_score, 4)}
+    
+    def store(
+        self,
+        question_embedding: List[float],
+        chunks: List[Dict],
+        result: Dict,
+        conversation_history: Optional[List[dict]] = None
+    ):
+        """
+        Cache an answer
+        
+        Args:
+            question_embedding: Embedding of the answered question
+            chunks: Chunks the answer was generated from (with "id", "file_id", "text")
+            result: Result dictionary to return on future hits
+            conversation_history: Conversation history sent with the question
+        """
+        bucket_key = (frozenset(chunk["id"] for chunk in chunks), history_key(conversation_history))
+        file_ids = {chunk.get("file_id") for chunk in chunks if chunk.get("file_id")}
+        
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            
+            self._entries[entry_id] = {
+                "bucket": bucket_key,
+                "file_ids": file_ids,
+                "fingerprint": chunks_fingerprint(chunks),
+                "embedding": _normalize_vector(question_embedding),
+                "result": result,
+                "created_at": time.time()
+            }
+            self._buckets.setdefault(bucket_key, set()).add(entry_id)
+            for file_id in file_ids:
+                self._by_file.setdefault(file_id, set()).add(entry_id)
+            
+            while len(self._entries) > self.max_entries:
+                oldest_id = next(iter(self._entries))
+                self._remove(oldest_id)
+                self._stats["evictions"] += 1
+    
+    def invalidate_document(self, file_id: str) -> int:
+        """
+        Drop every cached answer that used chunks from a document
+        
+        Args:
+            file_id: Unique identifier of the document
+        
+        Returns:
+            Number of entries removed
+        """
+        with self._lock:
+            entry_ids = list(self._by_file.get(file_id, ()))
+            for entry_id in entry_ids:
+                self._remove(entry_id)
+            self._stats["invalidations"] += len(entry_ids)
+            return len(entry_ids)
+    
+    def clear(self):
+        """Remove every cached answer"""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self._by_file.clear()
+    
+    def stats(self) -> Dict:
+        """
+        Get cache statistics
+        
+        Returns:
+            Dictionary with configuration, entry count, counters and hit rate
+        """
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "similarity_threshold": self.similarity_threshold
+            }
+
+
+def get_answer_cache() -> AnswerCache:
+    """
+    Get or create the answer cache instance (Singleton pattern)
+    
+    Returns:
+        AnswerCache instance
+    """
+    global _answer_cache
+    
+    if _answer_cache is None:
+        _answer_cache = AnswerCache()
+    
+    return _answer_cache
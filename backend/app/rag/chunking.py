@@ -0,0 +1,333 @@
+"""
+Token-Aware Chunking
+Splits document text into sentence-aligned chunks sized by token count
+
+Text is segmented at sentence and paragraph boundaries and segments are
+packed greedily into chunks up to a token budget. Pages are buffered into
+blocks of CHUNK_BLOCK_CHARS characters and each block is analysed with a few
+vectorized passes over its character classes: sentence ends, blank lines and
+running token totals all come from NumPy arrays, so the Python work is one
+binary search per chunk rather than a step per sentence. Every chunk records
+the pages it came from and its character offsets in the document text
+(non-empty pages joined by a blank line). The whole pass is linear in the
+length of the text.
+"""
+
+import re
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+# Chunk sizing, in approximate embedding-model tokens
+CHUNK_MAX_TOKENS = 320  # Upper bound per chunk (~1300 characters of English prose)
+CHUNK_OVERLAP_TOKENS = 48  # Trailing sentences repeated at the start of the next chunk
+CHUNK_MIN_TOKENS = 12  # Smaller chunks carry too little meaning to be worth embedding
+CHUNK_BLOCK_CHARS = 65536  # Page text buffered before a chunking pass (~20 pages)
+
+# WordPiece splits long words into several tokens; count one per this many characters
+WORDPIECE_CHARS = 6
+
+# Separator between pages in the document text (matches extract_text_from_pdf)
+PAGE_SEPARATOR = "\n\n"
+
+# One match per word piece of up to WORDPIECE_CHARS characters, or per punctuation mark
+_TOKEN_PATTERN = re.compile(r"\w{1,%d}|[^\w\s]" % WORDPIECE_CHARS)
+
+# Character classes: whitespace (newlines apart, for blank lines), word
+# character (\w), punctuation (sentence ends apart); the order keeps the
+# whitespace and token checks to one comparison each
+_SPACE, _NEWLINE, _WORD, _OTHER, _STOP = 0, 1, 2, 3, 4
+
+
+def _ascii_class(character: str) -> int:
+    if character == "\n":
+        return _NEWLINE
+    if character in ".!?":
+        return _STOP
+    if re.match(r"\w", character):
+        return _WORD
+    return _SPACE if character.isspace() else _OTHER
+
+
+_ASCII_CLASSES = bytes(_ascii_class(chr(code)) for code in range(128)) + bytes(128)
+_ASCII_CLASS_ARRAY = np.frombuffer(_ASCII_CLASSES, dtype=np.uint8)
+_char_classes: Dict[int, int] = {}  # Non-ASCII code point -> class, filled as characters are seen
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximate the number of tokens the embedding model sees for a text
+    
+    Counts words and punctuation marks, with long words counted as several
+    word pieces. Close enough to a WordPiece tokenizer for sizing chunks
+    without loading one.
+    
+    Args:
+        text: Text to measure
+    
+    Returns:
+        Estimated token count
+    """
+    return len(_TOKEN_PATTERN.findall(text))
+
+
+def _char_class(code: int) -> int:
+    character = chr(code)
+    if re.match(r"\w", character):
+        return _WORD
+    return _SPACE if re.match(r"\s", character) else _OTHER
+
+
+def _classify(text: str) -> np.ndarray:
+    """Character class of every character of a text"""
+    if text.isascii():
+        return np.frombuffer(text.encode("ascii").translate(_ASCII_CLASSES), dtype=np.uint8)
+    
+    codes = np.frombuffer(text.encode("utf-32-le", errors="surrogatepass"), dtype=np.uint32)
+    classes = np.empty(len(codes), dtype=np.uint8)
+    ascii_chars = codes < 128
+    classes[ascii_chars] = _ASCII_CLASS_ARRAY[codes[ascii_chars]]
+    unique, inverse = np.unique(codes[~ascii_chars], return_inverse=True)
+    for code in unique.tolist():
+        if code not in _char_classes:
+            _char_classes[code] = _char_class(code)
+    classes[~ascii_chars] = np.array([_char_classes[code] for code in unique.tolist()], dtype=np.uint8)[inverse]
+    return classes
+
+
+def _runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Start and end (exclusive) of every run of True values"""
+    changes = np.flatnonzero(mask[1:] != mask[:-1]) + 1
+    if len(mask) and mask[0]:
+        changes = np.concatenate(([0], changes))
+    if len(changes) % 2:
+        changes = np.concatenate((changes, [len(mask)]))
+    return changes[0::2], changes[1::2]
+
+
+class _TokenIndex:
+    """
+    Token positions and running token totals of a text, as counted by estimate_tokens
+    
+    A word of n characters is n/6 (rounded up) word pieces, counted at its
+    first character, and every other non-space character is one token. So
+    totals(end) - totals(start) equals estimate_tokens(text[start:end])
+    whenever start and end do not fall inside a word.
+    """
+    
+    def __init__(self, classes: np.ndarray):
+        self.classes = classes
+        self.others = np.flatnonzero(classes >= _OTHER)  # Punctuation marks
+        self.word_starts, word_ends = _runs(classes == _WORD)
+        self._pieces = np.zeros(len(self.word_starts) + 1, dtype=np.int64)
+        np.cumsum((word_ends - self.word_starts + WORDPIECE_CHARS - 1) // WORDPIECE_CHARS, out=self._pieces[1:])
+        # With len(text) appended, so the position after the last token is the end of the text
+        self._next_others = np.append(self.others, len(classes))
+        self._next_words = np.append(self.word_starts, len(classes))
+    
+    def totals(self, positions: np.ndarray) -> np.ndarray:
+        """Tokens before each position"""
+        return np.searchsorted(self.others, positions) + self._pieces[np.searchsorted(self.word_starts, positions)]
+    
+    def next_token(self, positions: np.ndarray) -> np.ndarray:
+        """First non-space character at or after each position (len(text) if none)"""
+        return np.minimum(
+            self._next_others[np.searchsorted(self.others, positions)],
+            self._next_words[np.searchsorted(self.word_starts, positions)]
+        )
+
+
+class TokenChunker:
+    """
+    Streaming sentence-aligned chunker with page and offset tracking
+    
+    Feed pages in order; pages are chunked a block at a time and completed
+    chunks are returned as soon as their block is processed, so only the
+    current block and the chunk being built are held in memory.
+    
+    Segments end at a sentence end (., ! or ?) followed by whitespace, at a
+    blank line and at the end of every page; a sentence longer than
+    max_tokens is split between words. Each chunk is a dictionary with text,
+    token_count, page_start, page_end, char_start and char_end (offsets
+    into the document text).
+    
+    Args:
+        max_tokens: Maximum tokens per chunk
+        overlap_tokens: Tokens of trailing sentences carried into the next chunk
+        min_tokens: Chunks below this size are dropped
+    """
+    
+    def __init__(
+        self,
+        max_tokens: int = CHUNK_MAX_TOKENS,
+        overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+        min_tokens: int = CHUNK_MIN_TOKENS
+    ):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = min(overlap_tokens, max_tokens // 2)
+        self.min_tokens = min_tokens
+        
+        self._parts: List[str] = []  # Document text from the start of the chunk being built
+        self._base = 0  # Document offset of that text
+        self._length = 0  # Document length so far
+        self._page_offsets: List[int] = []  # Document offset of each buffered page
+        self._page_numbers: List[int] = []
+        self._buffered = 0  # Characters fed since the last pass
+        self._emitted_end = 0  # Document offset where the last emitted chunk's segments end
+    
+    def _boundaries(self, text: str) -> Tuple[List[int], List[int]]:
+        """
+        Segment boundaries of a block and the running token total at each
+        
+        Returns:
+            Boundary offsets into text (from the first non-space character to
+            len(text)) and the tokens before each, relative to the first
+        """
+        index = _TokenIndex(_classify(text))
+        classes = index.classes
+        start = int(index.next_token(0))
+        
+        # Whitespace ends a segment where it follows a sentence end...
+        stops = index.others[classes[index.others] == _STOP] + 1
+        stops = stops[stops < len(text)]
+        stops = stops[classes[stops] <= _NEWLINE]
+        # ...or holds a blank line: two newlines with no token between them
+        newlines = np.flatnonzero(classes == _NEWLINE)
+        after_newlines = index.next_token(newlines)
+        blank_lines = after_newlines[:-1][after_newlines[:-1] > newlines[1:]]
+        ends = np.union1d(index.next_token(stops), blank_lines)
+        ends = ends[(ends > start) & (ends < len(text))]
+        positions = np.concatenate(([start], ends, [len(text)])) if start < len(text) else np.array([start])
+        
+        totals = index.totals(positions)
+        oversized = np.flatnonzero(np.diff(totals) > self.max_tokens)
+        if len(oversized):
+            # Run-on "sentences" (tables, missing punctuation): split between words
+            splits = [self._word_splits(index, int(positions[i]), int(positions[i + 1])) for i in oversized]
+            positions = np.sort(np.concatenate([positions] + splits))
+            totals = index.totals(positions)
+        
+        return positions.tolist(), (totals - totals[0]).tolist()
+    
+    def _word_splits(self, index: _TokenIndex, start: int, end: int) -> np.ndarray:
+        """Word starts that split text[start:end] into parts of at most max_tokens"""
+        spaces = index.classes[start:end] <= _NEWLINE
+        words = np.flatnonzero(spaces[:-1] & ~spaces[1:]) + start + 1  # Non-space after space
+        bounds = np.concatenate(([start], words, [end]))
+        totals = index.totals(bounds).tolist()
+        
+        splits, first = [], 0
+        while True:
+            # Words first..last-1 fit (a single word over the budget stands alone)
+            last = max(bisect_right(totals, totals[first] + self.max_tokens) - 1, first + 1)
+            if last >= len(bounds) - 1:
+                return np.array(splits, dtype=np.int64)
+            splits.append(int(bounds[last]))
+            first = last
+    
+    def _page_of(self, offset: int) -> int:
+        return self._page_numbers[bisect_right(self._page_offsets, offset) - 1]
+    
+    def _chunk(self, text: str, positions: List[int], totals: List[int], first: int, last: int) -> List[Dict]:
+        """The chunk made of segments first..last-1 (empty if it is too small)"""
+        start, end, tokens = positions[first], positions[last], totals[last] - totals[first]
+        self._emitted_end = self._base + end
+        if tokens < self.min_tokens:
+            return []
+        
+        body = text[start:end].rstrip()
+        return [{
+            "text": body,
+            "token_count": tokens,
+            "page_start": self._page_of(self._base + start),
+            "page_end": self._page_of(self._base + positions[last - 1]),
+            "char_start": self._base + start,
+            "char_end": self._base + start + len(body)
+        }]
+    
+    def _process(self, final: bool) -> List[Dict]:
+        """Chunk the buffered text, keeping the unfinished chunk for the next pass"""
+        text = "".join(self._parts)
+        self._buffered = 0
+        positions, totals = self._boundaries(text)
+        count = len(positions) - 1  # Segments
+        
+        chunks = []
+        first = 0
+        while first < count:
+            # Segments first..last-1 fit the budget (every segment does on its own)
+            last = max(bisect_right(totals, totals[first] + self.max_tokens) - 1, first + 1)
+            if last >= count:
+                break  # The chunk can still grow with the next pages
+            
+            chunks.extend(self._chunk(text, positions, totals, first, last))
+            
+            # Carry trailing segments that fit in the overlap budget, if the next segment fits beside them
+            carried = bisect_left(totals, totals[last] - self.overlap_tokens, first, last + 1)
+            if carried == first or totals[last + 1] - totals[carried] > self.max_tokens:
+                carried = last
+            first = carried
+        
+        if final:
+            if first < count and self._base + positions[count] > self._emitted_end:
+                chunks.extend(self._chunk(text, positions, totals, first, count))
+            return chunks
+        
+        keep = positions[first] if first < count else len(text)
+        self._parts = [text[keep:]]
+        self._base += keep
+        kept = max(bisect_right(self._page_offsets, self._base) - 1, 0)
+        del self._page_offsets[:kept], self._page_numbers[:kept]
+        return chunks
+    
+    def feed(self, text: str, page: int) -> List[Dict]:
+        """
+        Add the text of one page
+        
+        Args:
+            text: Extracted page text (empty pages are skipped)
+            page: Page number (1-based)
+        
+        Returns:
+            Chunks completed by this page (pages are processed in blocks, so
+            usually none until a block is full)
+        """
+        if not text:
+            return []
+        
+        if self._length:
+            self._parts.append(PAGE_SEPARATOR)
+            self._length += len(PAGE_SEPARATOR)
+        self._page_offsets.append(self._length)
+        self._page_numbers.append(page)
+        self._parts.append(text)
+        self._length += len(text)
+        
+        self._buffered += len(text)
+        if self._buffered < CHUNK_BLOCK_CHARS:
+            return []
+        return self._process(final=False)
+    
+    def finish(self) -> List[Dict]:
+        """Return the remaining chunks, including the final, partially filled one"""
+        return self._process(final=True)
+
+
+def chunk_pages(pages: List[str], **options) -> List[Dict]:
+    """
+    Chunk a whole document given as a list of page texts
+    
+    Args:
+        pages: Text of each page, in order
+        **options: TokenChunker settings
+    
+    Returns:
+        List of chunk dictionaries
+    """
+    chunker = TokenChunker(**options)
+    chunks = []
+    for page_number, text in enumerate(pages, start=1):
+        chunks.extend(chunker.feed(text, page_number))
+    return chunks + chunker.finish()
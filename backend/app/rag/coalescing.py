@@ -0,0 +1,216 @@
+"""
+Request Coalescing
+Single-flight deduplication of identical in-flight questions
+
+When a class is told to ask the same question at the same time, every request
+would run its own embedding, retrieval and generation, and the answer cache
+cannot help because none of them has finished yet. Requests with the same
+normalized question, source count, conversation history, shards and filters
+instead join the computation that is already running and all receive its
+result, or replay its event stream from the beginning.
+
+The shared work runs in its own task, so a client disconnecting does not
+cancel it for the others.
+"""
+
+import asyncio
+import hashlib
+import json
+import unicodedata
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from app.rag.answer_cache import history_key
+
+
+# Coalescing configuration
+COALESCING_ENABLED = True
+
+# Global coalescer instance
+_coalescer = None
+
+
+def coalescing_key(
+    kind: str,
+    question: str,
+    max_results: int,
+    conversation_history: Optional[List[dict]] = None,
+    shards: Optional[List[str]] = None,
+    filters: Optional[Dict] = None
+) -> str:
+    """
+    Key under which identical requests share one computation
+    
+    The question is NFKC-normalized, case-folded and whitespace-collapsed, so
+    "What is osmosis?" and "what is  osmosis?" coalesce.
+    
+    Args:
+        kind: Request type ("ask" or "stream"), kept apart because they return different shapes
+        question: User's question
+        max_results: Number of chunks requested
+        conversation_history: Conversation history sent with the question
+        shards: Shards retrieval is scoped to (None for all)
+        filters: Normalized retrieval filters (see app.rag.filters)
+    
+    Returns:
+        Hex digest identifying the request
+    """
+    normalized = " ".join(unicodedata.normalize("NFKC", question).casefold().split())
+    payload = json.dumps(
+        [kind, normalized, max_results, history_key(conversation_history), sorted(set(shards or [])), filters],
+        ensure_ascii=False,
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Broadcast:
+    """Events of one streamed computation, replayable by any number of subscribers"""
+    
+    def __init__(self):
+        self.events: List[Dict] = []
+        self.error: Optional[BaseException] = None
+        self.done = False
+        self.task: Optional[asyncio.Task] = None  # Producer task (kept referenced while running)
+        self._changed = asyncio.Event()
+    
+    def publish(self, event: Dict):
+        self.events.append(event)
+        self._changed.set()
+    
+    def close(self, error: Optional[BaseException] = None):
+        self.error = error
+        self.done = True
+        self._changed.set()
+    
+    async def subscribe(self) -> AsyncIterator[Dict]:
+        position = 0
+        while True:
+            while position < len(self.events):
+                yield self.events[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            self._changed.clear()
+            if position == len(self.events) and not self.done:
+                await self._changed.wait()
+
+
+class RequestCoalescer:
+    """
+    Shares in-flight computations between identical concurrent requests
+    
+    Args:
+        enabled: When False every request runs its own computation
+    """
+    
+    def __init__(self, enabled: bool = COALESCING_ENABLED):
+        self.enabled = enabled
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._streams: Dict[str, _Broadcast] = {}
+        self._stats = {"leaders": 0, "followers": 0}
+    
+    async def run(self, key: str, factory: Callable[[], Awaitable[Dict]]) -> Dict:
+        """
+        Run a computation once for all concurrent callers with the same key
+        
+        Args:
+            key: Coalescing key (see coalescing_key)
+            factory: Creates the awaitable that computes the result
+        
+        Returns:
+            The shared result (a fresh top-level copy per caller); followers'
+            results have "coalesced": True
+        """
+        if not self.enabled:
+            return await factory()
+        
+        task = self._calls.get(key)
+        follower = task is not None
+        if follower:
+            self._stats["followers"] += 1
+        else:
+            self._stats["leaders"] += 1
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._calls.pop(key) if self._calls.get(key) is done else None)
+        
+        # Shield the shared task so one caller's cancellation does not cancel it for the others
+        result = await asyncio.shield(task)
+        return {**result, "coalesced": True} if follower else dict(result)
+    
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[Dict]]) -> AsyncIterator[Dict]:
+        """
+        Stream events of a computation shared by all concurrent callers with the same key
+        
+        Callers that join late first receive the events already produced.
+        
+        Args:
+            key: Coalescing key (see coalescing_key)
+            factory: Creates the async iterator of events
+        
+        Yields:
+            Event dictionaries; followers' "done" event has "coalesced": True
+        """
+        if not self.enabled:
+            async for event in factory():
+                yield event
+            return
+        
+        broadcast = self._streams.get(key)
+        follower = broadcast is not None
+        if follower:
+            self._stats["followers"] += 1
+        else:
+            self._stats["leaders"] += 1
+            broadcast = _Broadcast()
+            self._streams[key] = broadcast
+            
+            async def produce():
+                try:
+                    async for event in factory():
+                        broadcast.publish(event)
+                    broadcast.close()
+                except Exception as e:
+                    broadcast.close(e)
+                finally:
+                    if self._streams.get(key) is broadcast:
+                        del self._streams[key]
+            
+            broadcast.task = asyncio.ensure_future(produce())
+        
+        async for event in broadcast.subscribe():
+            if follower and event.get("type") == "done":
+                event = {**event, "coalesced": True}
+            yield event
+    
+    def stats(self) -> Dict:
+        """
+        Get coalescing statistics
+        
+        Returns:
+            Dictionary with leader/follower counts and in-flight computations
+        """
+        total = self._stats["leaders"] + self._stats["followers"]
+        return {
+            **self._stats,
+            "enabled": self.enabled,
+            "coalesced_rate": round(self._stats["followers"] / total, 4) if total else 0.0,
+            "in_flight": len(self._calls) + len(self._streams)
+        }
+
+
+def get_request_coalescer() -> RequestCoalescer:
+    """
+    Get or create the request coalescer instance (Singleton pattern)
+    
+    Returns:
+        RequestCoalescer instance
+    """
+    global _coalescer
+    
+    if _coalescer is None:
+        _coalescer = RequestCoalescer()
+    
+    return _coalescer
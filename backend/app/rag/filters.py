@@ -0,0 +1,98 @@
+"""
+Retrieval Filters
+Restrict a question to some documents, pages or upload dates
+
+Filters are pushed down into the stores rather than applied to retrieved
+chunks, so a narrow filter still returns a full set of sources:
+
+- document-level criteria (file IDs, filename patterns, subjects, upload
+  dates) are resolved against the document catalog, an indexed SQLite table,
+  to the matching file IDs and the shards that hold them; only those shards
+  are searched
+- the file IDs and page range become a metadata `where` filter that ChromaDB
+  or the in-process vector index applies during the nearest-neighbour search,
+  and the lexical index only ranks chunks of the matching documents
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.db.document_catalog import get_document_catalog
+from app.db.vector_store import list_shards
+
+
+# Document-level criteria, resolved through the document catalog
+CATALOG_FILTERS = ("file_ids", "filenames", "subjects", "uploaded_after", "uploaded_before")
+
+
+def normalize_filters(filters: Optional[Dict]) -> Optional[Dict]:
+    """
+    Drop empty criteria and put the rest in a canonical, JSON-serializable form
+    
+    Equal filters normalize to equal dictionaries, so they can be part of
+    cache and coalescing keys.
+    
+    Args:
+        filters: Filter criteria (file_ids, filenames, subjects, uploaded_after,
+            uploaded_before, page_from, page_to)
+    
+    Returns:
+        Normalized filters, or None if no criterion is set
+    """
+    normalized = {}
+    for name, value in (filters or {}).items():
+        if value is None or value == [] or value == "":
+            continue
+        if isinstance(value, datetime):
+            value = value.timestamp()
+        elif isinstance(value, (list, tuple, set)):
+            value = sorted(set(value))
+        normalized[name] = value
+    return normalized or None
+
+
+def resolve_filters(filters: Optional[Dict], shards: Optional[List[str]] = None) -> Optional[Dict]:
+    """
+    Translate filter criteria into the shards to search and store-side filters
+    
+    Args:
+        filters: Normalized filters (see normalize_filters)
+        shards: Shards the request is scoped to (all if None)
+    
+    Returns:
+        Dictionary with shards (to search, None for all), where (metadata
+        filter for the vector stores, or None) and file_ids (documents the
+        lexical index may rank, or None for all), or None if no document can
+        match
+    """
+    filters = filters or {}
+    file_ids = None
+    
+    if any(name in filters for name in CATALOG_FILTERS):
+        matched = get_document_catalog().match(
+            file_ids=filters.get("file_ids"),
+            filenames=filters.get("filenames"),
+            subjects=filters.get("subjects"),
+            uploaded_after=filters.get("uploaded_after"),
+            uploaded_before=filters.get("uploaded_before")
+        )
+        # Documents still being ingested may be in shards that do not exist yet
+        searchable = set(shards) if shards else set(list_shards())
+        matched = {file_id: shard for file_id, shard in matched.items() if shard in searchable}
+        if not matched:
+            return None
+        
+        file_ids = sorted(matched)
+        shards = sorted(set(matched.values()))
+    
+    # A chunk spans pages page_start..page_end; keep it if that overlaps the range
+    clauses = []
+    if file_ids is not None:
+        clauses.append({"file_id": {"$in": file_ids}})
+    if filters.get("page_from") is not None:
+        clauses.append({"page_end": {"$gte": filters["page_from"]}})
+    if filters.get("page_to") is not None:
+        clauses.append({"page_start": {"$lte": filters["page_to"]}})
+    where = clauses[0] if len(clauses) == 1 else {"$and": clauses} if clauses else None
+    
+    return {"shards": shards or None, "where": where, "file_ids": set(file_ids) if file_ids is not None else None}
@@ -1,25 +1,59 @@
 """
 PDF Ingestion Pipeline
 Extracts text, chunks, generates embeddings, and stores in vector DB
+
+The stages run as a streaming pipeline: pages flow from the extraction
+process pool into the token-aware chunker (app/rag/chunking.py), chunks
+flow through a bounded queue
+into the embedder, and embeddings are flushed to ChromaDB in fixed-size
+batches. Memory use stays constant regardless of document size, and every
+flushed batch is durable, so a failed ingestion can resume where it stopped.
+
+Documents are stored in the shard of their subject and grade (see
+app.db.vector_store); the shard is also recorded in every chunk's metadata.
 """
 
+import asyncio
 import os
-from typing import List, Dict
+import json
+from typing import Callable, List, Dict, Optional
 import hashlib
 
-from app.utils.pdf_utils import extract_text_from_pdf
-from app.utils.ollama_client import generate_embeddings
-from app.db.vector_store import get_vector_store
+from app.utils.pdf_utils import iter_pages_parallel
+from app.rag.chunking import TokenChunker, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+from app.utils.ollama_client import generate_embeddings_batch
+from app.db.vector_store import get_vector_store, shard_name
+from app.db.vector_index import get_vector_index, vector_index_enabled
+from app.rag.answer_cache import get_answer_cache
+from app.rag.lexical_index import get_lexical_index
 
 
-# Chunking configuration
+# Legacy character chunking configuration (see app/rag/chunking.py for the
+# token-based settings used by ingestion)
 CHUNK_SIZE = 1000  # Characters per chunk
 CHUNK_OVERLAP = 200  # Overlap between chunks for context continuity
 
+# Embedding configuration
+EMBEDDING_BATCH_SIZE = 32  # Chunks sent per batched embedding request
+EMBEDDING_CONCURRENCY = 4  # Parallel embedding requests to Ollama
+
+# Streaming pipeline configuration
+STORE_BATCH_SIZE = 128  # Chunks embedded and flushed to the vector store together
+PIPELINE_QUEUE_SIZE = 256  # Chunks buffered between the chunker and the embedder
+MIN_DOCUMENT_CHARACTERS = 100  # Less extracted text than this is treated as an empty PDF
+
+# Pipeline stages reported to progress callbacks, in order
+# (extraction and chunking overlap with embedding; the stage names the
+# furthest stage that is still running)
+INGEST_STAGES = ["extracting", "embedding", "storing"]
+
 
 def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
     """
-    Split text into overlapping chunks
+    Split text into overlapping character-based chunks
+    
+    Legacy splitter kept for comparison (benchmarks/bench_chunking.py);
+    ingestion uses the token-aware chunker in app/rag/chunking.py.
     
     Args:
         text: Full text to chunk
@@ -61,73 +95,259 @@ def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVE
     return [c for c in chunks if len(c) > 50]  # Filter out very small chunks
 
 
-async def ingest_pdf(file_path: str, filename: str, file_hash: str) -> Dict:
+def _write_checkpoint(path: str, content: str):
+    """Atomically write a checkpoint file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def _load_stored_count(progress_path: Optional[str]) -> int:
+    """Number of chunks a previous attempt already stored (0 if none)"""
+    if not progress_path or not os.path.exists(progress_path):
+        return 0
+    
+    with open(progress_path, "r", encoding="utf-8") as f:
+        progress = json.load(f)
+    
+    # Chunk boundaries only match if the chunking settings are unchanged
+    if (progress.get("chunk_max_tokens") != CHUNK_MAX_TOKENS
+            or progress.get("chunk_overlap_tokens") != CHUNK_OVERLAP_TOKENS):
+        return 0
+    
+    return progress.get("chunks_stored", 0)
+
+
+def _chunk_metadata(
+    filename: str,
+    file_hash: str,
+    file_path: str,
+    index: int,
+    chunk: Dict,
+    labels: Dict
+) -> Dict:
+    return {
+        "filename": filename,
+        "file_id": file_hash,
+        "chunk_index": index,
+        "source": file_path,
+        "page_start": chunk["page_start"],
+        "page_end": chunk["page_end"],
+        "char_start": chunk["char_start"],
+        "char_end": chunk["char_end"],
+        "token_count": chunk["token_count"],
+        **labels
+    }
+
+
+async def ingest_pdf(
+    file_path: str,
+    filename: str,
+    file_hash: str,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    concurrency: int = EMBEDDING_CONCURRENCY,
+    progress_callback: Optional[Callable[..., None]] = None,
+    checkpoint_dir: Optional[str] = None,
+    store_batch_size: int = STORE_BATCH_SIZE,
+    subject: Optional[str] = None,
+    grade: Optional[str] = None
+) -> Dict:
     """
     Complete PDF ingestion pipeline
     
-    Steps:
-    1. Extract text from PDF
-    2. Chunk text with overlap
-    3. Generate embeddings for each chunk
-    4. Store in vector database with metadata
+    Steps (overlapping, see module docstring):
+    1. Extract pages from PDF in worker processes
+    2. Chunk text at sentence boundaries by token count as pages arrive
+    3. Generate embeddings in concurrent batches
+    4. Flush each batch to the vector database with metadata
+    5. Record the final chunk count and drop stale chunks from older versions
     
     Args:
         file_path: Path to PDF file
         filename: Original filename
         file_hash: Unique identifier for the file
-        
+        batch_size: Number of chunks per embedding request
+        concurrency: Maximum parallel embedding requests
+        progress_callback: Called as (stage, **counters) when a stage starts
+            or makes progress; see INGEST_STAGES
+        checkpoint_dir: Directory where the number of stored chunks is
+            recorded after every flush. A later call with the same directory
+            skips chunks that were already stored.
+        store_batch_size: Chunks embedded and flushed together
+        subject: Subject of the document; with grade, selects its shard
+        grade: Grade or exam level of the document
+    
     Returns:
         Dictionary with ingestion results
     """
+    stage = INGEST_STAGES[0]
+    
+    def report(**counters):
+        if progress_callback:
+            progress_callback(stage, **counters)
+    
+    progress_path = os.path.join(checkpoint_dir, "progress.json") if checkpoint_dir else None
+    already_stored = _load_stored_count(progress_path)
+    chunks_queue: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    totals = {"characters": 0, "pages": 0, "failed_pages": []}
+    
+    # ChromaDB metadata values cannot be None, so unset labels are left out
+    shard = shard_name(subject, grade)
+    labels = {"shard": shard}
+    if subject:
+        labels["subject"] = subject
+    if grade:
+        labels["grade"] = grade
+    
+    async def produce_chunks():
+        """Extract pages and push completed chunks onto the queue"""
+        chunker = TokenChunker()
+        separator = ""
+        
+        try:
+            async for page in iter_pages_parallel(
+                file_path,
+                progress_callback=lambda done, total: report(
+                    pages_processed=done, pages_total=total
+                )
+            ):
+                totals["pages"] += 1
+                if page["error"]:
+                    totals["failed_pages"].append(page["page"])
+                if not page["text"]:
+                    continue
+                
+                # Pages are joined with a blank line, as in extract_text_from_pdf
+                totals["characters"] += len(separator) + len(page["text"])
+                for chunk in chunker.feed(page["text"], page["page"]):
+                    await chunks_queue.put(chunk)
+                separator = "\n\n"
+            
+            for chunk in chunker.finish():
+                await chunks_queue.put(chunk)
+        finally:
+            await chunks_queue.put(None)
+    
     try:
-        # Step 1: Extract text from PDF
-        print(f"📄 Extracting text from {filename}...")
-        text = extract_text_from_pdf(file_path)
-        
-        if not text or len(text.strip()) < 100:
-            raise ValueError("PDF appears to be empty or contains insufficient text")
-        
-        # Step 2: Chunk the text
-        print(f"✂️  Chunking text (size={CHUNK_SIZE}, overlap={CHUNK_OVERLAP})...")
-        chunks = chunk_text(text)
-        print(f"   Created {len(chunks)} chunks")
-        
-        # Step 3: Generate embeddings for each chunk
-        print(f"🧮 Generating embeddings...")
-        embeddings = []
-        for i, chunk in enumerate(chunks):
-            embedding = await generate_embeddings(chunk)
-            embeddings.append(embedding)
+        print(f"📄 Streaming {filename} through extract → chunk → embed → store...")
+        if already_stored:
+            print(f"   Resuming after {already_stored} stored chunks")
+        report()
+        
+        # Opening the shard collection or the lexical index may load them from disk
+        vector_store = await asyncio.to_thread(get_vector_store, shard)
+        lexical_index = await asyncio.to_thread(get_lexical_index)
+        producer = asyncio.create_task(produce_chunks())
+        
+        chunk_count = 0
+        stored = already_stored
+        batch: List[Dict] = []
+        
+        async def flush():
+            nonlocal stored, batch
+            if not batch:
+                return
             
-            if (i + 1) % 10 == 0:
-                print(f"   Processed {i + 1}/{len(chunks)} chunks")
-        
-        # Step 4: Store in vector database
-        print(f"💾 Storing in vector database...")
-        vector_store = get_vector_store()
-        
-        # Prepare metadata for each chunk
-        metadatas = [
-            {
-                "filename": filename,
-                "file_id": file_hash,
-                "chunk_index": i,
-                "total_chunks": len(chunks),
-                "source": file_path
-            }
-            for i in range(len(chunks))
-        ]
-        
-        # Generate unique IDs for each chunk
-        ids = [f"{file_hash}_chunk_{i}" for i in range(len(chunks))]
-        
-        # Add to vector store
-        vector_store.add(
-            embeddings=embeddings,
-            documents=chunks,
-            metadatas=metadatas,
-            ids=ids
-        )
+            embeddings = await generate_embeddings_batch(
+                [chunk["text"] for chunk in batch],
+                batch_size=batch_size,
+                max_concurrency=concurrency
+            )
+            indices = range(stored, stored + len(batch))
+            ids = [f"{file_hash}_chunk_{i}" for i in indices]
+            texts = [chunk["text"] for chunk in batch]
+            
+            # Upsert so a resumed ingestion can safely rewrite chunks it already stored
+            metadatas = [
+                _chunk_metadata(filename, file_hash, file_path, i, chunk, labels)
+                for i, chunk in zip(indices, batch)
+            ]
+            
+            def store_batch(stored_after: int):
+                vector_store.upsert(
+                    embeddings=embeddings,
+                    documents=texts,
+                    metadatas=metadatas,
+                    ids=ids
+                )
+                lexical_index.add_chunks(file_hash, ids, texts, shard)
+                if vector_index_enabled():
+                    get_vector_index(shard).upsert(ids, embeddings, texts, metadatas)
+                
+                if progress_path:
+                    _write_checkpoint(progress_path, json.dumps({
+                        "chunks_stored": stored_after,
+                        "chunk_max_tokens": CHUNK_MAX_TOKENS,
+                        "chunk_overlap_tokens": CHUNK_OVERLAP_TOKENS
+                    }))
+            
+            # ChromaDB, SQLite and checkpoint writes block, so they run off the event loop
+            await asyncio.to_thread(store_batch, stored + len(batch))
+            stored += len(batch)
+            batch = []
+            
+            report(chunks_processed=stored)
+            print(f"   Stored {stored} chunks")
+        
+        try:
+            while True:
+                chunk = await chunks_queue.get()
+                if chunk is None:
+                    break
+                
+                chunk_count += 1
+                if chunk_count <= already_stored:
+                    continue  # Stored by an earlier attempt
+                
+                batch.append(chunk)
+                # Nothing is stored until the document is known not to be empty
+                if len(batch) >= store_batch_size and totals["characters"] >= MIN_DOCUMENT_CHARACTERS:
+                    await flush()
+            
+            # Surface extraction errors
+            await producer
+            
+            if totals["characters"] < MIN_DOCUMENT_CHARACTERS:
+                raise ValueError("PDF appears to be empty or contains insufficient text")
+            
+            # Extraction finished; embed whatever is left
+            stage = "embedding"
+            report(chunks_total=chunk_count)
+            await flush()
+        except BaseException:
+            producer.cancel()
+            raise
+        
+        # Record the final chunk count and drop chunks left by a longer older version
+        stage = "storing"
+        report(chunks_total=chunk_count, chunks_processed=stored)
+        
+        def finalize_chunks():
+            for start in range(0, chunk_count, store_batch_size):
+                indices = range(start, min(start + store_batch_size, chunk_count))
+                # Metadata updates are merged into the stored metadata
+                vector_store.update(
+                    ids=[f"{file_hash}_chunk_{i}" for i in indices],
+                    metadatas=[{"total_chunks": chunk_count} for _ in indices]
+                )
+            vector_store.delete(
+                where={"$and": [{"file_id": file_hash}, {"chunk_index": {"$gte": chunk_count}}]}
+            )
+            current_ids = {f"{file_hash}_chunk_{i}" for i in range(chunk_count)}
+            lexical_index.remove_chunks(list(lexical_index.document_chunk_ids(file_hash) - current_ids))
+            if vector_index_enabled():
+                vector_index = get_vector_index(shard)
+                vector_index.remove_chunks(list(vector_index.document_chunk_ids(file_hash) - current_ids))
+        
+        await asyncio.to_thread(finalize_chunks)
+        
+        # Cached answers may have been built from a previous version of this document
+        get_answer_cache().invalidate_document(file_hash)
+        
+        if totals["failed_pages"]:
+            print(f"   ⚠️  {len(totals['failed_pages'])} pages could not be extracted")
         
         print(f"✅ Successfully ingested {filename}")
         
@@ -135,10 +355,13 @@ async def ingest_pdf(file_path: str, filename: str, file_hash: str) -> Dict:
             "success": True,
             "filename": filename,
             "file_id": file_hash,
-            "chunks_count": len(chunks),
-            "total_characters": len(text)
+            "shard": shard,
+            "chunks_count": chunk_count,
+            "total_characters": totals["characters"],
+            "pages": totals["pages"],
+            "failed_pages": totals["failed_pages"]
         }
-        
+    
     except Exception as e:
         print(f"❌ Error ingesting PDF: {str(e)}")
         raise Exception(f"PDF ingestion failed: {str(e)}")
@@ -151,7 +374,7 @@ async def reindex_document(file_id: str) -> Dict:
     
     Args:
         file_id: Unique identifier of the document
-        
+    
     Returns:
         Dictionary with re-indexing results
     """
@@ -0,0 +1,349 @@
+"""
+Lexical Index
+Incremental BM25 inverted index over document chunks
+
+Dense embeddings miss exact terms: formula names, Sinhala/Tamil words and
+transliterations, past-paper question numbers. This index keeps term
+frequencies per chunk next to the ChromaDB collection, updated whenever
+chunks are stored or deleted. Postings live in memory for sub-millisecond
+lookups and are written through to SQLite so the index survives restarts.
+
+One index covers every shard (see app.db.vector_store), so term statistics
+come from the whole library; searches scoped to shards skip the postings of
+documents in other shards.
+"""
+
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from typing import Collection, Dict, List, Optional, Sequence, Set, Tuple
+
+from app.db.vector_store import DEFAULT_SHARD
+
+
+# Index configuration
+LEXICAL_INDEX_PATH = "data/lexical_index.sqlite3"
+BM25_K1 = 1.2  # Term frequency saturation
+BM25_B = 0.75  # Document length normalization
+
+# Word characters plus the Tamil and Sinhala blocks, whose vowel signs are
+# combining marks that \w alone would split words on, and the zero-width
+# (non-)joiners used inside Sinhala conjuncts
+_TERM_PATTERN = re.compile(r"[\w\u0B80-\u0BFF\u0D80-\u0DFF\u200C\u200D]+")
+
+# Global index instance
+_lexical_index = None
+_lexical_index_lock = threading.Lock()  # Retrieval opens the index from worker threads
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into index terms
+    
+    Applies NFKC normalization and case folding, so full-width digits,
+    ligatures and capitalization do not prevent matches.
+    
+    Args:
+        text: Text to tokenize
+    
+    Returns:
+        List of terms, in order
+    """
+    return _TERM_PATTERN.findall(unicodedata.normalize("NFKC", text).casefold())
+
+
+class LexicalIndex:
+    """
+    BM25 index with write-through SQLite persistence
+    
+    Args:
+        path: SQLite database file
+        k1: BM25 term frequency saturation parameter
+        b: BM25 length normalization parameter
+    """
+    
+    def __init__(self, path: str = LEXICAL_INDEX_PATH, k1: float = BM25_K1, b: float = BM25_B):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        
+        self._postings: Dict[str, Dict[str, int]] = {}  # term -> {chunk_id: term frequency}
+        self._lengths: Dict[str, int] = {}  # chunk_id -> number of terms
+        self._files: Dict[str, Set[str]] = {}  # file_id -> chunk_ids
+        self._chunk_files: Dict[str, str] = {}  # chunk_id -> file_id
+        self._file_shards: Dict[str, str] = {}  # file_id -> shard
+        self._total_length = 0
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                file_id TEXT NOT NULL,
+                length INTEGER NOT NULL,
+                shard TEXT NOT NULL DEFAULT '{DEFAULT_SHARD}'
+            )
+            """
+        )
+        # Indexes created before sharding hold only default-shard chunks
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")}
+        if "shard" not in columns:
+            try:
+                self._conn.execute(f"ALTER TABLE chunks ADD COLUMN shard TEXT NOT NULL DEFAULT '{DEFAULT_SHARD}'")
+            except sqlite3.OperationalError as e:
+                # Another process added it since the table was read
+                if "duplicate column" not in str(e):
+                    raise
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings(chunk_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_file ON chunks(file_id)")
+        self._conn.commit()
+        self._load()
+    
+    def _load(self):
+        """Rebuild the in-memory index from SQLite"""
+        for chunk_id, file_id, length, shard in self._conn.execute("SELECT chunk_id, file_id, length, shard FROM chunks"):
+            self._lengths[chunk_id] = length
+            self._chunk_files[chunk_id] = file_id
+            self._file_shards[file_id] = shard
+            self._files.setdefault(file_id, set()).add(chunk_id)
+            self._total_length += length
+        
+        for term, chunk_id, tf in self._conn.execute("SELECT term, chunk_id, tf FROM postings"):
+            self._postings.setdefault(term, {})[chunk_id] = tf
+    
+    def _remove_locked(self, chunk_ids: Sequence[str]):
+        """Drop chunks from memory and SQLite (lock held, caller commits)"""
+        chunk_ids = [chunk_id for chunk_id in chunk_ids if chunk_id in self._lengths]
+        if not chunk_ids:
+            return
+        
+        for chunk_id in chunk_ids:
+            rows = self._conn.execute("SELECT term FROM postings WHERE chunk_id = ?", (chunk_id,))
+            for (term,) in rows.fetchall():
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self._postings[term]
+            
+            self._total_length -= self._lengths.pop(chunk_id)
+            file_id = self._chunk_files.pop(chunk_id)
+            file_chunks = self._files.get(file_id)
+            if file_chunks is not None:
+                file_chunks.discard(chunk_id)
+                if not file_chunks:
+                    del self._files[file_id]
+                    self._file_shards.pop(file_id, None)
+        
+        self._conn.executemany("DELETE FROM postings WHERE chunk_id = ?", [(c,) for c in chunk_ids])
+        self._conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(c,) for c in chunk_ids])
+    
+    def add_chunks(
+        self,
+        file_id: str,
+        chunk_ids: Sequence[str],
+        texts: Sequence[str],
+        shard: str = DEFAULT_SHARD
+    ):
+        """
+        Index chunks, replacing any existing entries with the same IDs
+        
+        Args:
+            file_id: Document the chunks belong to
+            chunk_ids: Chunk IDs (same as in the vector store)
+            texts: Chunk texts aligned with `chunk_ids`
+            shard: Shard the document is stored in
+        """
+        with self._lock:
+            self._remove_locked(chunk_ids)
+            
+            chunk_rows, posting_rows = [], []
+            for chunk_id, text in zip(chunk_ids, texts):
+                terms = Counter(tokenize(text))
+                length = sum(terms.values())
+                
+                self._lengths[chunk_id] = length
+                self._chunk_files[chunk_id] = file_id
+                self._files.setdefault(file_id, set()).add(chunk_id)
+                self._total_length += length
+                for term, tf in terms.items():
+                    self._postings.setdefault(term, {})[chunk_id] = tf
+                
+                chunk_rows.append((chunk_id, file_id, length, shard))
+                posting_rows.extend((term, chunk_id, tf) for term, tf in terms.items())
+            if chunk_rows:
+                self._file_shards[file_id] = shard
+            
+            self._conn.executemany(
+                "INSERT INTO chunks (chunk_id, file_id, length, shard) VALUES (?, ?, ?, ?)", chunk_rows
+            )
+            self._conn.executemany("INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)", posting_rows)
+            self._conn.commit()
+    
+    def remove_chunks(self, chunk_ids: Sequence[str]):
+        """Remove chunks from the index"""
+        with self._lock:
+            self._remove_locked(chunk_ids)
+            self._conn.commit()
+    
+    def remove_document(self, file_id: str) -> int:
+        """
+        Remove every chunk of a document
+        
+        Args:
+            file_id: Unique identifier of the document
+        
+        Returns:
+            Number of chunks removed
+        """
+        return self.remove_documents([file_id])
+    
+    def remove_documents(self, file_ids: Sequence[str]) -> int:
+        """
+        Remove every chunk of several documents in one transaction
+        
+        Args:
+            file_ids: Unique identifiers of the documents
+        
+        Returns:
+            Number of chunks removed
+        """
+        with self._lock:
+            chunk_ids = [chunk_id for file_id in file_ids for chunk_id in self._files.get(file_id, ())]
+            self._remove_locked(chunk_ids)
+            self._conn.commit()
+            return len(chunk_ids)
+    
+    def document_chunk_ids(self, file_id: str) -> Set[str]:
+        """IDs of the indexed chunks of a document"""
+        with self._lock:
+            return set(self._files.get(file_id, ()))
+    
+    def chunk_files(self, chunk_ids: Sequence[str]) -> Dict[str, str]:
+        """Documents of indexed chunks, by chunk ID (unknown chunks are left out)"""
+        with self._lock:
+            return {chunk_id: self._chunk_files[chunk_id] for chunk_id in chunk_ids if chunk_id in self._chunk_files}
+    
+    def chunk_shards(self, chunk_ids: Sequence[str]) -> Dict[str, str]:
+        """Shards of indexed chunks, by chunk ID (unknown chunks are left out)"""
+        with self._lock:
+            return {
+                chunk_id: self._file_shards.get(self._chunk_files[chunk_id], DEFAULT_SHARD)
+                for chunk_id in chunk_ids
+                if chunk_id in self._chunk_files
+            }
+    
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        shards: Optional[Collection[str]] = None,
+        file_ids: Optional[Collection[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Rank chunks by BM25 score for a query
+        
+        Args:
+            query: Search text
+            limit: Maximum number of results
+            shards: Only rank chunks of documents in these shards (all if None)
+            file_ids: Only rank chunks of these documents (all if None)
+        
+        Returns:
+            List of (chunk_id, score), best first
+        """
+        terms = set(tokenize(query))
+        
+        with self._lock:
+            chunk_count = len(self._lengths)
+            if not chunk_count or not terms:
+                return []
+            
+            average_length = self._total_length / chunk_count or 1.0
+            scores: Dict[str, float] = {}
+            
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                
+                df = len(postings)
+                idf = math.log(1 + (chunk_count - df + 0.5) / (df + 0.5))
+                for chunk_id, tf in postings.items():
+                    file_id = self._chunk_files[chunk_id]
+                    if shards is not None and self._file_shards.get(file_id) not in shards:
+                        continue
+                    if file_ids is not None and file_id not in file_ids:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[chunk_id] / average_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:limit]
+    
+    def clear(self):
+        """Remove every indexed chunk"""
+        with self._lock:
+            self._postings.clear()
+            self._lengths.clear()
+            self._files.clear()
+            self._chunk_files.clear()
+            self._file_shards.clear()
+            self._total_length = 0
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.commit()
+    
+    def stats(self) -> Dict:
+        """
+        Get index statistics
+        
+        Returns:
+            Dictionary with chunk, document and term counts
+        """
+        with self._lock:
+            return {
+                "chunks": len(self._lengths),
+                "documents": len(self._files),
+                "terms": len(self._postings),
+                "average_chunk_terms": round(self._total_length / len(self._lengths), 1) if self._lengths else 0.0,
+                "path": self.path
+            }
+
+
+def get_lexical_index() -> LexicalIndex:
+    """
+    Get or create the lexical index instance (Singleton pattern)
+    
+    Returns:
+        LexicalIndex instance
+    """
+    global _lexical_index
+    
+    if _lexical_index is None:
+        with _lexical_index_lock:
+            if _lexical_index is None:
+                _lexical_index = LexicalIndex()
+    
+    return _lexical_index
@@ -0,0 +1,313 @@
+"""
+MCQ Generation
+Multiple choice question sets drawn from across a document
+
+Questions come from representative chunks: the document's chunk embeddings
+are clustered (k-means) and the chunks closest to each cluster centre form
+one group, so a set covers the whole document instead of its first pages.
+Each group is turned into a few questions by one LLM call; calls run in
+parallel at batch priority. Replies are parsed from the prompt's
+Q1:/A)/Correct Answer: format into structured questions, near-identical
+questions are dropped by embedding similarity, and the result is kept in
+the document's question bank (app.rag.question_bank) for repeat requests.
+"""
+
+import asyncio
+import hashlib
+import math
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.db.vector_store import get_document_chunks
+from app.rag.prompts import create_mcq_prompt
+from app.rag.question_bank import get_question_bank
+from app.utils.llm_scheduler import LLM_CONCURRENCY, PRIORITY_BATCH, LLMOverloadedError
+from app.utils.ollama_client import generate_chat_completion, generate_embeddings_batch
+
+
+# MCQ configuration
+MAX_MCQ_QUESTIONS = 100  # Largest set one request may ask for
+MCQ_QUESTIONS_PER_GROUP = 5  # Questions asked for per LLM call
+MCQ_CHUNKS_PER_GROUP = 2  # Chunks of context per LLM call
+MCQ_OVERSAMPLE = 1.3  # Extra questions requested to make up for malformed and duplicate ones
+MCQ_MAX_ROUNDS = 3  # Generation rounds before returning a short set
+MCQ_DUPLICATE_THRESHOLD = 0.92  # Cosine similarity above which two questions are duplicates
+MCQ_CONCURRENCY = LLM_CONCURRENCY  # Group generations sent to the scheduler at once
+MCQ_MAX_TOKENS = 1024
+MCQ_TEMPERATURE = 0.5
+KMEANS_ITERATIONS = 10
+
+_QUESTION_PATTERN = re.compile(r"^[\s*#]*Q(?:uestion)?\s*\d+\s*[:.)]\s*", re.IGNORECASE | re.MULTILINE)
+_OPTION_PATTERN = re.compile(r"^[\s*]*\(?([A-D])[).:]\s*(.+?)\s*$", re.MULTILINE)
+_ANSWER_PATTERN = re.compile(r"Correct\s+Answer\s*[:\-]?[\s*]*\(?([A-D])\b", re.IGNORECASE)
+_EXPLANATION_PATTERN = re.compile(r"Explanation\s*[:\-]\s*(.+)", re.IGNORECASE | re.DOTALL)
+
+# Generations per document are serialized so concurrent requests extend one bank
+_bank_locks: Dict[str, list] = {}  # file_id -> [lock, requests holding or waiting for it]
+
+
+@asynccontextmanager
+async def _bank_lock(file_id: str) -> AsyncIterator[None]:
+    """Hold a document's question bank lock; the entry is removed once no request uses it"""
+    entry = _bank_locks.setdefault(file_id, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _bank_locks[file_id]
+
+
+def parse_mcqs(text: str) -> List[Dict]:
+    """
+    Parse generated questions in the Q1:/A)/Correct Answer:/Explanation: format
+    
+    Questions without a stem, all four options or a valid answer letter are
+    skipped.
+    
+    Args:
+        text: LLM reply
+    
+    Returns:
+        List of questions with question, options (A-D), answer and explanation
+    """
+    questions = []
+    blocks = _QUESTION_PATTERN.split(text)[1:]
+    
+    for block in blocks:
+        first_option = _OPTION_PATTERN.search(block)
+        answer = _ANSWER_PATTERN.search(block)
+        if first_option is None or answer is None:
+            continue
+        
+        stem = " ".join(block[:first_option.start()].split()).strip("*# ")
+        options = {}
+        for letter, option in _OPTION_PATTERN.findall(block[:answer.start()]):
+            options.setdefault(letter.upper(), option.strip())
+        if not stem or len(options) != 4:
+            continue
+        
+        explanation = _EXPLANATION_PATTERN.search(block[answer.end():])
+        questions.append({
+            "question": stem,
+            "options": {letter: options[letter] for letter in "ABCD"},
+            "answer": answer.group(1).upper(),
+            "explanation": " ".join(explanation.group(1).split()) if explanation else ""
+        })
+    
+    return questions
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def _kmeans(vectors: np.ndarray, k: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Spherical k-means with k-means++ seeding over normalized vectors
+    
+    Returns:
+        Tuple of (cluster label per vector, normalized centroids)
+    """
+    rng = np.random.default_rng(seed)
+    chosen = [int(rng.integers(len(vectors)))]
+    distance = 1.0 - vectors @ vectors[chosen[0]]
+    for _ in range(1, k):
+        weights = np.clip(distance, 0.0, None) ** 2
+        total = weights.sum()
+        index = int(rng.choice(len(vectors), p=weights / total)) if total > 0 else int(rng.integers(len(vectors)))
+        chosen.append(index)
+        distance = np.minimum(distance, 1.0 - vectors @ vectors[index])
+    
+    centroids = vectors[chosen].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        labels = np.argmax(vectors @ centroids.T, axis=1)
+        for cluster in range(k):
+            members = vectors[labels == cluster]
+            if len(members):
+                centroids[cluster] = members.mean(axis=0)
+        centroids = _normalize_rows(centroids)
+    
+    return np.argmax(vectors @ centroids.T, axis=1), centroids
+
+
+def select_chunk_groups(
+    chunks: List[Dict],
+    groups: int,
+    chunks_per_group: int = MCQ_CHUNKS_PER_GROUP,
+    seed: int = 0
+) -> List[List[Dict]]:
+    """
+    Pick representative groups of chunks by clustering their embeddings
+    
+    Args:
+        chunks: Chunks with an "embedding"
+        groups: Number of groups wanted
+        chunks_per_group: Chunks closest to each cluster centre kept per group
+        seed: Seed for k-means++ initialization
+    
+    Returns:
+        List of groups (chunks in reading order); fewer than requested when the
+        document has fewer chunks
+    """
+    k = min(groups, len(chunks))
+    if k == 0:
+        return []
+    
+    vectors = _normalize_rows(np.asarray([chunk["embedding"] for chunk in chunks], dtype=np.float32))
+    labels, centroids = _kmeans(vectors, k, seed)
+    
+    selected = []
+    for cluster in range(k):
+        members = np.flatnonzero(labels == cluster)
+        if not len(members):
+            continue
+        closest = members[np.argsort(-(vectors[members] @ centroids[cluster]))[:chunks_per_group]]
+        selected.append(sorted((chunks[i] for i in closest), key=lambda c: c["metadata"].get("chunk_index", 0)))
+    
+    return selected
+
+
+async def _generate_group(group: List[Dict], semaphore: asyncio.Semaphore) -> List[Dict]:
+    """Generate and parse the questions for one group of chunks"""
+    prompt = create_mcq_prompt(group, MCQ_QUESTIONS_PER_GROUP)
+    async with semaphore:
+        reply = await generate_chat_completion(
+            prompt=prompt,
+            temperature=MCQ_TEMPERATURE,
+            max_tokens=MCQ_MAX_TOKENS,
+            priority=PRIORITY_BATCH
+        )
+    
+    pages = sorted({chunk["metadata"]["page_start"] for chunk in group if chunk["metadata"].get("page_start")})
+    source = {"chunk_ids": [chunk["id"] for chunk in group], "pages": pages}
+    return [{**question, "source": source} for question in parse_mcqs(reply)]
+
+
+def _question_text(question: Dict) -> str:
+    """Text compared for duplicates: the stem plus the correct option"""
+    return f"{question['question']} {question['options'][question['answer']]}"
+
+
+async def _deduplicate(
+    kept: List[Dict],
+    kept_vectors: Optional[np.ndarray],
+    candidates: List[Dict]
+) -> Tuple[List[Dict], Optional[np.ndarray], int]:
+    """
+    Add candidates that are not near-duplicates of kept questions (or each other)
+    
+    Returns:
+        Tuple of (kept questions, their normalized embeddings, duplicates dropped)
+    """
+    if not candidates:
+        return kept, kept_vectors, 0
+    
+    embeddings = await generate_embeddings_batch([_question_text(question) for question in candidates])
+    vectors = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+    duplicates = 0
+    
+    for question, vector in zip(candidates, vectors):
+        if kept_vectors is not None and len(kept_vectors) and float(np.max(kept_vectors @ vector)) >= MCQ_DUPLICATE_THRESHOLD:
+            duplicates += 1
+            continue
+        kept.append(question)
+        kept_vectors = vector[None, :] if kept_vectors is None else np.vstack([kept_vectors, vector])
+    
+    return kept, kept_vectors, duplicates
+
+
+async def generate_mcqs(file_id: str, num_questions: int = 5) -> Dict:
+    """
+    Generate a set of multiple choice questions for a document
+    
+    Served from the document's question bank when it holds enough questions;
+    otherwise only the missing questions are generated, from chunks not used
+    for the bank yet.
+    
+    Args:
+        file_id: Unique identifier of the document
+        num_questions: Number of questions wanted
+    
+    Returns:
+        Dictionary with questions (numbered, with source chunks and pages) and
+        generation statistics
+    
+    Raises:
+        LLMOverloadedError: If the scheduler rejects a generation
+        Exception: If the document has no indexed chunks or generation fails
+    """
+    async with _bank_lock(file_id):
+        try:
+            start = time.perf_counter()
+            bank = get_question_bank()
+            stored = await asyncio.to_thread(bank.get, file_id) or {"questions": [], "used_chunk_ids": []}
+            questions = stored["questions"]
+            from_bank = min(len(questions), num_questions)
+            bank.record_lookup(len(questions) >= num_questions)
+            
+            stats = {"from_bank": from_bank, "generated": 0, "duplicates_removed": 0, "llm_calls": 0}
+            if len(questions) < num_questions:
+                chunks = await asyncio.to_thread(get_document_chunks, file_id, True)
+                chunks = [chunk for chunk in chunks if chunk["text"].strip()]
+                if not chunks:
+                    raise Exception("Document not found or has no indexed text")
+                
+                used = set(stored["used_chunk_ids"])
+                kept_vectors = None
+                if questions:
+                    embeddings = await generate_embeddings_batch([_question_text(q) for q in questions])
+                    kept_vectors = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+                
+                semaphore = asyncio.Semaphore(MCQ_CONCURRENCY)
+                banked = len(questions)
+                for round_number in range(MCQ_MAX_ROUNDS):
+                    missing = num_questions - len(questions)
+                    if missing <= 0:
+                        break
+                    
+                    # Prefer chunks no earlier question was generated from
+                    available = [chunk for chunk in chunks if chunk["id"] not in used] or chunks
+                    groups = select_chunk_groups(
+                        available,
+                        math.ceil(missing * MCQ_OVERSAMPLE / MCQ_QUESTIONS_PER_GROUP),
+                        seed=len(used) + round_number
+                    )
+                    results = await asyncio.gather(*(_generate_group(group, semaphore) for group in groups))
+                    stats["llm_calls"] += len(groups)
+                    used.update(chunk["id"] for group in groups for chunk in group)
+                    
+                    candidates = [question for group_questions in results for question in group_questions]
+                    questions, kept_vectors, duplicates = await _deduplicate(questions, kept_vectors, candidates)
+                    stats["duplicates_removed"] += duplicates
+                
+                stats["generated"] = len(questions) - banked
+                for question in questions[banked:]:
+                    question["id"] = hashlib.sha256(_question_text(question).encode("utf-8")).hexdigest()[:12]
+                await asyncio.to_thread(bank.save, file_id, questions, sorted(used))
+            
+            total_ms = round((time.perf_counter() - start) * 1000, 1)
+            if stats["llm_calls"]:
+                print(f"❓ Generated {stats['generated']} MCQs for {file_id} with {stats['llm_calls']} LLM calls "
+                      f"({stats['duplicates_removed']} duplicates removed) in {total_ms} ms")
+            
+            return {
+                "file_id": file_id,
+                "requested_questions": num_questions,
+                "questions": [{"number": i, **question} for i, question in enumerate(questions[:num_questions], start=1)],
+                **stats,
+                "timing": {"total_ms": total_ms}
+            }
+        
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            print(f"❌ Error generating MCQs: {str(e)}")
+            raise Exception(f"Failed to generate MCQs: {str(e)}")
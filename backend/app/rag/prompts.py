@@ -3,6 +3,26 @@ Prompt Templates for LLM
 Optimized for Sri Lankan student tutoring
 """
 
+import re
+from typing import Dict, List, Optional
+
+from app.rag.chunking import estimate_tokens
+from app.rag.lexical_index import tokenize
+from app.utils.ollama_client import CHAT_CONTEXT_WINDOW
+
+
+# Prompt token budget (prefill time grows with every prompt token)
+ANSWER_TOKEN_RESERVE = 1024  # Context window space kept free for the answer
+PROMPT_TOKEN_BUDGET = CHAT_CONTEXT_WINDOW - ANSWER_TOKEN_RESERVE
+HISTORY_TURNS = 3  # Most recent conversation messages considered
+HISTORY_TOKEN_SHARE = 0.25  # Maximum share of the flexible budget used by history
+NON_LATIN_BYTES_PER_TOKEN = 3  # Chat-model BPE tokens for Sinhala/Tamil text: about one per character (3 UTF-8 bytes)
+MIN_CHUNK_TOKENS = 40  # Compressed chunks smaller than this are dropped instead
+MIN_SENTENCE_TOKENS = 4  # Fragments (headings, list numbers) are skipped when compressing
+COMPRESSION_RATIO = 0.5  # Target size of an extractively compressed chunk
+
+_SENTENCE_PATTERN = re.compile(r"[^.!?\n]+(?:[.!?]+|\n+|$)")
+
 # System prompt for the AI tutor
 SYSTEM_PROMPT = """You are an AI tutor for Sri Lankan students.
 
@@ -23,34 +43,180 @@ IMPORTANT RULES:
 Be patient, clear, and helpful. Your goal is to help students learn and understand."""
 
 
-def create_chat_prompt(question: str, context_chunks: list, conversation_history: list = None) -> str:
+def estimate_prompt_tokens(text: str) -> int:
     """
-    Create a complete prompt for the LLM
+    Conservative chat-model token estimate for prompt budgets
+    
+    estimate_tokens approximates the embedding model's WordPiece tokenizer,
+    which undercounts the chat model's BPE tokens for Sinhala and Tamil text
+    (whole words count as one piece or two, while BPE spends about one token per
+    character). Non-ASCII text is therefore counted by its UTF-8 size, and the
+    larger of the two estimates is used, so prompts do not overflow
+    CHAT_CONTEXT_WINDOW.
+    
+    Args:
+        text: Prompt text
+    
+    Returns:
+        Estimated number of chat-model tokens
+    """
+    tokens = estimate_tokens(text)
+    if text.isascii():
+        return tokens
+    
+    ascii_text = text.encode("ascii", "ignore").decode("ascii")
+    non_latin_bytes = len(text.encode("utf-8", "surrogatepass")) - len(ascii_text)
+    return max(tokens, estimate_tokens(ascii_text) + -(-non_latin_bytes // NON_LATIN_BYTES_PER_TOKEN))
+
+
+def _chunk_header(chunk: Dict) -> str:
+    page = f", page {chunk['page']}" if chunk.get('page') else ""
+    return f"[Document: {chunk.get('filename', 'Unknown')}{page}]"
+
+
+def compress_text(text: str, query: str, max_tokens: int) -> str:
+    """
+    Extractively compress text to a token budget
+    
+    Keeps the sentences that share the most terms with the query, in their
+    original order, until the budget is used.
+    
+    Args:
+        text: Text to compress
+        query: Question the text should answer
+        max_tokens: Token budget for the result
+        
+    Returns:
+        Compressed text (sentences joined, gaps marked with "...")
+    """
+    sentences = [m.group().strip() for m in _SENTENCE_PATTERN.finditer(text) if m.group().strip()]
+    query_terms = set(tokenize(query))
+    
+    scored = []
+    for position, sentence in enumerate(sentences):
+        tokens = estimate_prompt_tokens(sentence)
+        if tokens < MIN_SENTENCE_TOKENS:
+            continue
+        overlap = len(query_terms & set(tokenize(sentence)))
+        # Prefer query overlap, then earlier sentences (definitions tend to come first)
+        scored.append((-overlap, position, sentence, tokens))
+    
+    # Each kept sentence may be preceded by a gap marker
+    marker_tokens = estimate_prompt_tokens("...")
+    kept, used = [], 0
+    for _, position, sentence, tokens in sorted(scored):
+        if used + tokens + marker_tokens > max_tokens:
+            continue
+        kept.append((position, sentence))
+        used += tokens + marker_tokens
+    
+    kept.sort()
+    parts = []
+    for i, (position, sentence) in enumerate(kept):
+        if i > 0 and position != kept[i - 1][0] + 1:
+            parts.append("...")
+        parts.append(sentence)
+    return " ".join(parts)
+
+
+def _trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to roughly max_tokens, keeping the beginning"""
+    if estimate_prompt_tokens(text) <= max_tokens:
+        return text
+    
+    words = text.split()
+    kept, used = [], 0
+    for word in words:
+        used += estimate_prompt_tokens(word)
+        if used > max_tokens:
+            break
+        kept.append(word)
+    return " ".join(kept) + " ..."
+
+
+def build_chat_prompt(
+    question: str,
+    context_chunks: list,
+    conversation_history: Optional[list] = None,
+    token_budget: int = PROMPT_TOKEN_BUDGET
+) -> Dict:
+    """
+    Create a chat prompt that fits a token budget
+    
+    The system prompt and question are always included. The remaining budget
+    goes to conversation history (at most HISTORY_TOKEN_SHARE, newest
+    messages first) and then to context chunks in ranking order. When the
+    chunks do not fit, the lowest-ranked chunks are extractively compressed
+    first, and dropped if compression is not enough.
     
     Args:
         question: User's question
-        context_chunks: Relevant document chunks retrieved from vector store
+        context_chunks: Retrieved chunks, best first
         conversation_history: Previous messages in the conversation
+        token_budget: Maximum prompt tokens (approximate)
         
     Returns:
-        Formatted prompt string
+        Dictionary with the flattened prompt, the same content as chat
+        messages, the chunks actually used and a token breakdown (system, question, history, context, total, budget)
     """
-    # Format context from retrieved chunks
-    context_text = "\n\n".join([
-        f"[Document: {chunk.get('filename', 'Unknown')}]\n{chunk.get('text', '')}"
+    system_tokens = estimate_prompt_tokens(SYSTEM_PROMPT)
+    question_tokens = estimate_prompt_tokens(question)
+    scaffold_tokens = estimate_prompt_tokens("DOCUMENT CONTEXT: STUDENT QUESTION: ANSWER: Previous conversation:")
+    available = max(token_budget - system_tokens - question_tokens - scaffold_tokens, 0)
+    
+    # History: newest messages first, within its share of the budget
+    history_budget = int(available * HISTORY_TOKEN_SHARE)
+    history_messages: List[Dict] = []
+    history_tokens = 0
+    for msg in reversed((conversation_history or [])[-HISTORY_TURNS:]):
+        role = "assistant" if msg.get('role') == "assistant" else "user"
+        remaining = history_budget - history_tokens
+        if remaining <= 0:
+            break
+        content = _trim_to_tokens(msg.get('content', ''), remaining)
+        history_messages.insert(0, {"role": role, "content": content})
+        history_tokens += estimate_prompt_tokens(f"{role}: {content}")
+    
+    # Context: full chunks in ranking order, compressing from the lowest rank up
+    context_budget = available - history_tokens
+    entries = [
+        {"chunk": chunk, "text": chunk.get('text', ''), "header": _chunk_header(chunk)}
         for chunk in context_chunks
-    ])
+    ]
+    for entry in entries:
+        entry["tokens"] = estimate_prompt_tokens(entry["header"]) + estimate_prompt_tokens(entry["text"])
+    
+    compressed = 0
+    for entry in reversed(entries):
+        if sum(e["tokens"] for e in entries) <= context_budget:
+            break
+        header_tokens = estimate_prompt_tokens(entry["header"])
+        target = int((entry["tokens"] - header_tokens) * COMPRESSION_RATIO)
+        entry["text"] = compress_text(entry["text"], question, target)
+        entry["tokens"] = header_tokens + estimate_prompt_tokens(entry["text"])
+        entry["too_small"] = entry["tokens"] - header_tokens < MIN_CHUNK_TOKENS
+        compressed += 1
+    
+    best = entries[0] if entries else None
+    entries = [e for e in entries if not e.get("too_small")]
+    while entries and sum(e["tokens"] for e in entries) > context_budget:
+        entries.pop()  # Lowest-ranked first
     
-    # Build conversation history if provided
+    if best is not None and not entries:
+        # Not even one compressed chunk fits: squeeze the best one into the room left
+        header_tokens = estimate_prompt_tokens(best["header"])
+        best["text"] = compress_text(best["chunk"].get('text', ''), question, context_budget - header_tokens)
+        best["tokens"] = header_tokens + estimate_prompt_tokens(best["text"])
+        if best["tokens"] - header_tokens >= MIN_CHUNK_TOKENS:
+            entries = [best]
+    
+    context_text = "\n\n".join(f"{e['header']}\n{e['text']}" for e in entries)
     history_text = ""
-    if conversation_history:
-        history_text = "\n\nPrevious conversation:\n"
-        for msg in conversation_history[-3:]:  # Include last 3 exchanges
-            role = msg.get("role", "user")
-            content = msg.get("content", "")
-            history_text += f"{role.capitalize()}: {content}\n"
-    
-    # Construct full prompt
+    if history_messages:
+        history_text = "\n\nPrevious conversation:\n" + "".join(
+            f"{m['role'].capitalize()}: {m['content']}\n" for m in history_messages
+        )
+    
     prompt = f"""{SYSTEM_PROMPT}
 
 DOCUMENT CONTEXT:
@@ -63,15 +229,109 @@ STUDENT QUESTION:
 ANSWER:
 """
     
-    return prompt
+    # Document context matters more than old conversation turns
+    if context_chunks and not entries and history_messages:
+        return build_chat_prompt(question, context_chunks, None, token_budget)
+    
+    # Chat messages for /api/chat: the system message and earlier turns come
+    # first and stay byte-identical across turns, so Ollama reuses their
+    # cached prefill and only evaluates the new context and question
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}] + history_messages + [{
+        "role": "user",
+        "content": f"DOCUMENT CONTEXT:\n{context_text}\n\nSTUDENT QUESTION:\n{question}"
+    }]
+    
+    context_tokens = sum(e["tokens"] for e in entries)
+    return {
+        "prompt": prompt,
+        "messages": messages,
+        "chunks": [e["chunk"] for e in entries],
+        "tokens": {
+            "system": system_tokens,
+            "question": question_tokens,
+            "history": history_tokens,
+            "context": context_tokens,
+            "total": system_tokens + question_tokens + scaffold_tokens + history_tokens + context_tokens,
+            "budget": token_budget,
+            "chunks_compressed": compressed,
+            "chunks_dropped": len(context_chunks) - len(entries)
+        }
+    }
+
+
+def create_chat_prompt(question: str, context_chunks: list, conversation_history: list = None) -> str:
+    """
+    Create a complete prompt for the LLM
+    
+    Args:
+        question: User's question
+        context_chunks: Relevant document chunks retrieved from vector store
+        conversation_history: Previous messages in the conversation
+        
+    Returns:
+        Formatted prompt string, within PROMPT_TOKEN_BUDGET
+    """
+    return build_chat_prompt(question, context_chunks, conversation_history)["prompt"]
+
+
+def create_section_summary_prompt(section_text: str) -> str:
+    """
+    Create a prompt summarizing one section of a document (map step)
+    
+    Args:
+        section_text: Text of consecutive chunks
+        
+    Returns:
+        Formatted section summary prompt
+    """
+    return f"""You are an AI tutor helping Sri Lankan students understand their study materials.
+
+Summarize the following section of a document in a few short paragraphs or bullet points.
+Keep every key concept, definition, formula and important fact. Do not add information
+that is not in the section.
+
+SECTION:
+{section_text}
+
+SECTION SUMMARY:
+"""
+
+
+def create_combine_summaries_prompt(section_summaries: list) -> str:
+    """
+    Create a prompt merging consecutive section summaries (reduce step)
+    
+    Args:
+        section_summaries: Summaries of consecutive sections, in order
+        
+    Returns:
+        Formatted prompt
+    """
+    joined = "\n\n".join(f"Part {i}:\n{summary}" for i, summary in enumerate(section_summaries, start=1))
+    
+    return f"""You are an AI tutor helping Sri Lankan students understand their study materials.
+
+The following are summaries of consecutive parts of a document. Combine them into one
+summary of all parts, in order. Merge repeated points, and keep key concepts, definitions
+and formulas.
+
+PART SUMMARIES:
+{joined}
+
+COMBINED SUMMARY:
+"""
 
 
 def create_summarization_prompt(document_chunks: list, filename: str) -> str:
     """
     Create a prompt for document summarization
     
+    Used for the final pass of the map-reduce summarizer (app.rag.summarize),
+    where the chunks are a document small enough to fit in one prompt, or the
+    summaries of its sections.
+    
     Args:
-        document_chunks: All chunks from a specific document
+        document_chunks: Chunks (or section summaries) of a specific document
         filename: Name of the document
         
     Returns:
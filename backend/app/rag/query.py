@@ -3,113 +3,397 @@ RAG Query Engine
 Retrieves relevant chunks and generates answers using LLM
 """
 
-from typing import List, Dict, Optional
+import asyncio
+import time
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 
-from app.utils.ollama_client import generate_embeddings, generate_chat_completion
-from app.db.vector_store import get_vector_store
-from app.rag.prompts import create_chat_prompt
+from app.utils.ollama_client import (
+    generate_embeddings,
+    generate_chat_completion,
+    stream_chat_completion
+)
+from app.rag.retrieval import hybrid_search
+from app.rag.filters import normalize_filters, resolve_filters
+from app.rag.rerank import get_reranker, RERANK_CANDIDATES
+from app.rag.prompts import build_chat_prompt
+from app.rag.answer_cache import get_answer_cache
+from app.rag.coalescing import coalescing_key, get_request_coalescer
+from app.utils.llm_scheduler import LLMOverloadedError
+
+
+NO_DOCUMENTS_ANSWER = (
+    "I don't have any documents uploaded yet. Please upload some study materials "
+    "first so I can help answer your questions."
+)
+NO_MATCHING_DOCUMENTS_ANSWER = (
+    "None of your uploaded documents match the selected filters. Try widening "
+    "the filters or asking about all of your study materials."
+)
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+async def _rerank(question: str, candidates: List[Dict], max_results: int) -> List[Dict]:
+    """Rerank in a worker thread: model inference (and loading it) must not block the event loop"""
+    return await asyncio.to_thread(lambda: get_reranker().rerank(question, candidates, max_results))
+
+
+async def _retrieve_chunks(
+    question: str,
+    max_results: int,
+    timings: Optional[Dict] = None,
+    shards: Optional[List[str]] = None,
+    filters: Optional[Dict] = None
+) -> Tuple[List[float], List[Dict]]:
+    """
+    Embed the question and fetch the most relevant chunks
+    
+    Uses hybrid retrieval (BM25 keyword matches fused with vector similarity)
+    to over-fetch RERANK_CANDIDATES chunks, then keeps the best max_results
+    according to the configured reranker.
+    
+    Args:
+        question: User's question
+        max_results: Number of chunks to return
+        timings: Optional dictionary that receives per-stage latencies (ms)
+        shards: Subject/grade shards to search (all if None)
+        filters: Normalized retrieval filters (see app.rag.filters)
+    
+    Returns:
+        Tuple of (question embedding, list of chunk dictionaries).
+        The chunk list is empty if nothing is indexed or matches the filters.
+    """
+    timings = timings if timings is not None else {}
+    
+    scope = resolve_filters(filters, shards)
+    if scope is None:
+        print(f"🔍 No documents match the filters {filters}")
+        return [], []
+    
+    print(f"🔍 Processing question: {question[:100]}...")
+    start = time.perf_counter()
+    question_embedding = await generate_embeddings(question)
+    timings["embedding_ms"] = _elapsed_ms(start)
+    
+    print(f"📚 Searching vector database...")
+    # Index scans and the shard fan-out are blocking; keep them off the event loop
+    candidates = await asyncio.to_thread(
+        hybrid_search,
+        question,
+        question_embedding,
+        max(max_results, RERANK_CANDIDATES),
+        timings,
+        scope["shards"],
+        scope["where"],
+        scope["file_ids"]
+    )
+    
+    start = time.perf_counter()
+    chunks = await _rerank(question, candidates, max_results)
+    timings["rerank_ms"] = _elapsed_ms(start)
+    
+    print(f"   Found {len(chunks)} relevant chunks (reranked from {len(candidates)})")
+    return question_embedding, chunks
+
+
+def _format_sources(chunks: List[Dict]) -> List[Dict]:
+    """Convert retrieved chunks into source references for the response"""
+    return [
+        {
+            "filename": chunk["filename"],
+            "chunk_index": chunk["chunk_index"],
+            "page": chunk.get("page"),
+            "relevance_score": round(1 - chunk["distance"], 2),  # Convert distance to similarity
+            "preview": chunk["text"][:200] + "..." if len(chunk["text"]) > 200 else chunk["text"]
+        }
+        for chunk in chunks
+    ]
+
+
+def _estimate_confidence(sources: List[Dict]) -> str:
+    """Determine confidence based on average relevance of the sources"""
+    avg_relevance = sum(s["relevance_score"] for s in sources) / len(sources) if sources else 0
+    return "high" if avg_relevance > 0.7 else "medium" if avg_relevance > 0.4 else "low"
 
 
 async def query_documents(
     question: str,
     max_results: int = 3,
-    conversation_history: Optional[List[dict]] = None
+    conversation_history: Optional[List[dict]] = None,
+    shards: Optional[List[str]] = None,
+    filters: Optional[Dict] = None
 ) -> Dict:
     """
     Query the knowledge base using RAG
     
+    Concurrent requests with the same normalized question, max_results,
+    history, shards and filters share one in-flight computation (see app.rag.coalescing).
+    
+    Args:
+        question: User's question
+        max_results: Number of relevant chunks to retrieve
+        conversation_history: Previous conversation messages
+        shards: Subject/grade shards to search (all if None)
+        filters: Retrieval filters (file_ids, filenames, subjects, uploaded_after,
+            uploaded_before, page_from, page_to; see app.rag.filters)
+    
+    Returns:
+        Dictionary containing answer, source references, per-stage timing (ms)
+        and the prompt token breakdown
+    """
+    filters = normalize_filters(filters)
+    key = coalescing_key("ask", question, max_results, conversation_history, shards, filters)
+    return await get_request_coalescer().run(
+        key,
+        lambda: _answer_question(question, max_results, conversation_history, shards, filters)
+    )
+
+
+async def _answer_question(
+    question: str,
+    max_results: int = 3,
+    conversation_history: Optional[List[dict]] = None,
+    shards: Optional[List[str]] = None,
+    filters: Optional[Dict] = None
+) -> Dict:
+    """
+    Run the RAG pipeline for one question
+    
     Process:
     1. Generate embedding for the question
-    2. Retrieve top-k similar chunks from vector store
-    3. Construct prompt with context
-    4. Generate answer using LLM
-    5. Return answer with sources
+    2. Over-fetch candidates (keyword + vector search) and rerank to the top-k
+    3. Return a cached answer if a near-identical question used the same chunks
+    4. Construct prompt with context
+    5. Generate answer using LLM
+    6. Return answer with sources
     
     Args:
         question: User's question
         max_results: Number of relevant chunks to retrieve
         conversation_history: Previous conversation messages
-        
+        shards: Subject/grade shards to search (all if None)
+        filters: Retrieval filters (file_ids, filenames, subjects, uploaded_after,
+            uploaded_before, page_from, page_to; see app.rag.filters)
+    
     Returns:
-        Dictionary containing answer and source references
+        Dictionary containing answer, source references, per-stage timing (ms)
+        and the prompt token breakdown
     """
+    start = time.perf_counter()
+    timings: Dict = {}
+    
     try:
-        # Step 1: Generate embedding for the question
-        print(f"🔍 Processing question: {question[:100]}...")
-        question_embedding = await generate_embeddings(question)
+        # Steps 1-2: Embed the question, retrieve and rerank relevant chunks
+        question_embedding, chunks = await _retrieve_chunks(question, max_results, timings, shards, filters)
+        timings["retrieval_ms"] = _elapsed_ms(start)
         
-        # Step 2: Retrieve relevant chunks from vector store
-        print(f"📚 Searching vector database...")
-        vector_store = get_vector_store()
-        
-        results = vector_store.query(
-            query_embeddings=[question_embedding],
-            n_results=max_results
-        )
-        
-        # Extract chunks and metadata
-        if not results or not results.get('documents') or len(results['documents'][0]) == 0:
+        if not chunks:
             return {
-                "answer": "I don't have any documents uploaded yet. Please upload some study materials first so I can help answer your questions.",
+                "answer": NO_MATCHING_DOCUMENTS_ANSWER if filters else NO_DOCUMENTS_ANSWER,
                 "sources": [],
-                "confidence": "none"
+                "confidence": "none",
+                "timing": {**timings, "total_ms": _elapsed_ms(start)}
             }
         
-        # Format retrieved chunks
-        chunks = []
-        for i, doc in enumerate(results['documents'][0]):
-            metadata = results['metadatas'][0][i] if results.get('metadatas') else {}
-            distance = results['distances'][0][i] if results.get('distances') else 0
-            
-            chunks.append({
-                "text": doc,
-                "filename": metadata.get("filename", "Unknown"),
-                "chunk_index": metadata.get("chunk_index", i),
-                "distance": distance
-            })
-        
-        print(f"   Found {len(chunks)} relevant chunks")
-        
-        # Step 3: Construct prompt with context
-        prompt = create_chat_prompt(
+        # Step 3: Serve near-identical questions from the answer cache
+        answer_cache = get_answer_cache()
+        cached = answer_cache.lookup(question_embedding, chunks, conversation_history)
+        if cached is not None:
+            print(f"⚡ Answer served from cache (similarity: {cached['similarity']})")
+            return {**cached, "timing": {**timings, "total_ms": _elapsed_ms(start)}}
+        
+        # Step 4: Construct prompt with context, within the token budget
+        built = build_chat_prompt(
             question=question,
             context_chunks=chunks,
             conversation_history=conversation_history or []
         )
+        print(f"   Prompt tokens: {built['tokens']}")
         
-        # Step 4: Generate answer using LLM
+        # Step 5: Generate answer using LLM
         print(f"🤖 Generating answer with Ollama...")
-        answer = await generate_chat_completion(prompt)
-        
-        # Step 5: Prepare response with sources
-        sources = [
-            {
-                "filename": chunk["filename"],
-                "chunk_index": chunk["chunk_index"],
-                "relevance_score": round(1 - chunk["distance"], 2),  # Convert distance to similarity
-                "preview": chunk["text"][:200] + "..." if len(chunk["text"]) > 200 else chunk["text"]
-            }
-            for chunk in chunks
-        ]
+        generation_start = time.perf_counter()
+        answer = await generate_chat_completion(messages=built["messages"])
+        timings["generation_ms"] = _elapsed_ms(generation_start)
         
-        # Determine confidence based on relevance scores
-        avg_relevance = sum(s["relevance_score"] for s in sources) / len(sources) if sources else 0
-        confidence = "high" if avg_relevance > 0.7 else "medium" if avg_relevance > 0.4 else "low"
+        # Step 6: Prepare response with the sources that made it into the prompt
+        sources = _format_sources(built["chunks"])
+        confidence = _estimate_confidence(sources)
         
         print(f"✅ Answer generated (confidence: {confidence})")
         
-        return {
+        result = {
             "answer": answer,
             "sources": sources,
             "confidence": confidence
         }
+        answer_cache.store(question_embedding, chunks, result, conversation_history)
         
+        timings["total_ms"] = _elapsed_ms(start)
+        print(f"   Timing: {timings}")
+        return {**result, "timing": timings, "prompt_tokens": built["tokens"]}
+    
+    except LLMOverloadedError:
+        raise
     except Exception as e:
         print(f"❌ Error in query pipeline: {str(e)}")
         raise Exception(f"Failed to process query: {str(e)}")
 
 
-async def search_documents(query: str, max_results: int = 10) -> List[Dict]:
+async def stream_query_documents(
+    question: str,
+    max_results: int = 3,
+    conversation_history: Optional[List[dict]] = None,
+    shards: Optional[List[str]] = None,
+    filters: Optional[Dict] = None
+) -> AsyncIterator[Dict]:
+    """
+    Query the knowledge base using RAG, streaming the answer as it is generated
+    
+    Concurrent identical requests share one generation; requests that join
+    late first receive the events produced so far (see app.rag.coalescing).
+    Events are described in _stream_answer.
+    
+    Args:
+        question: User's question
+        max_results: Number of relevant chunks to retrieve
+        conversation_history: Previous conversation messages
+        shards: Subject/grade shards to search (all if None)
+        filters: Retrieval filters (file_ids, filenames, subjects, uploaded_after,
+            uploaded_before, page_from, page_to; see app.rag.filters)
+    
+    Yields:
+        Event dictionaries for the streaming response
+    """
+    filters = normalize_filters(filters)
+    key = coalescing_key("stream", question, max_results, conversation_history, shards, filters)
+    async for event in get_request_coalescer().stream(
+        key,
+        lambda: _stream_answer(question, max_results, conversation_history, shards, filters)
+    ):
+        yield event
+
+
+async def _stream_answer(
+    question: str,
+    max_results: int = 3,
+    conversation_history: Optional[List[dict]] = None,
+    shards: Optional[List[str]] = None,
+    filters: Optional[Dict] = None
+) -> AsyncIterator[Dict]:
+    """
+    Run the RAG pipeline for one question, yielding events as the answer is generated
+    
+    Yields event dictionaries in this order:
+    - {"type": "sources", "sources": [...]} once retrieval finishes
+    - {"type": "token", "content": "..."} for every generated fragment
+    - {"type": "done", "confidence": "...", "timing": {...}} at the end
+    
+    Cached answers are sent as a single token event with "cached": true on "done".
+    
+    Args:
+        question: User's question
+        max_results: Number of relevant chunks to retrieve
+        conversation_history: Previous conversation messages
+        shards: Subject/grade shards to search (all if None)
+        filters: Retrieval filters (file_ids, filenames, subjects, uploaded_after,
+            uploaded_before, page_from, page_to; see app.rag.filters)
+    
+    Yields:
+        Event dictionaries for the streaming response
+    """
+    start = time.perf_counter()
+    timings: Dict = {}
+    
+    try:
+        question_embedding, chunks = await _retrieve_chunks(question, max_results, timings, shards, filters)
+        timings["retrieval_ms"] = _elapsed_ms(start)
+        
+        if not chunks:
+            yield {"type": "sources", "sources": []}
+            yield {"type": "token", "content": NO_MATCHING_DOCUMENTS_ANSWER if filters else NO_DOCUMENTS_ANSWER}
+            yield {
+                "type": "done",
+                "confidence": "none",
+                "timing": {**timings, "total_ms": _elapsed_ms(start)}
+            }
+            return
+        
+        answer_cache = get_answer_cache()
+        cached = answer_cache.lookup(question_embedding, chunks, conversation_history)
+        if cached is not None:
+            print(f"⚡ Answer served from cache (similarity: {cached['similarity']})")
+            yield {"type": "sources", "sources": cached["sources"]}
+            yield {"type": "token", "content": cached["answer"]}
+            yield {
+                "type": "done",
+                "confidence": cached["confidence"],
+                "cached": True,
+                "timing": {**timings, "total_ms": _elapsed_ms(start)}
+            }
+            return
+        
+        built = build_chat_prompt(
+            question=question,
+            context_chunks=chunks,
+            conversation_history=conversation_history or []
+        )
+        
+        # Send sources before generation so the client can render them immediately
+        sources = _format_sources(built["chunks"])
+        yield {"type": "sources", "sources": sources}
+        
+        print(f"🤖 Streaming answer from Ollama...")
+        generation_start = time.perf_counter()
+        first_token_ms = None
+        tokens = []
+        
+        async for token in stream_chat_completion(messages=built["messages"]):
+            if first_token_ms is None:
+                first_token_ms = _elapsed_ms(start)
+            tokens.append(token)
+            yield {"type": "token", "content": token}
+        
+        confidence = _estimate_confidence(sources)
+        print(f"✅ Answer streamed (confidence: {confidence})")
+        
+        # Only complete answers are cached
+        answer_cache.store(
+            question_embedding,
+            chunks,
+            {"answer": "".join(tokens), "sources": sources, "confidence": confidence},
+            conversation_history
+        )
+        
+        yield {
+            "type": "done",
+            "confidence": confidence,
+            "cached": False,
+            "prompt_tokens": built["tokens"],
+            "timing": {
+                **timings,
+                "first_token_ms": first_token_ms,
+                "generation_ms": _elapsed_ms(generation_start),
+                "total_ms": _elapsed_ms(start),
+                "tokens": len(tokens)
+            }
+        }
+    
+    except LLMOverloadedError:
+        raise
+    except Exception as e:
+        print(f"❌ Error in streaming query pipeline: {str(e)}")
+        raise Exception(f"Failed to process query: {str(e)}")
+
+
+async def search_documents(
+    query: str,
+    max_results: int = 10,
+    shards: Optional[List[str]] = None,
+    filters: Optional[Dict] = None
+) -> List[Dict]:
     """
     Search for relevant document chunks without generating an answer
     Useful for document exploration and finding specific information
@@ -117,37 +401,47 @@ async def search_documents(query: str, max_results: int = 10) -> List[Dict]:
     Args:
         query: Search query
         max_results: Maximum number of results to return
-        
+        shards: Subject/grade shards to search (all if None)
+        filters: Retrieval filters (file_ids, filenames, subjects, uploaded_after,
+            uploaded_before, page_from, page_to; see app.rag.filters)
+    
     Returns:
         List of relevant document chunks with metadata
     """
     try:
+        scope = resolve_filters(normalize_filters(filters), shards)
+        if scope is None:
+            return []
+        
         # Generate embedding for search query
         query_embedding = await generate_embeddings(query)
         
-        # Search vector store
-        vector_store = get_vector_store()
-        results = vector_store.query(
-            query_embeddings=[query_embedding],
-            n_results=max_results
+        # Search lexical index and vector store (in a worker thread), then rerank
+        candidates = await asyncio.to_thread(
+            hybrid_search,
+            query,
+            query_embedding,
+            max(max_results, RERANK_CANDIDATES),
+            shards=scope["shards"],
+            where=scope["where"],
+            file_ids=scope["file_ids"]
         )
+        chunks = await _rerank(query, candidates, max_results)
         
         # Format results
-        search_results = []
-        if results and results.get('documents'):
-            for i, doc in enumerate(results['documents'][0]):
-                metadata = results['metadatas'][0][i] if results.get('metadatas') else {}
-                distance = results['distances'][0][i] if results.get('distances') else 0
-                
-                search_results.append({
-                    "text": doc,
-                    "filename": metadata.get("filename", "Unknown"),
-                    "chunk_index": metadata.get("chunk_index", i),
-                    "relevance_score": round(1 - distance, 2)
-                })
+        search_results = [
+            {
+                "text": chunk["text"],
+                "filename": chunk["filename"],
+                "chunk_index": chunk["chunk_index"],
+                "page": chunk["page"],
+                "relevance_score": round(1 - chunk["distance"], 2)
+            }
+            for chunk in chunks
+        ]
         
         return search_results
-        
+    
     except Exception as e:
         print(f"❌ Error in document search: {str(e)}")
         raise Exception(f"Search failed: {str(e)}")
@@ -0,0 +1,140 @@
+"""
+Question Bank
+Per-document store of generated multiple choice questions
+
+Generating a set of MCQs takes one LLM call per group of chunks, so every
+valid, de-duplicated question is kept per document in SQLite together with
+the chunks it was generated from. Repeat requests are served from the bank,
+and larger requests only generate the missing questions from chunks that
+have not been used yet. Banks are removed when their document is deleted;
+a re-uploaded document with different content has a new file_id.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+
+# Bank configuration
+QUESTION_BANK_PATH = "data/question_bank.sqlite3"
+
+# Global bank instance
+_question_bank = None
+
+
+class QuestionBank:
+    """
+    SQLite-backed question banks, one row per document
+    
+    Args:
+        path: SQLite database file
+    """
+    
+    def __init__(self, path: str = QUESTION_BANK_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS question_banks (
+                file_id TEXT PRIMARY KEY,
+                questions TEXT NOT NULL,
+                used_chunk_ids TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+    
+    def get(self, file_id: str) -> Optional[Dict]:
+        """
+        Fetch the question bank of a document
+        
+        Returns:
+            Dictionary with questions and used_chunk_ids, or None if the
+            document has no bank yet
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT questions, used_chunk_ids FROM question_banks WHERE file_id = ?",
+                (file_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"questions": json.loads(row[0]), "used_chunk_ids": json.loads(row[1])}
+    
+    def record_lookup(self, hit: bool):
+        """Count a request served entirely from a bank (hit) or not"""
+        self._stats["hits" if hit else "misses"] += 1
+    
+    def save(self, file_id: str, questions: List[Dict], used_chunk_ids: List[str]):
+        """Replace the question bank of a document"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO question_banks (file_id, questions, used_chunk_ids, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (file_id, json.dumps(questions, ensure_ascii=False), json.dumps(used_chunk_ids), time.time())
+            )
+            self._conn.commit()
+    
+    def remove(self, file_ids: Sequence[str]) -> int:
+        """
+        Delete the question banks of documents
+        
+        Args:
+            file_ids: Unique identifiers of the documents
+        
+        Returns:
+            Number of banks removed
+        """
+        with self._lock:
+            cursor = self._conn.executemany(
+                "DELETE FROM question_banks WHERE file_id = ?",
+                [(file_id,) for file_id in file_ids]
+            )
+            self._conn.commit()
+            return cursor.rowcount
+    
+    def stats(self) -> Dict:
+        """
+        Get question bank statistics
+        
+        Returns:
+            Dictionary with bank and question counts and hit/miss counters
+        """
+        with self._lock:
+            banks, questions = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(json_array_length(questions)), 0) FROM question_banks"
+            ).fetchone()
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "banks": banks,
+            "questions": questions,
+            "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0
+        }
+
+
+def get_question_bank() -> QuestionBank:
+    """
+    Get or create the question bank instance (Singleton pattern)
+    
+    Returns:
+        QuestionBank instance
+    """
+    global _question_bank
+    
+    if _question_bank is None:
+        _question_bank = QuestionBank()
+    
+    return _question_bank
@@ -0,0 +1,203 @@
+"""
+Reranking
+Re-scores over-fetched retrieval candidates before they go into the prompt
+
+Retrieval fetches RERANK_CANDIDATES chunks; a reranker re-scores them and
+keeps the best max_results. Reranking runs in a worker thread (see
+app.rag.query), so a slow model never blocks the event loop. Better precision in the top few chunks lets the
+prompt carry fewer, more relevant chunks, which is what LLM latency scales
+with. Rerankers are selected by name (RERANKER) and all run on the CPU:
+
+- "none": keep the retrieval order
+- "lexical": query term coverage blended with the retrieval rank
+- "mmr": lexical relevance with maximal-marginal-relevance diversity, so
+  near-duplicate chunks (overlapping windows, repeated pages) do not crowd
+  out other evidence
+- "cross-encoder": a small local cross-encoder (requires the optional
+  sentence-transformers package)
+"""
+
+import threading
+from typing import Dict, List, Set
+
+from app.rag.lexical_index import tokenize
+
+
+# Reranking configuration
+RERANKER = "mmr"  # none, lexical, mmr or cross-encoder
+RERANK_CANDIDATES = 12  # Chunks fetched from retrieval before reranking
+RETRIEVAL_RANK_WEIGHT = 0.5  # Share of the lexical score taken from the retrieval order
+MMR_LAMBDA = 0.7  # Relevance vs. diversity trade-off (1.0 = relevance only)
+CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+# Global reranker instance
+_reranker = None
+_reranker_lock = threading.Lock()  # Rerankers are created from worker threads
+
+
+def _coverage(query_terms: Set[str], chunk_terms: Set[str]) -> float:
+    """Share of distinct query terms that occur in the chunk"""
+    if not query_terms:
+        return 0.0
+    return len(query_terms & chunk_terms) / len(query_terms)
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class Reranker:
+    """
+    Base reranker: keeps the retrieval order
+    
+    Subclasses override score() or rerank().
+    """
+    
+    name = "none"
+    
+    def score(self, query: str, chunks: List[Dict]) -> List[float]:
+        """Relevance score per chunk (higher is better); defaults to retrieval order"""
+        count = len(chunks)
+        return [1.0 - rank / count for rank in range(count)]
+    
+    def rerank(self, query: str, chunks: List[Dict], top_k: int) -> List[Dict]:
+        """
+        Re-order candidates and keep the best
+        
+        Args:
+            query: User's question
+            chunks: Retrieval candidates, best first
+            top_k: Number of chunks to keep
+        
+        Returns:
+            Up to top_k chunks with a "rerank_score" field, best first
+        """
+        if not chunks:
+            return []
+        
+        scores = self.score(query, chunks)
+        order = sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)
+        return [{**chunks[i], "rerank_score": round(scores[i], 4)} for i in order[:top_k]]
+
+
+class LexicalReranker(Reranker):
+    """Blends query term coverage with the retrieval rank"""
+    
+    name = "lexical"
+    
+    def score(self, query: str, chunks: List[Dict]) -> List[float]:
+        query_terms = set(tokenize(query))
+        rank_scores = super().score(query, chunks)
+        return [
+            (1 - RETRIEVAL_RANK_WEIGHT) * _coverage(query_terms, set(tokenize(chunk["text"])))
+            + RETRIEVAL_RANK_WEIGHT * rank_score
+            for chunk, rank_score in zip(chunks, rank_scores)
+        ]
+
+
+class MMRReranker(LexicalReranker):
+    """
+    Lexical relevance with maximal-marginal-relevance selection
+    
+    Args:
+        diversity_lambda: Weight of relevance against redundancy
+    """
+    
+    name = "mmr"
+    
+    def __init__(self, diversity_lambda: float = MMR_LAMBDA):
+        self.diversity_lambda = diversity_lambda
+    
+    def rerank(self, query: str, chunks: List[Dict], top_k: int) -> List[Dict]:
+        if not chunks:
+            return []
+        
+        relevance = self.score(query, chunks)
+        term_sets = [set(tokenize(chunk["text"])) for chunk in chunks]
+        remaining = list(range(len(chunks)))
+        selected: List[int] = []
+        selected_scores: List[float] = []
+        
+        while remaining and len(selected) < top_k:
+            best, best_score = None, None
+            for i in remaining:
+                redundancy = max((_jaccard(term_sets[i], term_sets[j]) for j in selected), default=0.0)
+                mmr = self.diversity_lambda * relevance[i] - (1 - self.diversity_lambda) * redundancy
+                if best_score is None or mmr > best_score:
+                    best, best_score = i, mmr
+            selected.append(best)
+            selected_scores.append(best_score)
+            remaining.remove(best)
+        
+        return [
+            {**chunks[i], "rerank_score": round(score, 4)}
+            for i, score in zip(selected, selected_scores)
+        ]
+
+
+class CrossEncoderReranker(Reranker):
+    """
+    Scores (query, chunk) pairs with a local cross-encoder model
+    
+    Args:
+        model_name: Hugging Face model name or local path
+    """
+    
+    name = "cross-encoder"
+    
+    def __init__(self, model_name: str = CROSS_ENCODER_MODEL):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError:
+            raise Exception(
+                "The cross-encoder reranker requires sentence-transformers: "
+                "pip install sentence-transformers"
+            )
+        
+        print(f"🔧 Loading cross-encoder {model_name}")
+        self.model = CrossEncoder(model_name, device="cpu")
+    
+    def score(self, query: str, chunks: List[Dict]) -> List[float]:
+        return [float(s) for s in self.model.predict([(query, chunk["text"]) for chunk in chunks])]
+
+
+_RERANKERS = {
+    Reranker.name: Reranker,
+    LexicalReranker.name: LexicalReranker,
+    MMRReranker.name: MMRReranker,
+    CrossEncoderReranker.name: CrossEncoderReranker
+}
+
+
+def create_reranker(name: str) -> Reranker:
+    """
+    Create a reranker by name
+    
+    Args:
+        name: One of none, lexical, mmr, cross-encoder
+    
+    Returns:
+        Reranker instance
+    """
+    if name not in _RERANKERS:
+        raise ValueError(f"Unknown reranker '{name}', expected one of: {', '.join(_RERANKERS)}")
+    return _RERANKERS[name]()
+
+
+def get_reranker() -> Reranker:
+    """
+    Get or create the configured reranker (Singleton pattern)
+    
+    Returns:
+        Reranker instance
+    """
+    global _reranker
+    
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = create_reranker(RERANKER)
+    
+    return _reranker
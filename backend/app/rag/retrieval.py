@@ -0,0 +1,385 @@
+"""
+Hybrid Retrieval
+Combines BM25 lexical matches with dense vector similarity
+
+Both retrievers rank candidates independently and the rankings are merged
+with reciprocal-rank fusion (RRF), which needs no score calibration between
+BM25 and embedding distances. The lexical lookup is an in-memory index probe,
+so when it already finds candidates the dense query only has to fetch the
+final number of results instead of a wider candidate set.
+
+The dense side queries ChromaDB or, when VECTOR_SEARCH_BACKEND is "numpy",
+the in-process vector index (app.db.vector_index). Queries can be scoped to
+subject/grade shards; the dense search fans out to every selected shard
+concurrently and the shards' hits are merged into one global top-k by
+distance (the metric is the same in every shard), while the lexical index
+only ranks chunks of the selected shards.
+
+Metadata filters (see app.rag.filters) are passed to the vector stores as a
+`where` filter, so the nearest-neighbour search only considers matching
+chunks; lexical hits are restricted to the matching documents and checked
+against the same filter.
+
+Chunks of documents that are not fully ingested (still processing, or failed
+part-way and waiting to be resumed) are dropped before fusion, so answers
+never cite a partial document.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Collection, Dict, List, Optional, Sequence, Set
+
+import numpy as np
+
+from app.db.vector_store import EMBEDDINGS_NORMALIZED, get_vector_store, list_shards
+from app.db.vector_index import get_vector_index, vector_index_enabled, vector_index_exists
+from app.db.document_catalog import get_document_catalog
+from app.rag.lexical_index import get_lexical_index
+
+
+# Retrieval configuration
+HYBRID_SEARCH_ENABLED = True
+RRF_K = 60  # Damping constant from the original RRF paper
+LEXICAL_CANDIDATES = 20  # BM25 hits considered for fusion
+DENSE_CANDIDATES = 10  # Dense hits fetched when the lexical index finds nothing
+SHARD_QUERY_WORKERS = 8  # Shards searched concurrently by one query
+
+# Threads for shard fan-out (ChromaDB and NumPy release the GIL while searching)
+_shard_executor = ThreadPoolExecutor(max_workers=SHARD_QUERY_WORKERS, thread_name_prefix="shard-query")
+
+
+def _squared_l2(a: List[float], b: List[float]) -> float:
+    """Distance in the collection's metric (ChromaDB's default squared L2)"""
+    return float(sum((x - y) ** 2 for x, y in zip(a, b)))
+
+
+def _chunk_from(chunk_id: str, document: str, metadata: Optional[Dict], distance: float) -> Dict:
+    metadata = metadata or {}
+    return {
+        "id": chunk_id,
+        "file_id": metadata.get("file_id"),
+        "text": document,
+        "filename": metadata.get("filename", "Unknown"),
+        "chunk_index": metadata.get("chunk_index", 0),
+        "page": metadata.get("page_start"),
+        "distance": distance
+    }
+
+
+def _dense_search(shard: str, query_embedding: List[float], count: int, where: Optional[Dict] = None) -> List[Dict]:
+    """Nearest chunks of one shard (matching the metadata filter), closest first"""
+    if vector_index_enabled():
+        vector_index = get_vector_index(shard)
+        hits = vector_index.search(query_embedding, count, where=where)
+        stored = vector_index.get([chunk_id for chunk_id, _ in hits])
+        return [
+            _chunk_from(chunk_id, stored[chunk_id]["document"], stored[chunk_id]["metadata"], distance)
+            for chunk_id, distance in hits
+            if chunk_id in stored
+        ]
+    
+    results = get_vector_store(shard).query(
+        query_embeddings=[query_embedding],
+        n_results=count,
+        where=where
+    )
+    
+    chunks = []
+    if results and results.get('ids') and results['ids'][0]:
+        for rank, chunk_id in enumerate(results['ids'][0]):
+            metadata = results['metadatas'][0][rank] if results.get('metadatas') else {}
+            distance = results['distances'][0][rank] if results.get('distances') else 0
+            chunks.append(_chunk_from(chunk_id, results['documents'][0][rank], metadata, distance))
+    return chunks
+
+
+def _matching_ids(shard: str, chunk_ids: List[str], where: Dict) -> Set[str]:
+    """IDs of the given chunks of one shard that match a metadata filter"""
+    if vector_index_enabled():
+        return get_vector_index(shard).filter_ids(chunk_ids, where)
+    return set(get_vector_store(shard).get(ids=chunk_ids, where=where, include=[]).get('ids') or [])
+
+
+def _fetch_chunks(shard: str, chunk_ids: List[str], query_embedding: List[float]) -> Dict[str, Dict]:
+    """Load chunks of one shard by ID and score them in the same distance metric"""
+    chunks = {}
+    if vector_index_enabled():
+        for chunk_id, stored in get_vector_index(shard).get(chunk_ids, include_embeddings=True).items():
+            chunks[chunk_id] = _chunk_from(
+                chunk_id,
+                stored["document"],
+                stored["metadata"],
+                _squared_l2(query_embedding, stored["embedding"])
+            )
+        return chunks
+    
+    extra = get_vector_store(shard).get(ids=chunk_ids, include=["documents", "metadatas", "embeddings"])
+    for i, chunk_id in enumerate(extra.get('ids') or []):
+        chunks[chunk_id] = _chunk_from(
+            chunk_id,
+            extra['documents'][i],
+            extra['metadatas'][i],
+            _squared_l2(query_embedding, extra['embeddings'][i])
+        )
+    return chunks
+
+
+def _group_by_shard(chunk_ids: List[str]) -> Dict[str, List[str]]:
+    """Group lexical index chunk IDs by the shard that stores them"""
+    by_shard: Dict[str, List[str]] = {}
+    for chunk_id, shard in get_lexical_index().chunk_shards(chunk_ids).items():
+        by_shard.setdefault(shard, []).append(chunk_id)
+    return by_shard
+
+
+def hybrid_search(
+    query: str,
+    query_embedding: List[float],
+    max_results: int,
+    timings: Optional[Dict] = None,
+    shards: Optional[Sequence[str]] = None,
+    where: Optional[Dict] = None,
+    file_ids: Optional[Collection[str]] = None
+) -> List[Dict]:
+    """
+    Retrieve chunks by fusing lexical and dense rankings
+    
+    Args:
+        query: Query text (for the lexical index)
+        query_embedding: Query embedding (for the vector store)
+        max_results: Number of chunks to return
+        timings: Optional dictionary that receives lexical_ms, dense_ms and fusion_ms
+        shards: Shards to search (every shard if None or empty)
+        where: Metadata filter chunks must match (ChromaDB syntax, see app.rag.filters)
+        file_ids: Only rank chunks of these documents lexically (all if None)
+    
+    Returns:
+        List of chunk dictionaries (id, file_id, text, filename, chunk_index,
+        page, distance, rrf_score), best first
+    """
+    timings = timings if timings is not None else {}
+    searched = list(dict.fromkeys(shards)) if shards else list_shards()
+    
+    start = time.perf_counter()
+    lexical_hits = get_lexical_index().search(
+        query,
+        limit=LEXICAL_CANDIDATES,
+        shards=set(searched) if shards else None,
+        file_ids=file_ids
+    ) if HYBRID_SEARCH_ENABLED else []
+    if lexical_hits and where:
+        matching: Set[str] = set()
+        for shard, chunk_ids in _group_by_shard([chunk_id for chunk_id, _ in lexical_hits]).items():
+            matching |= _matching_ids(shard, chunk_ids, where)
+        lexical_hits = [hit for hit in lexical_hits if hit[0] in matching]
+    timings["lexical_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    
+    # Lexical hits cover exact-term matches, so the dense side only needs the final count
+    dense_count = max_results if lexical_hits else max(max_results, DENSE_CANDIDATES)
+    
+    # Every shard returns its own top dense_count, so the global top dense_count is among them
+    start = time.perf_counter()
+    if len(searched) == 1:
+        shard_hits = [_dense_search(searched[0], query_embedding, dense_count, where)]
+    else:
+        shard_hits = list(_shard_executor.map(
+            lambda shard: _dense_search(shard, query_embedding, dense_count, where),
+            searched
+        ))
+    dense_hits = sorted((chunk for hits in shard_hits for chunk in hits), key=lambda chunk: chunk["distance"])
+    timings["dense_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    
+    start = time.perf_counter()
+    lexical_files = get_lexical_index().chunk_files([chunk_id for chunk_id, _ in lexical_hits])
+    unfinished = set(get_document_catalog().unfinished(
+        [chunk["file_id"] for chunk in dense_hits] + list(lexical_files.values())
+    ))
+    if unfinished:
+        dense_hits = [chunk for chunk in dense_hits if chunk["file_id"] not in unfinished]
+        lexical_hits = [hit for hit in lexical_hits if lexical_files.get(hit[0]) not in unfinished]
+    
+    chunks: Dict[str, Dict] = {}
+    fused: Dict[str, float] = {}
+    
+    for rank, chunk in enumerate(dense_hits[:dense_count]):
+        chunks[chunk["id"]] = chunk
+        fused[chunk["id"]] = 1.0 / (RRF_K + rank + 1)
+    
+    for rank, (chunk_id, _) in enumerate(lexical_hits):
+        fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+    
+    selected = sorted(fused, key=fused.get, reverse=True)[:max_results]
+    
+    # Load lexical-only winners from their shards (unless a shard returned them past the cut)
+    for chunk in dense_hits[dense_count:]:
+        if chunk["id"] in fused:
+            chunks[chunk["id"]] = chunk
+    missing = [chunk_id for chunk_id in selected if chunk_id not in chunks]
+    for shard, chunk_ids in _group_by_shard(missing).items():
+        chunks.update(_fetch_chunks(shard, chunk_ids, query_embedding))
+    
+    ranked = []
+    for chunk_id in selected:
+        if chunk_id in chunks:  # Skip index entries whose vectors are gone
+            ranked.append({**chunks[chunk_id], "rrf_score": round(fused[chunk_id], 5)})
+    
+    timings["fusion_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return ranked
+
+
+def sync_lexical_index(batch_size: int = 1000) -> int:
+    """
+    Index chunks that are in the vector store but missing from the lexical index
+    
+    Runs at startup so documents ingested before the lexical index existed
+    become searchable by keyword.
+    
+    Args:
+        batch_size: Chunks read from the vector store per request
+    
+    Returns:
+        Number of chunks indexed
+    """
+    lexical_index = get_lexical_index()
+    shards = list_shards()
+    
+    if lexical_index.stats()["chunks"] >= sum(get_vector_store(shard).count() for shard in shards):
+        return 0
+    
+    indexed = 0
+    for shard in shards:
+        vector_store = get_vector_store(shard)
+        offset = 0
+        while True:
+            batch = vector_store.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+            ids = batch.get('ids') or []
+            if not ids:
+                break
+            
+            by_file: Dict[str, List[int]] = {}
+            for i, metadata in enumerate(batch['metadatas']):
+                by_file.setdefault((metadata or {}).get("file_id", ""), []).append(i)
+            
+            for file_id, positions in by_file.items():
+                known = lexical_index.document_chunk_ids(file_id)
+                positions = [i for i in positions if ids[i] not in known]
+                if positions:
+                    lexical_index.add_chunks(
+                        file_id,
+                        [ids[i] for i in positions],
+                        [batch['documents'][i] for i in positions],
+                        shard
+                    )
+                    indexed += len(positions)
+            
+            offset += len(ids)
+    
+    if indexed:
+        print(f"🔤 Added {indexed} chunks to the lexical index")
+    return indexed
+
+
+def normalize_stored_embeddings(batch_size: int = 1000) -> int:
+    """
+    Scale chunk embeddings stored before vectors were normalized to unit length
+    
+    Chunks ingested through /api/embeddings were stored as raw vectors, while
+    questions are now embedded as unit vectors, so their distances were not
+    comparable. Vectors that are not unit length are rescaled in ChromaDB and
+    in the shard's in-process index (if it has one); the vectors only differ
+    in scale, so nothing has to be re-embedded. Each collection is marked in
+    its metadata once done, so later startups skip it.
+    
+    Args:
+        batch_size: Chunks read from the vector store per request
+    
+    Returns:
+        Number of chunks rescaled
+    """
+    normalized = 0
+    for shard in list_shards():
+        vector_store = get_vector_store(shard)
+        metadata = dict(vector_store.metadata or {})
+        if metadata.get(EMBEDDINGS_NORMALIZED):
+            continue
+        vector_index = get_vector_index(shard) if vector_index_enabled() or vector_index_exists(shard) else None
+        indexed = vector_index.chunk_ids() if vector_index is not None else set()
+        
+        offset = 0
+        while True:
+            batch = vector_store.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset)
+            ids = batch.get('ids') or []
+            if not ids:
+                break
+            
+            vectors = np.asarray(batch['embeddings'], dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1)
+            rows = np.flatnonzero((np.abs(norms - 1.0) > 1e-3) & (norms > 0))
+            if len(rows):
+                scaled = (vectors[rows] / norms[rows, None]).tolist()
+                vector_store.update(ids=[ids[i] for i in rows], embeddings=scaled)
+                if indexed:
+                    keep = [j for j, i in enumerate(rows) if ids[i] in indexed]
+                    vector_index.upsert(
+                        ids=[ids[rows[j]] for j in keep],
+                        embeddings=[scaled[j] for j in keep],
+                        documents=[batch['documents'][rows[j]] for j in keep],
+                        metadatas=[batch['metadatas'][rows[j]] for j in keep]
+                    )
+                normalized += len(rows)
+            
+            offset += len(ids)
+        
+        # Distance settings cannot be passed to modify; they are kept by the collection
+        metadata = {key: value for key, value in metadata.items() if not key.startswith("hnsw:")}
+        vector_store.modify(metadata={**metadata, EMBEDDINGS_NORMALIZED: True})
+    
+    if normalized:
+        print(f"📏 Rescaled {normalized} stored embeddings to unit length")
+    return normalized
+
+
+def sync_vector_index(batch_size: int = 1000) -> int:
+    """
+    Make each shard's in-process index hold exactly the chunks of its collection
+    
+    Runs at startup when VECTOR_SEARCH_BACKEND is "numpy", so switching
+    backends (or changing a collection's quantization) does not require re-ingesting.
+    The chunk ID sets are compared: missing chunks are copied from the
+    collection and chunks no longer in it (deleted while the index was not
+    in use) are removed. Equal counts therefore do not hide stale rows.
+    
+    Args:
+        batch_size: Chunks read from the vector store per request
+    
+    Returns:
+        Number of chunks indexed
+    """
+    indexed = removed = 0
+    for shard in list_shards():
+        vector_store = get_vector_store(shard)
+        vector_index = get_vector_index(shard)
+        
+        stored_ids = set(vector_store.get(include=[]).get('ids') or [])
+        indexed_ids = vector_index.chunk_ids()
+        
+        stale = indexed_ids - stored_ids
+        if stale:
+            removed += vector_index.remove_chunks(sorted(stale))
+        
+        missing = sorted(stored_ids - indexed_ids)
+        for start in range(0, len(missing), batch_size):
+            batch = vector_store.get(ids=missing[start:start + batch_size], include=["documents", "metadatas", "embeddings"])
+            vector_index.upsert(
+                ids=batch['ids'],
+                embeddings=batch['embeddings'],
+                documents=batch['documents'],
+                metadatas=batch['metadatas']
+            )
+            indexed += len(batch['ids'])
+        
+        vector_index.train()
+    
+    if indexed or removed:
+        print(f"🧮 Vector index sync: added {indexed} chunks, removed {removed} stale chunks")
+    return indexed
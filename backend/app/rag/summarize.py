@@ -0,0 +1,264 @@
+"""
+Document Summarization
+Hierarchical map-reduce summaries of whole documents
+
+A textbook does not fit in one prompt, so the document's chunks are grouped
+into sections that do (map), each section is summarized, and consecutive
+section summaries are combined level by level (reduce) until one prompt
+holds them all, which produces the final summary. Steps of a level run in
+parallel, bounded so they do not flood the LLM scheduler's batch queue.
+
+Section boundaries are content-defined: a section ends after a chunk whose
+text hash selects it (or when the section is full), so an edit only changes
+the sections around it. Together with the content-addressed summary cache
+(app.rag.summary_cache), summarizing an edited document again regenerates
+only the changed sections and the combine steps above them.
+"""
+
+import asyncio
+import hashlib
+import time
+from typing import AsyncIterator, Dict, List, Tuple
+
+from app.db.vector_store import get_document_chunks
+from app.rag.coalescing import get_request_coalescer
+from app.rag.prompts import (
+    estimate_prompt_tokens,
+    create_section_summary_prompt,
+    create_combine_summaries_prompt,
+    create_summarization_prompt
+)
+from app.rag.summary_cache import get_summary_cache, summary_key
+from app.utils.llm_scheduler import LLM_CONCURRENCY, PRIORITY_BATCH, LLMOverloadedError
+from app.utils.ollama_client import CHAT_MODEL, generate_chat_completion
+
+
+# Summarization configuration
+SUMMARY_SECTION_TOKENS = 2400  # Input tokens per step (leaves room for instructions and output in CHAT_CONTEXT_WINDOW)
+SUMMARY_SECTION_CHUNKS = 4  # Average inputs per step; content-defined boundaries make this approximate
+SUMMARY_PARTIAL_MAX_TOKENS = 300  # Length of section and combined summaries
+SUMMARY_FINAL_MAX_TOKENS = 1024  # Length of the final summary
+SUMMARY_CONCURRENCY = LLM_CONCURRENCY  # Steps sent to the scheduler at once
+SUMMARY_TEMPERATURE = 0.3
+
+# Step kinds (also part of the cache key)
+STEP_SECTION = "section"
+STEP_COMBINE = "combine"
+STEP_DOCUMENT = "document"
+
+
+def _is_boundary(text: str, every: int) -> bool:
+    """Content-defined section boundary after this text (about one in `every`)"""
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") % every == 0
+
+
+def group_texts(
+    texts: List[str],
+    max_tokens: int = SUMMARY_SECTION_TOKENS,
+    boundary_every: int = SUMMARY_SECTION_CHUNKS
+) -> List[List[str]]:
+    """
+    Split consecutive texts into groups that each fit one prompt
+    
+    A group ends after a text selected by its hash, or before the text that
+    would exceed max_tokens. Groups always shrink the list (at least two
+    texts per group when there is more than one text), so repeated grouping
+    of summaries converges to a single group.
+    
+    Args:
+        texts: Chunk texts or summaries, in document order
+        max_tokens: Token budget per group
+        boundary_every: Average number of texts per group
+    
+    Returns:
+        List of groups of texts, in order
+    """
+    groups: List[List[str]] = []
+    current: List[str] = []
+    current_tokens = 0
+    
+    for text in texts:
+        tokens = estimate_prompt_tokens(text)
+        if current and current_tokens + tokens > max_tokens and len(current) >= 2:
+            groups.append(current)
+            current, current_tokens = [], 0
+        
+        current.append(text)
+        current_tokens += tokens
+        if len(current) >= 2 and _is_boundary(text, boundary_every):
+            groups.append(current)
+            current, current_tokens = [], 0
+    
+    if current:
+        if len(current) == 1 and groups:
+            groups[-1].append(current[0])
+        else:
+            groups.append(current)
+    
+    return groups
+
+
+async def _summarize_step(
+    kind: str,
+    texts: List[str],
+    filename: str,
+    semaphore: asyncio.Semaphore
+) -> Tuple[str, bool]:
+    """
+    Summarize one group of texts, reusing a cached summary of the same input
+    
+    Returns:
+        Tuple of (summary, whether it came from the cache)
+    """
+    cache = get_summary_cache()
+    key = summary_key(kind, CHAT_MODEL, [filename, *texts] if kind == STEP_DOCUMENT else texts)
+    
+    cached = await asyncio.to_thread(cache.get, key)
+    if cached is not None:
+        return cached, True
+    
+    if kind == STEP_SECTION:
+        prompt = create_section_summary_prompt("\n\n".join(texts))
+    elif kind == STEP_COMBINE:
+        prompt = create_combine_summaries_prompt(texts)
+    else:
+        prompt = create_summarization_prompt([{"text": text} for text in texts], filename)
+    
+    async with semaphore:
+        summary = await generate_chat_completion(
+            prompt=prompt,
+            temperature=SUMMARY_TEMPERATURE,
+            max_tokens=SUMMARY_FINAL_MAX_TOKENS if kind == STEP_DOCUMENT else SUMMARY_PARTIAL_MAX_TOKENS,
+            priority=PRIORITY_BATCH
+        )
+    
+    summary = summary.strip()
+    if summary:
+        await asyncio.to_thread(cache.store, key, summary)
+    return summary, False
+
+
+async def stream_document_summary(file_id: str) -> AsyncIterator[Dict]:
+    """
+    Summarize a document, streaming progress
+    
+    Concurrent requests for the same document share one summarization (see
+    app.rag.coalescing).
+    
+    Events:
+    1. {"type": "started", "filename", "chunks", "sections"}
+    2. {"type": "progress", "level", "stage", "completed", "total", "cached"}
+       after every step (stage is section, combine or document)
+    3. {"type": "done", "summary", "levels", "steps", "timing"}
+    
+    Args:
+        file_id: Unique identifier of the document
+    
+    Yields:
+        Event dictionaries for the streaming response
+    """
+    async for event in get_request_coalescer().stream(
+        f"summarize:{file_id}",
+        lambda: _stream_summary(file_id)
+    ):
+        yield event
+
+
+async def generate_document_summary(file_id: str) -> Dict:
+    """
+    Summarize a document
+    
+    Args:
+        file_id: Unique identifier of the document
+    
+    Returns:
+        The "done" event of stream_document_summary, without its type
+    """
+    result = None
+    async for event in stream_document_summary(file_id):
+        if event["type"] == "done":
+            result = {key: value for key, value in event.items() if key != "type"}
+    return result
+
+
+async def _stream_summary(file_id: str) -> AsyncIterator[Dict]:
+    try:
+        start = time.perf_counter()
+        chunks = await asyncio.to_thread(get_document_chunks, file_id)
+        texts = [chunk["text"] for chunk in chunks if chunk["text"].strip()]
+        if not texts:
+            raise Exception("Document not found or has no indexed text")
+        
+        filename = chunks[0]["metadata"].get("filename", "document")
+        groups = group_texts(texts)
+        yield {
+            "type": "started",
+            "file_id": file_id,
+            "filename": filename,
+            "chunks": len(texts),
+            "sections": len(groups)
+        }
+        
+        semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+        steps = {"generated": 0, "cached": 0}
+        level = 0
+        
+        while True:
+            final = len(groups) == 1
+            kind = STEP_DOCUMENT if final else (STEP_SECTION if level == 0 else STEP_COMBINE)
+            
+            async def run(index: int, group: List[str]):
+                return index, *await _summarize_step(kind, group, filename, semaphore)
+            
+            tasks = [asyncio.ensure_future(run(i, group)) for i, group in enumerate(groups)]
+            summaries: List[str] = [""] * len(groups)
+            completed = cached_steps = 0
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    index, summary, cached = await next_done
+                    summaries[index] = summary
+                    completed += 1
+                    cached_steps += cached
+                    steps["cached" if cached else "generated"] += 1
+                    yield {
+                        "type": "progress",
+                        "level": level,
+                        "stage": kind,
+                        "completed": completed,
+                        "total": len(groups),
+                        "cached": cached_steps
+                    }
+            finally:
+                for task in tasks:
+                    task.cancel()
+            
+            if final:
+                break
+            summaries = [summary for summary in summaries if summary]
+            if not summaries:
+                # Nothing to combine; grouping an empty list would loop forever
+                raise Exception("The model returned empty summaries for every section")
+            groups = group_texts(summaries)
+            level += 1
+        
+        total_ms = round((time.perf_counter() - start) * 1000, 1)
+        print(f"📝 Summarized {filename}: {len(texts)} chunks, {level + 1} levels, "
+              f"{steps['generated']} generated / {steps['cached']} cached steps in {total_ms} ms")
+        
+        yield {
+            "type": "done",
+            "file_id": file_id,
+            "filename": filename,
+            "summary": summaries[0],
+            "chunks": len(texts),
+            "levels": level + 1,
+            "steps": steps,
+            "timing": {"total_ms": total_ms}
+        }
+    
+    except LLMOverloadedError:
+        raise
+    except Exception as e:
+        print(f"❌ Error summarizing document: {str(e)}")
+        raise Exception(f"Failed to summarize document: {str(e)}")
@@ -0,0 +1,150 @@
+"""
+Summary Cache
+Content-addressed store of partial document summaries
+
+Every map and reduce step of the summarizer is keyed on a hash of its input
+text, the model and the prompt kind, so summarizing a document again only
+regenerates the sections whose text changed. Keys do not depend on the
+file_id, which changes whenever a PDF is re-uploaded with edits. Entries are
+persisted in SQLite and the least recently used ones are pruned beyond a
+maximum count.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+# Cache configuration
+SUMMARY_CACHE_PATH = "data/summaries.sqlite3"
+SUMMARY_CACHE_MAX_ENTRIES = 50_000  # Least recently used partial summaries are pruned beyond this
+
+# Global cache instance
+_summary_cache = None
+
+
+def summary_key(kind: str, model: str, texts: List[str]) -> str:
+    """
+    Hash the input of one summarization step
+    
+    Args:
+        kind: Prompt kind (section, combine or document)
+        model: LLM model that generates the summary
+        texts: Input texts, in order
+    
+    Returns:
+        Hex digest identifying the step
+    """
+    digest = hashlib.sha256(f"{kind}\0{model}\0".encode("utf-8"))
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class SummaryCache:
+    """
+    SQLite-backed cache of partial summaries
+    
+    Args:
+        path: SQLite database file
+        max_entries: Maximum number of cached summaries
+    """
+    
+    def __init__(self, path: str = SUMMARY_CACHE_PATH, max_entries: int = SUMMARY_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "pruned": 0}
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS summaries (
+                key TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_summaries_last_used ON summaries(last_used)")
+        self._conn.commit()
+    
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached summary for a step, or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            
+            self._stats["hits"] += 1
+            self._conn.execute("UPDATE summaries SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+    
+    def store(self, key: str, summary: str):
+        """Cache the summary generated for a step"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, summary, now, now)
+            )
+            self._stats["stores"] += 1
+            
+            excess = self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM summaries WHERE key IN (SELECT key FROM summaries ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                self._stats["pruned"] += excess
+            self._conn.commit()
+    
+    def clear(self):
+        """Remove all cached summaries"""
+        with self._lock:
+            self._conn.execute("DELETE FROM summaries")
+            self._conn.commit()
+    
+    def stats(self) -> Dict:
+        """
+        Get cache statistics
+        
+        Returns:
+            Dictionary with entry count, hit/miss counters and hit rate
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0
+        }
+
+
+def get_summary_cache() -> SummaryCache:
+    """
+    Get or create the summary cache instance (Singleton pattern)
+    
+    Returns:
+        SummaryCache instance
+    """
+    global _summary_cache
+    
+    if _summary_cache is None:
+        _summary_cache = SummaryCache()
+    
+    return _summary_cache
@@ -0,0 +1,272 @@
+"""
+Embedding Cache
+Persistent content-addressed cache of embedding vectors
+
+Vectors are stored in SQLite keyed by a SHA-256 hash of the model name,
+the vector normalization and the normalized text, with an in-memory LRU in front for hot entries (repeated
+questions, overlapping chunks). The on-disk table is bounded by entry count
+and evicts least recently used rows.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+from app.utils.text_utils import normalize_text
+
+
+# Cache configuration
+EMBEDDING_CACHE_PATH = "data/embedding_cache.sqlite3"
+EMBEDDING_CACHE_MAX_ENTRIES = 500_000  # Rows kept on disk (~1.5 KB each for 768-d vectors)
+EMBEDDING_CACHE_MEMORY_ENTRIES = 5_000  # Vectors kept in the in-memory LRU
+EMBEDDING_CACHE_EVICT_FRACTION = 0.1  # Share of rows removed when the disk limit is hit
+EMBEDDING_NORMALIZATION = "l2"  # Vectors are unit length; raw vectors cached before that are never served
+
+# Global cache instance
+_embedding_cache = None
+
+
+def make_cache_key(model: str, text: str) -> str:
+    """Content-addressed key for an embedding: hash of model + vector normalization + normalized text"""
+    digest = hashlib.sha256()
+    digest.update(model.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(EMBEDDING_NORMALIZATION.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalize_text(text).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _encode_vector(vector: Sequence[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _decode_vector(blob: bytes) -> List[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCache:
+    """
+    Two-level (memory LRU + SQLite) embedding cache
+    
+    Args:
+        path: SQLite database file
+        max_entries: Maximum rows kept on disk
+        memory_entries: Maximum vectors kept in memory
+    """
+    
+    def __init__(
+        self,
+        path: str = EMBEDDING_CACHE_PATH,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+        memory_entries: int = EMBEDDING_CACHE_MEMORY_ENTRIES
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)"
+        )
+        self._conn.commit()
+        self._disk_entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    
+    def _remember(self, key: str, vector: List[float]):
+        """Insert into the memory LRU, dropping the oldest entry if full"""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+    
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        Look up cached embeddings
+        
+        Args:
+            model: Embedding model name
+            texts: Texts to look up
+            
+        Returns:
+            List aligned with `texts`, holding a vector or None for misses
+        """
+        keys = [make_cache_key(model, text) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(keys)
+        
+        with self._lock:
+            disk_lookups: Dict[str, List[int]] = {}
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    results[i] = vector
+                else:
+                    disk_lookups.setdefault(key, []).append(i)
+            
+            if disk_lookups:
+                found = {}
+                pending = list(disk_lookups)
+                # Stay under SQLite's bound-parameter limit
+                for start in range(0, len(pending), 500):
+                    batch = pending[start:start + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                        batch
+                    ).fetchall()
+                    found.update(rows)
+                
+                if found:
+                    now = time.time()
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        [(now, key) for key in found]
+                    )
+                    self._conn.commit()
+                
+                for key, positions in disk_lookups.items():
+                    blob = found.get(key)
+                    if blob is None:
+                        self._stats["misses"] += len(positions)
+                        continue
+                    
+                    vector = _decode_vector(blob)
+                    self._remember(key, vector)
+                    self._stats["disk_hits"] += len(positions)
+                    for i in positions:
+                        results[i] = vector
+        
+        return results
+    
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        """Look up a single cached embedding"""
+        return self.get_many(model, [text])[0]
+    
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        """
+        Store embeddings in both cache levels
+        
+        Args:
+            model: Embedding model name
+            texts: Texts that were embedded
+            vectors: Embedding vectors aligned with `texts`
+        """
+        if not texts:
+            return
+        
+        now = time.time()
+        rows = {}
+        for text, vector in zip(texts, vectors):
+            rows[make_cache_key(model, text)] = (model, _encode_vector(vector), now)
+        
+        with self._lock:
+            # Keep the float32 round-tripped values so memory and disk hits agree
+            for key, (_, blob, _) in rows.items():
+                self._remember(key, _decode_vector(blob))
+            
+            cursor = self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(key, *row) for key, row in rows.items()]
+            )
+            self._conn.commit()
+            self._stats["writes"] += len(rows)
+            # Approximate: replaced rows are counted too, _evict() recounts exactly
+            self._disk_entries += max(cursor.rowcount, 0)
+            
+            if self._disk_entries > self.max_entries:
+                self._evict()
+    
+    def put(self, model: str, text: str, vector: Sequence[float]):
+        """Store a single embedding"""
+        self.put_many(model, [text], [vector])
+    
+    def _evict(self):
+        """Delete least recently used rows until below the size limit (lock held)"""
+        self._disk_entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = self._disk_entries - self.max_entries
+        if excess <= 0:
+            return
+        
+        to_delete = excess + int(self.max_entries * EMBEDDING_CACHE_EVICT_FRACTION)
+        self._conn.execute(
+            """
+            DELETE FROM embeddings WHERE key IN (
+                SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?
+            )
+            """,
+            (to_delete,)
+        )
+        self._conn.commit()
+        self._disk_entries -= to_delete
+        self._stats["evictions"] += to_delete
+        print(f"🧹 Evicted {to_delete} embeddings from cache")
+    
+    def clear(self):
+        """Remove every cached embedding"""
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._disk_entries = 0
+    
+    def stats(self) -> Dict:
+        """
+        Get cache statistics
+        
+        Returns:
+            Dictionary with hit/miss counters, hit rate and entry counts
+        """
+        with self._lock:
+            hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+            lookups = hits + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": self._disk_entries,
+                "max_entries": self.max_entries,
+                "path": self.path
+            }
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """
+    Get or create the embedding cache instance (Singleton pattern)
+    
+    Returns:
+        EmbeddingCache instance
+    """
+    global _embedding_cache
+    
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache()
+    
+    return _embedding_cache
@@ -0,0 +1,231 @@
+"""
+LLM Scheduler
+Admission control and priority scheduling for chat generations
+
+Ollama slows every generation down when more requests arrive than it can
+process at once, so an unbounded burst ends with most requests hitting the
+read timeout. Generations instead run in a bounded pool of slots; requests
+beyond that wait in a priority queue (interactive chat before batch work such
+as summaries and MCQs) for at most their deadline. When the queue is full, or
+a request's deadline passes while it waits, it is rejected immediately with a
+Retry-After estimate instead of adding to the backlog.
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import statistics
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+
+# Scheduling configuration
+LLM_CONCURRENCY = 2  # Generations sent to Ollama at once (match OLLAMA_NUM_PARALLEL)
+LLM_QUEUE_LIMIT = 32  # Waiting generations beyond which new requests are rejected
+LLM_BATCH_QUEUE_LIMIT = 8  # Batch work is rejected earlier, keeping queue room for chat
+INTERACTIVE_QUEUE_TIMEOUT = 30.0  # Seconds a chat request may wait for a slot
+BATCH_QUEUE_TIMEOUT = 300.0  # Seconds a batch request may wait for a slot
+
+# Priorities (lower runs first)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+# Samples kept for wait and service time percentiles
+_SAMPLE_SIZE = 500
+
+# Global scheduler instance
+_llm_scheduler = None
+
+
+class LLMOverloadedError(Exception):
+    """
+    Raised when a generation is not admitted
+    
+    Args:
+        status_code: 429 when the queue is full, 503 when the queue deadline passed
+        retry_after: Suggested seconds before retrying
+        message: Error description
+    """
+    
+    def __init__(self, status_code: int, retry_after: int, message: str):
+        self.status_code = status_code
+        self.retry_after = retry_after
+        super().__init__(message)
+
+
+def _percentile(samples, fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class LLMScheduler:
+    """
+    Bounded slot pool with a deadline-aware priority queue
+    
+    Args:
+        concurrency: Generations allowed to run at once
+        queue_limit: Maximum waiting requests
+        batch_queue_limit: Maximum waiting requests when a batch request arrives
+    """
+    
+    def __init__(
+        self,
+        concurrency: int = LLM_CONCURRENCY,
+        queue_limit: int = LLM_QUEUE_LIMIT,
+        batch_queue_limit: int = LLM_BATCH_QUEUE_LIMIT
+    ):
+        self.concurrency = concurrency
+        self.queue_limit = queue_limit
+        self.batch_queue_limit = batch_queue_limit
+        
+        self._active = 0
+        self._queue: List = []  # Heap of (priority, sequence, future)
+        self._waiting = {PRIORITY_INTERACTIVE: 0, PRIORITY_BATCH: 0}
+        self._sequence = itertools.count()
+        self._wait_times = deque(maxlen=_SAMPLE_SIZE)
+        self._service_times = deque(maxlen=_SAMPLE_SIZE)
+        self._stats = {"admitted": 0, "rejected_queue_full": 0, "rejected_deadline": 0, "completed": 0}
+    
+    @property
+    def queued(self) -> int:
+        return sum(self._waiting.values())
+    
+    def retry_after(self) -> int:
+        """Seconds until a new request would likely get a slot"""
+        service = statistics.mean(self._service_times) if self._service_times else 10.0
+        return max(1, math.ceil(service * (self.queued + 1) / self.concurrency))
+    
+    def check_admission(self, priority: int = PRIORITY_INTERACTIVE):
+        """
+        Reject a request up front if it could not be queued
+        
+        Lets endpoints fail fast before doing retrieval work for a request
+        that would be turned away at generation time anyway.
+        
+        Args:
+            priority: PRIORITY_INTERACTIVE or PRIORITY_BATCH
+        
+        Raises:
+            LLMOverloadedError: If all slots are busy and the queue is full
+        """
+        if self._active < self.concurrency:
+            return
+        
+        limit = self.queue_limit if priority == PRIORITY_INTERACTIVE else self.batch_queue_limit
+        if self.queued >= limit:
+            self._stats["rejected_queue_full"] += 1
+            raise LLMOverloadedError(
+                429,
+                self.retry_after(),
+                f"The tutor is busy ({self.queued} questions waiting). Please try again shortly."
+            )
+    
+    def _release(self):
+        """Hand the slot to the best waiting request, or free it"""
+        while self._queue:
+            priority, _, future = heapq.heappop(self._queue)
+            if future.done():  # Waiter gave up (deadline or disconnect)
+                continue
+            self._waiting[priority] -= 1
+            future.set_result(True)
+            return
+        self._active -= 1
+    
+    @asynccontextmanager
+    async def slot(
+        self,
+        priority: int = PRIORITY_INTERACTIVE,
+        queue_timeout: Optional[float] = None
+    ) -> AsyncIterator[None]:
+        """
+        Hold a generation slot for the duration of the block
+        
+        Args:
+            priority: PRIORITY_INTERACTIVE or PRIORITY_BATCH
+            queue_timeout: Seconds to wait for a slot (defaults by priority)
+        
+        Raises:
+            LLMOverloadedError: If the queue is full or no slot frees up in time
+        """
+        if queue_timeout is None:
+            queue_timeout = INTERACTIVE_QUEUE_TIMEOUT if priority == PRIORITY_INTERACTIVE else BATCH_QUEUE_TIMEOUT
+        
+        start = time.perf_counter()
+        if self._active < self.concurrency and not self.queued:
+            self._active += 1
+        else:
+            self.check_admission(priority)
+            
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._queue, (priority, next(self._sequence), future))
+            self._waiting[priority] += 1
+            try:
+                await asyncio.wait_for(future, timeout=queue_timeout)
+            except asyncio.TimeoutError:
+                # The slot may have been granted (and _waiting decremented) just as the deadline passed
+                if not (future.done() and not future.cancelled()):
+                    self._waiting[priority] -= 1
+                    self._stats["rejected_deadline"] += 1
+                    raise LLMOverloadedError(
+                        503,
+                        self.retry_after(),
+                        f"No generation slot became free within {queue_timeout:.0f} seconds. Please try again."
+                    )
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self._release()  # The slot was granted just as the caller went away
+                else:
+                    self._waiting[priority] -= 1
+                raise
+        
+        wait = time.perf_counter() - start
+        self._wait_times.append(wait)
+        self._stats["admitted"] += 1
+        try:
+            yield
+        finally:
+            self._service_times.append(time.perf_counter() - start - wait)
+            self._stats["completed"] += 1
+            self._release()
+    
+    def stats(self) -> Dict:
+        """
+        Get scheduler statistics
+        
+        Returns:
+            Dictionary with slot usage, queue depth per priority, admission
+            counters and wait/service time percentiles (ms)
+        """
+        return {
+            **self._stats,
+            "concurrency": self.concurrency,
+            "active": self._active,
+            "queued": self.queued,
+            "queued_interactive": self._waiting[PRIORITY_INTERACTIVE],
+            "queued_batch": self._waiting[PRIORITY_BATCH],
+            "queue_limit": self.queue_limit,
+            "wait_p50_ms": round(_percentile(self._wait_times, 0.5) * 1000, 1),
+            "wait_p95_ms": round(_percentile(self._wait_times, 0.95) * 1000, 1),
+            "service_p50_ms": round(_percentile(self._service_times, 0.5) * 1000, 1),
+            "retry_after_seconds": self.retry_after()
+        }
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """
+    Get or create the LLM scheduler instance (Singleton pattern)
+    
+    Returns:
+        LLMScheduler instance
+    """
+    global _llm_scheduler
+    
+    if _llm_scheduler is None:
+        _llm_scheduler = LLMScheduler()
+    
+    return _llm_scheduler
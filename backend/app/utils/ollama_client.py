@@ -3,24 +3,164 @@ Ollama REST API Client
 Handles communication with local Ollama server for embeddings and chat
 """
 
+import asyncio
+import math
 import httpx
-from typing import List, Optional, Dict
+from typing import AsyncIterator, List, Optional, Dict
 import json
 
+from app.utils.embedding_cache import get_embedding_cache
+from app.utils.llm_scheduler import get_llm_scheduler, LLMOverloadedError, PRIORITY_INTERACTIVE
+
 
 # Ollama configuration
 OLLAMA_BASE_URL = "http://localhost:11434"
 EMBEDDING_MODEL = "nomic-embed-text"
 CHAT_MODEL = "qwen3:8b"  # Using qwen2.5:3b as it's more commonly available
+CHAT_CONTEXT_WINDOW = 4096  # num_ctx for chat requests (prompt + answer tokens)
+CHAT_KEEP_ALIVE = "30m"  # How long Ollama keeps the chat model (and its KV cache) loaded
+
+# Batched embedding configuration
+EMBEDDING_BATCH_SIZE = 32  # Texts per /api/embed request
+EMBEDDING_CONCURRENCY = 4  # Maximum in-flight embedding requests
+
+# Shared HTTP client configuration
+HTTP_MAX_CONNECTIONS = 20  # Total open connections to Ollama
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 10  # Idle connections kept for reuse
+HTTP_KEEPALIVE_EXPIRY = 30.0  # Seconds an idle connection stays open
+
+# Per-operation timeouts
+EMBEDDING_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+BATCH_EMBEDDING_TIMEOUT = httpx.Timeout(120.0, connect=5.0)
+CHAT_TIMEOUT = httpx.Timeout(120.0, connect=5.0)
+HEALTH_TIMEOUT = httpx.Timeout(5.0)
+PULL_TIMEOUT = httpx.Timeout(600.0, connect=5.0)
+
+# Global HTTP client instance (shared connection pool)
+_http_client: Optional[httpx.AsyncClient] = None
+_request_stats = {"requests_total": 0, "responses_total": 0}
+
+# Prefill statistics reported by Ollama for chat requests
+_chat_stats = {
+    "chat_requests": 0,
+    "prompt_tokens_evaluated": 0,
+    "prefill_ms": 0.0,
+    "load_ms": 0.0,
+    "cold_loads": 0
+}
+
+# Whether the server supports the multi-input /api/embed endpoint
+# (None = not probed yet, detected on first batched call)
+_batch_embed_supported: Optional[bool] = None
+
+
+async def _count_request(request: httpx.Request):
+    _request_stats["requests_total"] += 1
+
+
+async def _count_response(response: httpx.Response):
+    _request_stats["responses_total"] += 1
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Get the shared Ollama HTTP client (Singleton pattern)
+    
+    The client keeps a pool of keep-alive connections so embedding and chat
+    calls reuse TCP connections instead of opening one per request. It is
+    created by the FastAPI startup hook, or lazily on first use.
+    
+    Returns:
+        Shared httpx.AsyncClient instance
+    """
+    global _http_client
+    
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            base_url=OLLAMA_BASE_URL,
+            timeout=CHAT_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            ),
+            event_hooks={
+                "request": [_count_request],
+                "response": [_count_response]
+            }
+        )
+    
+    return _http_client
 
 
-async def generate_embeddings(text: str, model: str = EMBEDDING_MODEL) -> List[float]:
+async def init_http_client() -> httpx.AsyncClient:
+    """Create the shared HTTP client (called on server startup)"""
+    return get_http_client()
+
+
+async def close_http_client():
+    """Close the shared HTTP client and its pooled connections (called on shutdown)"""
+    global _http_client
+    
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def get_pool_stats() -> Dict:
+    """
+    Get connection pool statistics for the shared HTTP client
+    
+    The request counters are maintained by the client's event hooks. Open,
+    idle and active connection counts come from httpx/httpcore internals, so
+    they are reported as None when those internals are not available (other
+    transport, or a version that renamed them).
+    
+    Returns:
+        Dictionary with pool limits, request counters and open/idle/active connections
+    """
+    stats = {
+        "initialized": _http_client is not None and not _http_client.is_closed,
+        "max_connections": HTTP_MAX_CONNECTIONS,
+        "max_keepalive_connections": HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        "keepalive_expiry": HTTP_KEEPALIVE_EXPIRY,
+        **_request_stats,
+        "open_connections": None,
+        "idle_connections": None,
+        "active_connections": None
+    }
+    
+    if stats["initialized"]:
+        pool = getattr(getattr(_http_client, "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None)
+        try:
+            idle = sum(1 for conn in connections if conn.is_idle())
+            stats.update({
+                "open_connections": len(connections),
+                "idle_connections": idle,
+                "active_connections": len(connections) - idle
+            })
+        except (AttributeError, TypeError):
+            pass
+    
+    return stats
+
+
+async def generate_embeddings(
+    text: str,
+    model: str = EMBEDDING_MODEL,
+    use_cache: bool = True
+) -> List[float]:
     """
     Generate embeddings for text using Ollama
     
+    Identical text (after normalization) is served from the persistent
+    embedding cache instead of calling Ollama again.
+    
     Args:
         text: Text to embed
         model: Embedding model to use
+        use_cache: Read from and write to the embedding cache
         
     Returns:
         List of embedding values (vector)
@@ -29,20 +169,17 @@ async def generate_embeddings(text: str, model: str = EMBEDDING_MODEL) -> List[f
         Exception: If Ollama request fails
     """
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"{OLLAMA_BASE_URL}/api/embeddings",
-                json={
-                    "model": model,
-                    "prompt": text
-                }
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result["embedding"]
-            else:
-                raise Exception(f"Ollama embeddings API returned status {response.status_code}")
+        if use_cache:
+            cached = get_embedding_cache().get(model, text)
+            if cached is not None:
+                return cached
+        
+        embedding = await _embed_single(text, model)
+        
+        if use_cache:
+            get_embedding_cache().put(model, text, embedding)
+        
+        return embedding
                 
     except httpx.ConnectError:
         raise Exception(
@@ -52,52 +189,281 @@ async def generate_embeddings(text: str, model: str = EMBEDDING_MODEL) -> List[f
         raise Exception(f"Failed to generate embeddings: {str(e)}")
 
 
+def normalize_embedding(vector: List[float]) -> List[float]:
+    """
+    Scale a vector to unit length (L2)
+    
+    /api/embed returns normalized vectors but /api/embeddings does not, so
+    every vector is normalized before it is cached, stored or queried:
+    questions and chunks are then compared on the same scale whichever
+    endpoint embedded them.
+    """
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm for value in vector] if norm > 0 else list(vector)
+
+
+async def _embed_single(text: str, model: str) -> List[float]:
+    """
+    Embed one text with Ollama's single-input /api/embeddings endpoint
+    
+    Returns:
+        L2-normalized embedding vector
+    """
+    response = await get_http_client().post(
+        "/api/embeddings",
+        json={
+            "model": model,
+            "prompt": text
+        },
+        timeout=EMBEDDING_TIMEOUT
+    )
+    
+    if response.status_code == 200:
+        result = response.json()
+        return normalize_embedding(result["embedding"])
+    else:
+        raise Exception(f"Ollama embeddings API returned status {response.status_code}")
+
+
+def _names_missing_model(response: httpx.Response) -> bool:
+    """Whether an Ollama error response reports a model that is not available"""
+    try:
+        error = str(response.json().get("error", ""))
+    except (ValueError, AttributeError):
+        return False
+    return "model" in error.lower() and "not found" in error.lower()
+
+
+async def _embed_batch(texts: List[str], model: str) -> Optional[List[List[float]]]:
+    """
+    Embed several texts with a single call to Ollama's /api/embed endpoint
+    
+    Returns:
+        List of L2-normalized embedding vectors, or None if the endpoint is not available
+    """
+    response = await get_http_client().post(
+        "/api/embed",
+        json={
+            "model": model,
+            "input": texts
+        },
+        timeout=BATCH_EMBEDDING_TIMEOUT
+    )
+    
+    # Ollama also answers 404 when the model is not pulled; that is not a missing endpoint
+    if response.status_code == 404 and _names_missing_model(response):
+        raise Exception(f"Embedding model '{model}' not found in Ollama (run: ollama pull {model})")
+    
+    # Older Ollama versions only provide the single-input /api/embeddings
+    if response.status_code in (404, 405):
+        return None
+    
+    if response.status_code != 200:
+        raise Exception(f"Ollama embed API returned status {response.status_code}")
+    
+    embeddings = response.json().get("embeddings")
+    if not embeddings or len(embeddings) != len(texts):
+        raise Exception("Ollama embed API returned an unexpected number of embeddings")
+    
+    # Normalized by Ollama already; renormalize so both endpoints agree exactly
+    return [normalize_embedding(embedding) for embedding in embeddings]
+
+
+async def generate_embeddings_batch(
+    texts: List[str],
+    model: str = EMBEDDING_MODEL,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    max_concurrency: int = EMBEDDING_CONCURRENCY,
+    use_cache: bool = True
+) -> List[List[float]]:
+    """
+    Generate embeddings for many texts using batched, concurrent requests
+    
+    Uses Ollama's multi-input /api/embed endpoint when available, sending
+    up to `batch_size` texts per request. Falls back to one /api/embeddings
+    request per text. In both cases at most `max_concurrency` requests are
+    in flight at once. Texts already in the embedding cache are not sent.
+    
+    Args:
+        texts: Texts to embed
+        model: Embedding model to use
+        batch_size: Number of texts per batched request
+        max_concurrency: Maximum number of concurrent requests
+        use_cache: Read from and write to the embedding cache
+        
+    Returns:
+        List of embedding vectors in the same order as `texts`
+        
+    Raises:
+        Exception: If any Ollama request fails
+    """
+    global _batch_embed_supported
+    
+    if not texts:
+        return []
+    
+    # Only send texts that are not cached (deduplicated) to Ollama
+    if use_cache:
+        cache = get_embedding_cache()
+        embeddings = cache.get_many(model, texts)
+    else:
+        embeddings = [None] * len(texts)
+    
+    missing = list(dict.fromkeys(text for text, emb in zip(texts, embeddings) if emb is None))
+    if not missing:
+        return embeddings
+    
+    batch_size = max(1, batch_size)
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+    
+    async def embed_single(text: str) -> List[float]:
+        async with semaphore:
+            return await _embed_single(text, model)
+    
+    async def embed_batch(batch: List[str]) -> List[List[float]]:
+        global _batch_embed_supported
+        
+        if _batch_embed_supported is not False:
+            async with semaphore:
+                embeddings = await _embed_batch(batch, model)
+            
+            if embeddings is not None:
+                _batch_embed_supported = True
+                return embeddings
+            
+            _batch_embed_supported = False
+            print("   ⚠️  /api/embed not available, falling back to per-text embeddings")
+        
+        return await asyncio.gather(*(embed_single(text) for text in batch))
+    
+    try:
+        # Probe the batch endpoint with the first batch before fanning out
+        results = [await embed_batch(batches[0])]
+        results += await asyncio.gather(
+            *(embed_batch(batch) for batch in batches[1:])
+        )
+        computed = [embedding for batch in results for embedding in batch]
+        
+        if use_cache:
+            cache.put_many(model, missing, computed)
+        
+        by_text = dict(zip(missing, computed))
+        return [emb if emb is not None else by_text[text] for text, emb in zip(texts, embeddings)]
+        
+    except httpx.ConnectError:
+        raise Exception(
+            "Cannot connect to Ollama. Please ensure Ollama is running at http://localhost:11434"
+        )
+    except Exception as e:
+        raise Exception(f"Failed to generate batch embeddings: {str(e)}")
+
+
+def _chat_payload(
+    prompt: Optional[str],
+    messages: Optional[List[Dict]],
+    model: str,
+    temperature: float,
+    max_tokens: Optional[int],
+    stream: bool
+) -> Dict:
+    """Build an /api/chat request body"""
+    payload = {
+        "model": model,
+        "messages": messages if messages is not None else [{"role": "user", "content": prompt}],
+        "stream": stream,
+        "keep_alive": CHAT_KEEP_ALIVE,
+        "options": {
+            "temperature": temperature,
+            "num_ctx": CHAT_CONTEXT_WINDOW
+        }
+    }
+    
+    if max_tokens:
+        payload["options"]["num_predict"] = max_tokens
+    
+    return payload
+
+
+def _record_chat_stats(result: Dict):
+    """Accumulate the prefill statistics Ollama returns with a finished response"""
+    _chat_stats["chat_requests"] += 1
+    _chat_stats["prompt_tokens_evaluated"] += result.get("prompt_eval_count", 0)
+    _chat_stats["prefill_ms"] += result.get("prompt_eval_duration", 0) / 1e6
+    load_ms = result.get("load_duration", 0) / 1e6
+    _chat_stats["load_ms"] += load_ms
+    if load_ms > 1000:  # Warm requests still report a few milliseconds of load time
+        _chat_stats["cold_loads"] += 1
+
+
+def get_chat_stats() -> Dict:
+    """
+    Get prefill statistics for chat requests
+    
+    Returns:
+        Dictionary with request count, prompt tokens evaluated (tokens served
+        from Ollama's prompt cache are not counted), prefill and model load time
+    """
+    requests = _chat_stats["chat_requests"]
+    return {
+        **_chat_stats,
+        "prefill_ms": round(_chat_stats["prefill_ms"], 1),
+        "load_ms": round(_chat_stats["load_ms"], 1),
+        "avg_prefill_ms": round(_chat_stats["prefill_ms"] / requests, 1) if requests else 0.0,
+        "keep_alive": CHAT_KEEP_ALIVE
+    }
+
+
 async def generate_chat_completion(
-    prompt: str,
+    prompt: Optional[str] = None,
     model: str = CHAT_MODEL,
     temperature: float = 0.7,
-    max_tokens: Optional[int] = None
+    max_tokens: Optional[int] = None,
+    messages: Optional[List[Dict]] = None,
+    priority: int = PRIORITY_INTERACTIVE
 ) -> str:
     """
-    Generate chat completion using Ollama
+    Generate chat completion using Ollama's chat endpoint
+    
+    Pass either a single prompt (sent as one user message) or a list of chat
+    messages. Keeping the system message and earlier turns byte-identical
+    between requests lets Ollama reuse their cached prefill, and keep_alive
+    keeps the model loaded between bursts of questions.
+    
+    The request waits for a slot in the LLM scheduler, so only a bounded
+    number of generations reach Ollama at once.
     
     Args:
-        prompt: Full prompt including system message and context
+        prompt: Full prompt, used when messages is not given
         model: LLM model to use
         temperature: Sampling temperature (0.0 to 1.0)
         max_tokens: Maximum tokens to generate
+        messages: Chat messages ({"role", "content"}), system message first
+        priority: Scheduling priority (PRIORITY_INTERACTIVE or PRIORITY_BATCH)
         
     Returns:
         Generated text response
         
     Raises:
+        LLMOverloadedError: If the scheduler rejects the request
         Exception: If Ollama request fails
     """
     try:
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            # Prepare request payload
-            payload = {
-                "model": model,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": temperature,
-                }
-            }
-            
-            if max_tokens:
-                payload["options"]["num_predict"] = max_tokens
-            
-            response = await client.post(
-                f"{OLLAMA_BASE_URL}/api/generate",
-                json=payload
+        payload = _chat_payload(prompt, messages, model, temperature, max_tokens, stream=False)
+        
+        async with get_llm_scheduler().slot(priority):
+            response = await get_http_client().post(
+                "/api/chat",
+                json=payload,
+                timeout=CHAT_TIMEOUT
             )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result["response"]
-            else:
-                raise Exception(f"Ollama chat API returned status {response.status_code}")
+        
+        if response.status_code == 200:
+            result = response.json()
+            _record_chat_stats(result)
+            return result["message"]["content"]
+        else:
+            raise Exception(f"Ollama chat API returned status {response.status_code}")
                 
     except httpx.ConnectError:
         raise Exception(
@@ -107,10 +473,102 @@ async def generate_chat_completion(
         raise Exception(
             "Ollama request timed out. The model might be too large or the prompt too complex."
         )
+    except LLMOverloadedError:
+        raise
     except Exception as e:
         raise Exception(f"Failed to generate chat completion: {str(e)}")
 
 
+async def stream_chat_completion(
+    prompt: Optional[str] = None,
+    model: str = CHAT_MODEL,
+    temperature: float = 0.7,
+    max_tokens: Optional[int] = None,
+    messages: Optional[List[Dict]] = None,
+    priority: int = PRIORITY_INTERACTIVE
+) -> AsyncIterator[str]:
+    """
+    Stream a chat completion from Ollama token by token
+    
+    The scheduler slot is held until the stream ends.
+    
+    Args:
+        prompt: Full prompt, used when messages is not given
+        model: LLM model to use
+        temperature: Sampling temperature (0.0 to 1.0)
+        max_tokens: Maximum tokens to generate
+        messages: Chat messages ({"role", "content"}), system message first
+        priority: Scheduling priority (PRIORITY_INTERACTIVE or PRIORITY_BATCH)
+        
+    Yields:
+        Text fragments as Ollama produces them
+        
+    Raises:
+        LLMOverloadedError: If the scheduler rejects the request
+        Exception: If Ollama request fails
+    """
+    payload = _chat_payload(prompt, messages, model, temperature, max_tokens, stream=True)
+    
+    try:
+        async with get_llm_scheduler().slot(priority), get_http_client().stream(
+            "POST",
+            "/api/chat",
+            json=payload,
+            timeout=CHAT_TIMEOUT
+        ) as response:
+            if response.status_code != 200:
+                raise Exception(f"Ollama chat API returned status {response.status_code}")
+            
+            # Ollama streams one JSON object per line
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise Exception(chunk["error"])
+                content = chunk.get("message", {}).get("content")
+                if content:
+                    yield content
+                if chunk.get("done"):
+                    _record_chat_stats(chunk)
+                    break
+                
+    except httpx.ConnectError:
+        raise Exception(
+            "Cannot connect to Ollama. Please ensure Ollama is running at http://localhost:11434"
+        )
+    except httpx.ReadTimeout:
+        raise Exception(
+            "Ollama request timed out. The model might be too large or the prompt too complex."
+        )
+    except LLMOverloadedError:
+        raise
+    except Exception as e:
+        raise Exception(f"Failed to stream chat completion: {str(e)}")
+
+
+async def warm_chat_model(system_prompt: str, model: str = CHAT_MODEL):
+    """
+    Load the chat model and prefill the system prompt ahead of the first question
+    
+    Failures are logged and ignored: the first real request loads the model anyway.
+    
+    Args:
+        system_prompt: System message every chat request starts with
+        model: LLM model to load
+    """
+    try:
+        await generate_chat_completion(
+            model=model,
+            max_tokens=1,
+            messages=[{"role": "system", "content": system_prompt}]
+        )
+        print(f"🔥 Chat model {model} loaded (keep_alive {CHAT_KEEP_ALIVE})")
+    except Exception as e:
+        print(f"⚠️  Could not warm up chat model: {str(e)}")
+
+
 async def check_model_availability(model: str) -> bool:
     """
     Check if a specific model is available in Ollama
@@ -122,21 +580,20 @@ async def check_model_availability(model: str) -> bool:
         True if model is available, False otherwise
     """
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{OLLAMA_BASE_URL}/api/tags")
+        response = await get_http_client().get("/api/tags", timeout=HEALTH_TIMEOUT)
+        
+        if response.status_code == 200:
+            data = response.json()
+            models = data.get("models", [])
             
-            if response.status_code == 200:
-                data = response.json()
-                models = data.get("models", [])
-                
-                # Check if model exists in the list
-                for m in models:
-                    if m.get("name") == model or m.get("name").startswith(model):
-                        return True
-                
-                return False
-            else:
-                return False
+            # Check if model exists in the list
+            for m in models:
+                if m.get("name") == model or m.get("name").startswith(model):
+                    return True
+            
+            return False
+        else:
+            return False
                 
     except:
         return False
@@ -153,23 +610,22 @@ async def pull_model(model: str) -> Dict:
         Dictionary with pull status
     """
     try:
-        async with httpx.AsyncClient(timeout=600.0) as client:
-            response = await client.post(
-                f"{OLLAMA_BASE_URL}/api/pull",
-                json={"name": model},
-                timeout=600.0
-            )
-            
-            if response.status_code == 200:
-                return {
-                    "success": True,
-                    "message": f"Model {model} pulled successfully"
-                }
-            else:
-                return {
-                    "success": False,
-                    "message": f"Failed to pull model: HTTP {response.status_code}"
-                }
+        response = await get_http_client().post(
+            "/api/pull",
+            json={"name": model},
+            timeout=PULL_TIMEOUT
+        )
+        
+        if response.status_code == 200:
+            return {
+                "success": True,
+                "message": f"Model {model} pulled successfully"
+            }
+        else:
+            return {
+                "success": False,
+                "message": f"Failed to pull model: HTTP {response.status_code}"
+            }
                 
     except Exception as e:
         return {
@@ -0,0 +1,26 @@
+"""
+Text Normalization Utilities
+Shared helpers for cleaning and comparing text
+"""
+
+import re
+import unicodedata
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize text for hashing and comparison
+    
+    Applies Unicode NFC normalization (so visually identical Sinhala/Tamil
+    strings compare equal), collapses runs of whitespace and strips the ends.
+    
+    Args:
+        text: Raw text
+        
+    Returns:
+        Normalized text
+    """
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFC", text)).strip()
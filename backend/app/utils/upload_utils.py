@@ -0,0 +1,130 @@
+"""
+Upload Streaming Utilities
+Writes uploaded files to disk in chunks with incremental hashing
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from typing import Optional, Tuple
+
+import aiofiles
+from fastapi import UploadFile
+
+
+# Bytes read from the upload per iteration
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Allowance for multipart boundaries and form fields around the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds the configured maximum size"""
+    
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        super().__init__(f"File exceeds the maximum upload size of {max_bytes // (1024 * 1024)} MB")
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Reject oversized uploads from their Content-Length header
+    
+    FastAPI parses (and spools) the whole multipart body before an endpoint
+    runs, so a size check in the endpoint only happens after the client
+    has sent everything. This ASGI middleware answers 413 before the body
+    is read. Requests without a Content-Length (chunked transfer) are
+    passed through and limited by save_upload_to_temp instead.
+    
+    Args:
+        app: ASGI application
+        max_bytes: Maximum file size
+        path: Request path the limit applies to
+    """
+    
+    def __init__(self, app, max_bytes: int, path: str):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path = path
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == self.path:
+            headers = dict(scope["headers"])
+            content_length = headers.get(b"content-length", b"")
+            if content_length.isdigit() and int(content_length) > self.max_bytes + MULTIPART_OVERHEAD:
+                body = json.dumps({"detail": str(UploadTooLargeError(self.max_bytes))}).encode("utf-8")
+                await send({
+                    "type": "http.response.start",
+                    "status": 413,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode("ascii")),
+                        (b"connection", b"close")
+                    ]
+                })
+                await send({"type": "http.response.body", "body": body})
+                return
+        
+        await self.app(scope, receive, send)
+
+
+async def save_upload_to_temp(
+    upload: UploadFile,
+    dest_dir: str,
+    max_bytes: Optional[int] = None,
+    chunk_size: int = UPLOAD_CHUNK_SIZE
+) -> Tuple[str, str, int]:
+    """
+    Stream an upload into a temporary file while hashing it
+    
+    Only one chunk is held in memory at a time. The limit is checked again
+    here because bodies sent without a Content-Length are only measured once
+    received (see UploadSizeLimitMiddleware). The temporary file is created
+    inside `dest_dir` so it can later be moved into place with an atomic
+    os.replace (same filesystem).
+    
+    Args:
+        upload: Uploaded file
+        dest_dir: Directory for the temporary file
+        max_bytes: Maximum allowed size; None for no limit
+        chunk_size: Bytes read per iteration
+        
+    Returns:
+        Tuple of (temporary file path, SHA-256 hex digest, size in bytes)
+        
+    Raises:
+        UploadTooLargeError: If the upload exceeds `max_bytes`
+    """
+    # Reject early when the size is already known
+    if max_bytes is not None and upload.size is not None and upload.size > max_bytes:
+        raise UploadTooLargeError(max_bytes)
+    
+    os.makedirs(dest_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=dest_dir, prefix=".upload_", suffix=".part")
+    os.close(fd)
+    
+    digest = hashlib.sha256()
+    size = 0
+    
+    try:
+        async with aiofiles.open(temp_path, "wb") as out:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise UploadTooLargeError(max_bytes)
+                
+                digest.update(chunk)
+                await out.write(chunk)
+        
+        return temp_path, digest.hexdigest(), size
+        
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
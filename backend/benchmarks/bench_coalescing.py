@@ -0,0 +1,121 @@
+"""
+Request Coalescing Benchmark
+Load test of /api/chat/ask with many concurrent clients (a class asking the
+same question at once), with single-flight coalescing off and on. Requests
+the LLM scheduler turns away (429/503) are counted as rejected; latencies
+are of the answered requests.
+
+Runs the real FastAPI app in-process against the stub Ollama server, which
+processes a limited number of generations at once like a local Ollama, over
+a small synthetic knowledge base in a temporary data directory.
+
+Usage:
+    python benchmarks/bench_coalescing.py [clients] [distinct_questions]
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Optional
+
+# Add backend directory to path to import from app
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import httpx
+
+from app.main import app
+from app.db.vector_store import get_vector_store
+from app.rag.answer_cache import get_answer_cache
+from app.rag.coalescing import get_request_coalescer
+from app.rag.lexical_index import get_lexical_index
+from app.utils import ollama_client
+from stub_ollama import StubOllamaServer, fake_embedding
+
+
+GENERATION_SLOTS = 2  # Like OLLAMA_NUM_PARALLEL on a small machine
+TOPICS = ["photosynthesis", "osmosis", "velocity", "acids and bases", "mitochondria", "electric current"]
+
+
+def build_knowledge_base(chunks_per_topic: int = 40):
+    ids, texts = [], []
+    for topic in TOPICS:
+        for i in range(chunks_per_topic):
+            ids.append(f"bench_chunk_{len(ids)}")
+            texts.append(f"Notes on {topic}, part {i}: definitions, a worked example and exam tips about {topic}.")
+    
+    get_vector_store().upsert(
+        ids=ids,
+        embeddings=[fake_embedding(text) for text in texts],
+        documents=texts,
+        metadatas=[
+            {"file_id": "bench", "filename": "science.pdf", "chunk_index": i, "page_start": i // 4 + 1}
+            for i in range(len(ids))
+        ]
+    )
+    get_lexical_index().add_chunks("bench", ids, texts)
+
+
+async def load_test(clients: int, questions: list) -> list:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        async def ask(i: int) -> Optional[float]:
+            start = time.perf_counter()
+            response = await client.post("/api/chat/ask", json={"question": questions[i % len(questions)]})
+            if response.status_code in (429, 503):
+                return None  # Rejected by the LLM scheduler
+            response.raise_for_status()
+            return time.perf_counter() - start
+        
+        try:
+            return await asyncio.gather(*(ask(i) for i in range(clients)))
+        finally:
+            await ollama_client.close_http_client()
+
+
+def run_case(label: str, server: StubOllamaServer, clients: int, questions: list, coalescing: bool):
+    get_answer_cache().clear()
+    get_request_coalescer().enabled = coalescing
+    generations_before = server.generation_count
+    
+    start = time.perf_counter()
+    results = asyncio.run(load_test(clients, questions))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for latency in results if latency is not None)
+    
+    print(
+        f"{label:<36} {elapsed:7.2f} s {statistics.median(latencies):8.2f} s "
+        f"{latencies[max(int(len(latencies) * 0.95) - 1, 0)]:8.2f} s "
+        f"{server.generation_count - generations_before:12d} {len(results) - len(latencies):9d}"
+    )
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    distinct = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    same = ["What is photosynthesis?"]
+    mixed = [f"Explain {topic} with an example" for topic in TOPICS[:distinct]]
+    
+    with tempfile.TemporaryDirectory() as data_root, StubOllamaServer(
+        prefill_latency=0.3,
+        token_latency=0.01,
+        generation_slots=GENERATION_SLOTS
+    ) as server:
+        os.chdir(data_root)
+        ollama_client.OLLAMA_BASE_URL = server.base_url
+        build_knowledge_base()
+        
+        print(f"{clients} concurrent clients, stub Ollama with {GENERATION_SLOTS} generation slots\n")
+        print(f"{'case':<36} {'wall':>9} {'p50':>10} {'p95':>10} {'generations':>12} {'rejected':>9}")
+        print("-" * 92)
+        for label, questions in [("same question", same), (f"{distinct} distinct questions", mixed)]:
+            run_case(f"{label}, no coalescing", server, clients, questions, coalescing=False)
+            run_case(f"{label}, coalescing", server, clients, questions, coalescing=True)
+        
+        print(f"\nCoalescer: {get_request_coalescer().stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Document Listing Benchmark
+Compares the original listing (scan the upload directory, stat every file,
+parse metadata from filenames) with a paginated document catalog query, for
+a large library
+
+Usage:
+    python benchmarks/bench_document_list.py [documents]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# Add backend directory to path to import from app
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.db.document_catalog import DocumentCatalog, parse_upload_filename, DOCUMENT_FAILED
+
+
+def directory_listing(upload_dir: str):
+    """Original list_documents: walk, stat and parse every stored upload"""
+    documents = []
+    for filename in os.listdir(upload_dir):
+        if filename.endswith('.pdf'):
+            file_stats = os.stat(os.path.join(upload_dir, filename))
+            parts = filename.split('_')
+            documents.append({
+                "id": parts[1] if len(parts) > 1 else "unknown",
+                "filename": '_'.join(parts[2:]) if len(parts) > 2 else filename,
+                "upload_date": parts[0],
+                "size_bytes": file_stats.st_size
+            })
+    return sorted(documents, key=lambda x: x["upload_date"], reverse=True)[:50]
+
+
+def timed(function, repeats: int = 5) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    
+    with tempfile.TemporaryDirectory() as root:
+        upload_dir = os.path.join(root, "uploads")
+        os.makedirs(upload_dir)
+        for i in range(count):
+            clock = f"{i // 3600 % 24:02d}{i // 60 % 60:02d}{i % 60:02d}"
+            name = f"20260101_{clock}_{i:032x}_chapter_{i}_notes.pdf"
+            open(os.path.join(upload_dir, name), "wb").close()
+        
+        catalog = DocumentCatalog(path=os.path.join(root, "documents.sqlite3"))
+        for i, filename in enumerate(os.listdir(upload_dir)):
+            file_id, original, uploaded_at = parse_upload_filename(filename)
+            catalog.add(file_id, original, os.path.join(upload_dir, filename), 0, uploaded_at=uploaded_at)
+            if i % 100 == 0:
+                catalog.update(file_id, status=DOCUMENT_FAILED)
+        print(f"{count} documents\n")
+        
+        print(f"{'listing (page of 50)':<40} {'time':>10}")
+        print("-" * 52)
+        print(f"{'directory scan + stat':<40} {timed(lambda: directory_listing(upload_dir)):7.1f} ms")
+        print(f"{'catalog, newest first':<40} {timed(lambda: catalog.list(limit=50)):7.1f} ms")
+        print(f"{'catalog, page 500 by filename':<40} "
+              f"{timed(lambda: catalog.list(limit=50, offset=25_000, sort='filename', descending=False)):7.1f} ms")
+        print(f"{'catalog, status filter':<40} {timed(lambda: catalog.list(limit=50, status='failed')):7.1f} ms")
+        print(f"{'catalog, filename search':<40} {timed(lambda: catalog.list(limit=50, search='chapter_4242_')):7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Embedding Throughput Benchmark
+Compares serial per-chunk embedding against the batched/concurrent path
+using a local stub Ollama server
+
+Usage:
+    python benchmarks/bench_embeddings.py [num_chunks]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# Add backend directory to path to import from app
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.utils import embedding_cache, ollama_client
+from stub_ollama import StubOllamaServer
+
+
+async def serial_embeddings(texts):
+    """Original ingest behaviour: one awaited request per chunk"""
+    return [await ollama_client.generate_embeddings(text, use_cache=False) for text in texts]
+
+
+async def batched_embeddings(texts, batch_size, concurrency, use_cache=False):
+    return await ollama_client.generate_embeddings_batch(
+        texts,
+        batch_size=batch_size,
+        max_concurrency=concurrency,
+        use_cache=use_cache
+    )
+
+
+def run_case(label: str, server: StubOllamaServer, coro_factory, num_texts: int):
+    ollama_client.OLLAMA_BASE_URL = server.base_url
+    ollama_client._batch_embed_supported = None
+    requests_before = server.request_count
+    
+    async def run():
+        try:
+            return await coro_factory()
+        finally:
+            await ollama_client.close_http_client()
+    
+    start = time.perf_counter()
+    embeddings = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    
+    assert len(embeddings) == num_texts
+    print(
+        f"{label:<38} {elapsed:8.2f}s {num_texts / elapsed:10.1f} chunks/s "
+        f"{server.request_count - requests_before:8d} requests"
+    )
+
+
+def main():
+    num_texts = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    texts = [f"Chunk {i}: " + "lorem ipsum dolor sit amet " * 40 for i in range(num_texts)]
+    
+    print(f"Embedding {num_texts} chunks against stub Ollama\n")
+    print(f"{'case':<38} {'time':>9} {'throughput':>17} {'requests':>8}")
+    print("-" * 78)
+    
+    with StubOllamaServer(batch_endpoint=True) as server:
+        run_case("serial /api/embeddings", server,
+                 lambda: serial_embeddings(texts), num_texts)
+        run_case("batched /api/embed (32 x 4)", server,
+                 lambda: batched_embeddings(texts, 32, 4), num_texts)
+    
+    with StubOllamaServer(batch_endpoint=False) as server:
+        run_case("fallback fan-out (concurrency 4)", server,
+                 lambda: batched_embeddings(texts, 32, 4), num_texts)
+        run_case("fallback fan-out (concurrency 8)", server,
+                 lambda: batched_embeddings(texts, 32, 8), num_texts)
+    
+    with tempfile.TemporaryDirectory() as cache_dir, StubOllamaServer() as server:
+        cache_path = os.path.join(cache_dir, "embedding_cache.sqlite3")
+        embedding_cache._embedding_cache = embedding_cache.EmbeddingCache(path=cache_path)
+        run_case("cache cold (batched + cache write)", server,
+                 lambda: batched_embeddings(texts, 32, 4, use_cache=True), num_texts)
+        run_case("cache warm (memory LRU)", server,
+                 lambda: batched_embeddings(texts, 32, 4, use_cache=True), num_texts)
+        
+        # Fresh instance: simulates re-ingesting after a restart/crash
+        embedding_cache._embedding_cache = embedding_cache.EmbeddingCache(path=cache_path)
+        run_case("cache warm (SQLite after restart)", server,
+                 lambda: batched_embeddings(texts, 32, 4, use_cache=True), num_texts)
+        print(f"\nCache stats: {embedding_cache.get_embedding_cache().stats()}")
+
+
+if __name__ == "__main__":
+    main()
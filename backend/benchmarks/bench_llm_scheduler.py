@@ -0,0 +1,153 @@
+"""
+LLM Scheduler Benchmark
+Load test of /api/chat/ask with a burst of distinct questions (no coalescing
+possible) against a stub Ollama that runs two generations at a time and
+queues the rest, like a local Ollama.
+
+- unbounded: every request goes straight to Ollama; queueing happens inside
+  Ollama and late requests run into the read timeout
+- scheduled: the LLM scheduler admits a bounded number of generations,
+  queues some and rejects the rest immediately with 429/503 + Retry-After
+
+A second case mixes batch generations (summaries, MCQs) with chat questions
+to show interactive requests overtaking queued batch work.
+
+Timeouts are scaled down with the stub's latencies so the run takes seconds.
+
+Usage:
+    python benchmarks/bench_llm_scheduler.py [clients]
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Add backend directory to path to import from app
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import httpx
+
+from app.main import app
+from app.db.vector_store import get_vector_store
+from app.rag.answer_cache import get_answer_cache
+from app.rag.lexical_index import get_lexical_index
+from app.utils import llm_scheduler, ollama_client
+from stub_ollama import StubOllamaServer, fake_embedding
+
+
+GENERATION_SLOTS = 2
+CHAT_TIMEOUT = 8.0  # Scaled-down stand-in for the 120 s read timeout
+QUEUE_TIMEOUT = 4.0  # Scaled-down INTERACTIVE_QUEUE_TIMEOUT
+QUEUE_LIMIT = 8
+
+
+def build_knowledge_base(chunks: int = 200):
+    ids = [f"bench_chunk_{i}" for i in range(chunks)]
+    texts = [f"Study notes section {i}: a definition, a worked example and exam tips." for i in range(chunks)]
+    get_vector_store().upsert(
+        ids=ids,
+        embeddings=[fake_embedding(text) for text in texts],
+        documents=texts,
+        metadatas=[{"file_id": "bench", "filename": "notes.pdf", "chunk_index": i} for i in range(chunks)]
+    )
+    get_lexical_index().add_chunks("bench", ids, texts)
+
+
+async def burst(clients: int, tag: str) -> list:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        async def ask(i: int):
+            await asyncio.sleep(i * 0.02)  # Arrivals spread over the first seconds
+            start = time.perf_counter()
+            response = await client.post("/api/chat/ask", json={"question": f"{tag} question number {i}?"})
+            return response.status_code, time.perf_counter() - start
+        
+        try:
+            return await asyncio.gather(*(ask(i) for i in range(clients)))
+        finally:
+            await ollama_client.close_http_client()
+
+
+def report(label: str, results: list, elapsed: float):
+    ok = sorted(latency for status, latency in results if status == 200)
+    rejected = [latency for status, latency in results if status in (429, 503)]
+    failed = sum(1 for status, _ in results if status not in (200, 429, 503))
+    p95 = ok[int(len(ok) * 0.95) - 1] if ok else 0.0
+    print(
+        f"{label:<12} {elapsed:7.1f} s {len(ok):5d} {len(rejected):9d} {failed:7d} "
+        f"{statistics.median(ok) if ok else 0:8.2f} s {p95:8.2f} s "
+        f"{statistics.mean(rejected) * 1000 if rejected else 0:11.0f} ms"
+    )
+
+
+def run_burst(label: str, clients: int, scheduler: llm_scheduler.LLMScheduler):
+    get_answer_cache().clear()
+    llm_scheduler._llm_scheduler = scheduler
+    start = time.perf_counter()
+    results = asyncio.run(burst(clients, label))
+    report(label, results, time.perf_counter() - start)
+
+
+async def mixed_priorities(batch_jobs: int, questions: int) -> dict:
+    """Queue batch generations first, then chat questions; measure time to completion"""
+    scheduler = llm_scheduler.get_llm_scheduler()
+    finished = {llm_scheduler.PRIORITY_BATCH: [], llm_scheduler.PRIORITY_INTERACTIVE: []}
+    start = time.perf_counter()
+    
+    async def generate(priority: int, i: int):
+        await ollama_client.generate_chat_completion(f"Request {priority}-{i}", priority=priority)
+        finished[priority].append(time.perf_counter() - start)
+    
+    try:
+        batch = [asyncio.create_task(generate(llm_scheduler.PRIORITY_BATCH, i)) for i in range(batch_jobs)]
+        await asyncio.sleep(0.05)
+        chat = [asyncio.create_task(generate(llm_scheduler.PRIORITY_INTERACTIVE, i)) for i in range(questions)]
+        await asyncio.gather(*batch, *chat)
+    finally:
+        await ollama_client.close_http_client()
+    return {priority: statistics.mean(times) for priority, times in finished.items()}, scheduler.stats()
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 80
+    
+    with tempfile.TemporaryDirectory() as data_root, StubOllamaServer(
+        prefill_latency=0.3,
+        token_latency=0.01,
+        generation_slots=GENERATION_SLOTS
+    ) as server:
+        os.chdir(data_root)
+        ollama_client.OLLAMA_BASE_URL = server.base_url
+        ollama_client.CHAT_TIMEOUT = httpx.Timeout(CHAT_TIMEOUT, connect=5.0)
+        llm_scheduler.INTERACTIVE_QUEUE_TIMEOUT = QUEUE_TIMEOUT
+        build_knowledge_base()
+        
+        print(f"{clients} distinct questions arriving over {clients * 0.02:.1f} s, "
+              f"{GENERATION_SLOTS} generation slots, {CHAT_TIMEOUT:g} s read timeout\n")
+        print(f"{'case':<12} {'wall':>9} {'ok':>5} {'429/503':>9} {'failed':>7} "
+              f"{'p50 ok':>10} {'p95 ok':>10} {'reject in':>14}")
+        print("-" * 84)
+        run_burst("unbounded", clients, llm_scheduler.LLMScheduler(concurrency=clients, queue_limit=clients))
+        run_burst("scheduled", clients, llm_scheduler.LLMScheduler(
+            concurrency=GENERATION_SLOTS,
+            queue_limit=QUEUE_LIMIT,
+            batch_queue_limit=QUEUE_LIMIT
+        ))
+        
+        llm_scheduler._llm_scheduler = llm_scheduler.LLMScheduler(
+            concurrency=GENERATION_SLOTS,
+            queue_limit=64,
+            batch_queue_limit=64
+        )
+        means, stats = asyncio.run(mixed_priorities(batch_jobs=10, questions=10))
+        print(f"\n10 batch generations queued before 10 chat questions: chat finishes after "
+              f"{means[llm_scheduler.PRIORITY_INTERACTIVE]:.1f} s on average, "
+              f"batch after {means[llm_scheduler.PRIORITY_BATCH]:.1f} s")
+        print(f"Scheduler: {stats}")
+
+
+if __name__ == "__main__":
+    main()
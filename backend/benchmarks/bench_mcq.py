@@ -0,0 +1,143 @@
+"""
+MCQ Generation Benchmark
+50-question sets from a textbook-sized document against the stub Ollama
+server (two generation slots, like a local Ollama), whose replies are
+well-formed Q1:/A)/Correct Answer: blocks built from the prompt's content.
+Every reply also repeats one generic question, which de-duplication removes.
+
+- coverage: topics reached by the chunks questions are generated from,
+  taking the first chunks vs clustering chunk embeddings
+- cold, sequential vs parallel group generations
+- repeat: served from the question bank
+- extend: a larger set only generates the missing questions
+
+Usage:
+    python benchmarks/bench_mcq.py [chunks] [questions]
+"""
+
+import asyncio
+import os
+import re
+import sys
+import tempfile
+import time
+
+# Add backend directory to path to import from app
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+
+from app.db.vector_store import get_vector_store
+from app.rag import mcq
+from app.rag.question_bank import get_question_bank
+from app.utils import ollama_client
+from stub_ollama import StubOllamaServer, EMBEDDING_DIM
+
+
+GENERATION_SLOTS = 2
+TOPIC_SHARES = [0.35, 0.2, 0.1, 0.08, 0.07, 0.06, 0.05, 0.04, 0.03, 0.02]  # Chapters of uneven length
+
+
+def mcq_reply(prompt: str) -> str:
+    """Five questions about the topics in the prompt, the last one generic"""
+    topics = re.findall(r"Topic (\d+) part (\d+)", prompt) or [("0", "0")]
+    blocks = []
+    for i in range(1, 5):
+        topic, part = topics[(i * 7) % len(topics)]
+        blocks.append(
+            f"Q{i}: Which statement about topic {topic}, part {part}, fact {i} is correct?\n"
+            f"A) Fact {i} of part {part} is wrong\nB) Fact {i} of part {part} holds for topic {topic}\n"
+            f"C) It is unrelated\nD) None of the above\n"
+            f"Correct Answer: B\nExplanation: Part {part} states fact {i} for topic {topic}."
+        )
+    blocks.append(
+        "Q5: What is the main purpose of this section?\n"
+        "A) To entertain\nB) To explain the topic\nC) To list references\nD) To test the reader\n"
+        "Correct Answer: B\nExplanation: Study notes explain a topic."
+    )
+    return "\n\n".join(blocks)
+
+
+def build_document(file_id: str, count: int) -> list:
+    """Chunks whose embeddings cluster by chapter topic"""
+    rng = np.random.default_rng(7)
+    centres = rng.normal(size=(len(TOPIC_SHARES), EMBEDDING_DIM))
+    bounds = np.cumsum(TOPIC_SHARES) * count
+    topics = [int(np.searchsorted(bounds, i, side="right")) for i in range(count)]
+    texts = [f"Topic {topic} part {i}: definitions, a worked example and exam tips." for i, topic in enumerate(topics)]
+    embeddings = centres[topics] + rng.normal(scale=0.6, size=(count, EMBEDDING_DIM))
+    
+    get_vector_store().upsert(
+        ids=[f"{file_id}_chunk_{i}" for i in range(count)],
+        embeddings=embeddings.tolist(),
+        documents=texts,
+        metadatas=[
+            {"file_id": file_id, "filename": "textbook.pdf", "chunk_index": i, "page_start": i // 3 + 1,
+             "total_chunks": count}
+            for i in range(count)
+        ]
+    )
+    return [
+        {"id": f"{file_id}_chunk_{i}", "text": texts[i], "embedding": embeddings[i],
+         "metadata": {"chunk_index": i, "topic": topics[i]}}
+        for i in range(count)
+    ]
+
+
+def coverage(groups: list) -> int:
+    return len({chunk["metadata"]["topic"] for group in groups for chunk in group})
+
+
+async def generate_once(file_id: str, questions: int) -> dict:
+    try:
+        return await mcq.generate_mcqs(file_id, questions)
+    finally:
+        await ollama_client.close_http_client()
+
+
+def run_case(label: str, server: StubOllamaServer, file_id: str, questions: int, concurrency: int):
+    mcq.MCQ_CONCURRENCY = concurrency
+    generations_before = server.generation_count
+    start = time.perf_counter()
+    result = asyncio.run(generate_once(file_id, questions))
+    elapsed = time.perf_counter() - start
+    
+    print(
+        f"{label:<28} {elapsed:7.2f} s {len(result['questions']):9d} {result['from_bank']:9d} "
+        f"{result['duplicates_removed']:11d} {server.generation_count - generations_before:10d}"
+    )
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    questions = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    groups = -(-int(questions * mcq.MCQ_OVERSAMPLE) // mcq.MCQ_QUESTIONS_PER_GROUP)
+    
+    with tempfile.TemporaryDirectory() as data_root, StubOllamaServer(
+        prefill_latency=0.3,
+        token_latency=0.005,
+        generation_slots=GENERATION_SLOTS,
+        answer_fn=mcq_reply
+    ) as server:
+        os.chdir(data_root)
+        ollama_client.OLLAMA_BASE_URL = server.base_url
+        chunks = build_document("bench", count)
+        
+        first = [chunks[i:i + mcq.MCQ_CHUNKS_PER_GROUP] for i in range(0, groups * mcq.MCQ_CHUNKS_PER_GROUP, mcq.MCQ_CHUNKS_PER_GROUP)]
+        print(f"{count} chunks in {len(TOPIC_SHARES)} chapters, {groups} groups of {mcq.MCQ_CHUNKS_PER_GROUP} chunks: "
+              f"first chunks cover {coverage(first)} chapters, "
+              f"clustered chunks cover {coverage(mcq.select_chunk_groups(chunks, groups))}\n")
+        
+        print(f"{'case':<28} {'wall':>9} {'questions':>9} {'from bank':>9} {'duplicates':>11} {'llm calls':>10}")
+        print("-" * 82)
+        run_case(f"{questions} questions, sequential", server, "bench", questions, concurrency=1)
+        get_question_bank().remove(["bench"])
+        run_case(f"{questions} questions, {GENERATION_SLOTS} parallel", server, "bench", questions, concurrency=GENERATION_SLOTS)
+        run_case(f"{questions} questions, repeat", server, "bench", questions, concurrency=GENERATION_SLOTS)
+        run_case(f"extend to {questions + 30}", server, "bench", questions + 30, concurrency=GENERATION_SLOTS)
+        
+        print(f"\nQuestion bank: {get_question_bank().stats()}")
+
+
+if __name__ == "__main__":
+    main()
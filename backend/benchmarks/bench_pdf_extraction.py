@@ -0,0 +1,89 @@
+"""
+PDF Extraction Benchmark
+Compares serial page extraction on the event loop against the process-pool
+extractor, and measures event-loop stalls while each one runs
+
+Usage:
+    python benchmarks/bench_pdf_extraction.py [pages] [source.pdf]
+"""
+
+import asyncio
+import glob
+import os
+import sys
+import tempfile
+import time
+
+# Add backend directory to path to import from app
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import PyPDF2
+
+from app.utils import pdf_utils
+
+
+def build_pdf(source_path: str, num_pages: int) -> str:
+    """Create a large PDF by repeating the pages of a source PDF"""
+    reader = PyPDF2.PdfReader(source_path)
+    writer = PyPDF2.PdfWriter()
+    for i in range(num_pages):
+        writer.add_page(reader.pages[i % len(reader.pages)])
+    
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as out:
+        writer.write(out)
+    return path
+
+
+async def measure(extract):
+    """Run an extraction while a heartbeat task records the worst loop stall"""
+    max_lag = 0.0
+    done = False
+    
+    async def heartbeat():
+        nonlocal max_lag
+        while not done:
+            before = time.perf_counter()
+            await asyncio.sleep(0.01)
+            max_lag = max(max_lag, time.perf_counter() - before - 0.01)
+    
+    monitor = asyncio.create_task(heartbeat())
+    await asyncio.sleep(0.02)  # Let the heartbeat start ticking
+    start = time.perf_counter()
+    text = await extract()
+    elapsed = time.perf_counter() - start
+    done = True
+    await monitor
+    return elapsed, max_lag, len(text)
+
+
+def main():
+    num_pages = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    uploads = os.path.join(os.path.dirname(__file__), '..', 'data', 'uploads', '*.pdf')
+    source = sys.argv[2] if len(sys.argv) > 2 else sorted(glob.glob(uploads))[0]
+    
+    path = build_pdf(source, num_pages)
+    
+    async def serial():
+        return pdf_utils.extract_text_from_pdf(path)
+    
+    async def parallel():
+        return await pdf_utils.extract_text_from_pdf_async(path)
+    
+    try:
+        results = {}
+        for label, extract in (("serial", serial), ("process pool", parallel)):
+            results[label] = asyncio.run(measure(extract))
+        pdf_utils.shutdown_extraction_pool()
+        
+        print(f"\n{num_pages} pages, {pdf_utils.PDF_EXTRACTION_WORKERS} workers\n")
+        print(f"{'mode':<14} {'time':>9} {'max loop stall':>16} {'characters':>12}")
+        print("-" * 55)
+        for label, (elapsed, lag, chars) in results.items():
+            print(f"{label:<14} {elapsed:8.2f}s {lag * 1000:14.1f}ms {chars:12d}")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
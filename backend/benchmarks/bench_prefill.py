@@ -0,0 +1,158 @@
+"""
+Prefill Benchmark
+Replays tutoring sessions (several follow-up questions, idle gaps between
+questions and between sessions) against the stub Ollama server and compares:
+
+- legacy: one flattened prompt per question on /api/generate, with Ollama's
+  default 5 minute keep_alive
+- chat: system message, history and question as /api/chat messages with
+  CHAT_KEEP_ALIVE, after warming the model at startup
+
+The stub prefills only the part of each prompt after the longest cached
+prefix and reloads the model after keep_alive expires. Idle time is simulated,
+so the benchmark runs in seconds; latencies are scaled down from a CPU-bound
+8B model but their ratios carry over.
+
+Usage:
+    python benchmarks/bench_prefill.py [sessions] [turns]
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+
+# Add backend directory to path to import from app
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.rag.prompts import SYSTEM_PROMPT, build_chat_prompt
+from app.utils import ollama_client
+from stub_ollama import StubOllamaServer
+
+
+PROMPT_TOKEN_LATENCY = 0.0004  # Seconds per prefilled prompt token
+LOAD_LATENCY = 0.5  # Seconds to load the model into memory
+TURN_GAP = (20, 180)  # Seconds between follow-up questions
+SESSION_GAP = (360, 1500)  # Seconds between sessions
+
+TOPICS = ["photosynthesis", "cell membrane", "velocity", "chemical equations", "mitochondria"]
+
+
+def make_chunks(rng: random.Random, topic: str, turn: int):
+    sentences = [
+        f"The {topic} section explains point {turn}.{i} with a worked example and a diagram."
+        for i in range(rng.randint(20, 30))
+    ]
+    return [
+        {"text": " ".join(sentences[i::3]), "filename": f"{topic}.pdf", "page": 10 + turn + i}
+        for i in range(3)
+    ]
+
+
+def build_sessions(sessions: int, turns: int):
+    rng = random.Random(7)
+    plan = []
+    for session in range(sessions):
+        topic = TOPICS[session % len(TOPICS)]
+        questions = [
+            (f"Question {turn + 1} about {topic}: can you explain it step by step?",
+             make_chunks(rng, topic, turn),
+             rng.uniform(*TURN_GAP))
+            for turn in range(turns)
+        ]
+        plan.append((questions, rng.uniform(*SESSION_GAP)))
+    return plan
+
+
+async def legacy_completion(prompt: str) -> dict:
+    """Original request: flattened prompt, server default keep_alive"""
+    response = await ollama_client.get_http_client().post(
+        "/api/generate",
+        json={
+            "model": ollama_client.CHAT_MODEL,
+            "prompt": prompt,
+            "stream": False,
+            "options": {"temperature": 0.7, "num_ctx": ollama_client.CHAT_CONTEXT_WINDOW}
+        }
+    )
+    return response.json()
+
+
+async def replay(server: StubOllamaServer, plan, mode: str) -> dict:
+    totals = {"requests": 0, "evaluated": 0, "prefill_ms": 0.0, "load_ms": 0.0, "cold": 0, "wall": 0.0}
+    
+    if mode == "chat":
+        await ollama_client.warm_chat_model(SYSTEM_PROMPT)
+    
+    for questions, session_gap in plan:
+        history = []
+        for question, chunks, turn_gap in questions:
+            built = build_chat_prompt(question, chunks, history)
+            before = dict(ollama_client.get_chat_stats())
+            
+            start = time.perf_counter()
+            if mode == "chat":
+                answer = await ollama_client.generate_chat_completion(messages=built["messages"])
+                after = ollama_client.get_chat_stats()
+                stats = {
+                    "prompt_eval_count": after["prompt_tokens_evaluated"] - before["prompt_tokens_evaluated"],
+                    "prompt_eval_duration": (after["prefill_ms"] - before["prefill_ms"]) * 1e6,
+                    "load_duration": (after["load_ms"] - before["load_ms"]) * 1e6
+                }
+            else:
+                stats = await legacy_completion(built["prompt"])
+                answer = stats["response"]
+            totals["wall"] += time.perf_counter() - start
+            
+            totals["requests"] += 1
+            totals["evaluated"] += stats["prompt_eval_count"]
+            totals["prefill_ms"] += stats["prompt_eval_duration"] / 1e6
+            totals["load_ms"] += stats["load_duration"] / 1e6
+            totals["cold"] += stats["load_duration"] > 0
+            
+            history += [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+            server.advance(turn_gap)
+        server.advance(session_gap)
+    
+    return totals
+
+
+def run_case(label: str, plan, mode: str):
+    with StubOllamaServer(
+        prefill_latency=0.0,
+        token_latency=0.0,
+        prompt_token_latency=PROMPT_TOKEN_LATENCY,
+        load_latency=LOAD_LATENCY
+    ) as server:
+        ollama_client.OLLAMA_BASE_URL = server.base_url
+        
+        async def run():
+            try:
+                return await replay(server, plan, mode)
+            finally:
+                await ollama_client.close_http_client()
+        
+        totals = asyncio.run(run())
+    
+    print(
+        f"{label:<24} {totals['evaluated'] / totals['requests']:12.0f} {totals['prefill_ms']:11.0f} ms "
+        f"{totals['cold']:6d} {totals['load_ms']:9.0f} ms {totals['wall']:8.2f} s"
+    )
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    plan = build_sessions(sessions, turns)
+    
+    print(f"{sessions} sessions x {turns} questions, "
+          f"{PROMPT_TOKEN_LATENCY * 1000:g} ms per prefilled token, {LOAD_LATENCY:g} s model load\n")
+    print(f"{'case':<24} {'tokens/req':>12} {'prefill':>14} {'loads':>6} {'load':>12} {'wall':>10}")
+    print("-" * 84)
+    run_case("legacy /api/generate", plan, "legacy")
+    run_case(f"chat + keep_alive {ollama_client.CHAT_KEEP_ALIVE}", plan, "chat")
+
+
+if __name__ == "__main__":
+    main()
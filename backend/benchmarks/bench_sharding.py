@@ -0,0 +1,134 @@
+"""
+Sharding Benchmark
+Dense retrieval over one collection vs the same chunks split into
+subject/grade shards, for both vector search backends (clustered 768-dim
+embeddings; every topic belongs to one subject):
+
+- single collection: every chunk in one shard
+- one shard: the query is scoped to the subject it belongs to
+- fan-out: every shard searched concurrently, hits merged into a global top 10
+
+Recall@10 is measured against an exact search of the chunks the query can
+see (the whole corpus, or the selected shard).
+
+Usage:
+    python benchmarks/bench_sharding.py [vectors] [chroma_vectors] [shards] [queries]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# Add backend directory to path to import from app
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+
+from app.db import vector_index
+from app.db.vector_store import get_vector_store
+from app.rag import retrieval
+from stub_ollama import EMBEDDING_DIM
+from bench_vector_search import INSERT_BATCH, TOP_K, TOPICS
+
+
+def build_corpus(count: int, queries: int, shards: int):
+    """Clustered vectors with a subject shard per topic, and queries near random chunks"""
+    rng = np.random.default_rng(11)
+    centres = rng.normal(size=(TOPICS, EMBEDDING_DIM)).astype(np.float32)
+    topics = rng.integers(TOPICS, size=count)
+    vectors = np.empty((count, EMBEDDING_DIM), dtype=np.float32)
+    for start in range(0, count, INSERT_BATCH):
+        stop = min(start + INSERT_BATCH, count)
+        vectors[start:stop] = centres[topics[start:stop]] + rng.normal(scale=1.0, size=(stop - start, EMBEDDING_DIM))
+    targets = rng.integers(count, size=queries)
+    query_vectors = vectors[targets] + rng.normal(scale=1.0, size=(queries, EMBEDDING_DIM)).astype(np.float32)
+    return vectors, topics % shards, query_vectors, topics[targets] % shards
+
+
+def exact_top_k(vectors: np.ndarray, query: np.ndarray, rows: np.ndarray) -> set:
+    distances = np.einsum("ij,ij->i", vectors[rows], vectors[rows]) - 2.0 * (vectors[rows] @ query)
+    return {f"c{rows[i]}" for i in np.argpartition(distances, TOP_K)[:TOP_K]}
+
+
+def store(vectors: np.ndarray, shard_of_row):
+    """Write the corpus to the current backend's collections"""
+    for offset in range(0, len(vectors), INSERT_BATCH):
+        by_shard = {}
+        for i in range(offset, min(offset + INSERT_BATCH, len(vectors))):
+            by_shard.setdefault(shard_of_row(i), []).append(i)
+        for shard, rows in by_shard.items():
+            ids = [f"c{i}" for i in rows]
+            metadatas = [{"file_id": f"doc{i // 200}", "shard": shard} for i in rows]
+            if vector_index.vector_index_enabled():
+                vector_index.get_vector_index(shard).upsert(ids, vectors[rows], [""] * len(rows), metadatas)
+            else:
+                get_vector_store(shard).add(
+                    ids=ids,
+                    embeddings=vectors[rows].tolist(),
+                    documents=[""] * len(rows),
+                    metadatas=metadatas
+                )
+    for index in vector_index.loaded_vector_indexes().values():
+        index.train()
+
+
+def run(label: str, vectors: np.ndarray, queries: np.ndarray, visible_rows: list, shards_of_query: list):
+    latencies, recalls = [], []
+    for query, rows, shards in zip(queries, visible_rows, shards_of_query):
+        start = time.perf_counter()
+        found = retrieval.hybrid_search("", query.tolist(), TOP_K, shards=shards)
+        latencies.append(time.perf_counter() - start)
+        recalls.append(len({chunk["id"] for chunk in found} & exact_top_k(vectors, query, rows)) / TOP_K)
+    
+    latencies_ms = np.array(latencies) * 1000
+    print(
+        f"{label:<40} {np.percentile(latencies_ms, 50):8.2f} {np.percentile(latencies_ms, 95):8.2f} "
+        f"{np.mean(recalls):9.3f}"
+    )
+
+
+def run_backend(backend: str, vectors: np.ndarray, subjects: np.ndarray, queries: np.ndarray,
+                query_subjects: np.ndarray, shard_count: int):
+    vector_index.VECTOR_SEARCH_BACKEND = backend
+    subject_shards = [f"subject-{subject}" for subject in range(shard_count)]
+    
+    # The same chunks twice: one "all" collection, and one collection per subject
+    start = time.perf_counter()
+    store(vectors, lambda i: "all")
+    store(vectors, lambda i: subject_shards[subjects[i]])
+    print(f"   ({backend}: stored {len(vectors)} vectors twice in {time.perf_counter() - start:.1f} s)")
+    
+    all_rows = np.arange(len(vectors))
+    subject_rows = [np.flatnonzero(subjects == subject) for subject in range(shard_count)]
+    run(f"{backend}, single collection", vectors, queries,
+        [all_rows] * len(queries), [["all"]] * len(queries))
+    run(f"{backend}, one of {shard_count} shards", vectors, queries,
+        [subject_rows[subject] for subject in query_subjects],
+        [[subject_shards[subject]] for subject in query_subjects])
+    run(f"{backend}, fan-out to {shard_count} shards", vectors, queries,
+        [all_rows] * len(queries), [subject_shards] * len(queries))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    chroma_count = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+    shard_count = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    query_count = int(sys.argv[4]) if len(sys.argv) > 4 else 200
+    
+    # Dense ranking only: the lexical side is the same global index either way
+    retrieval.HYBRID_SEARCH_ENABLED = False
+    
+    print(f"768-dim vectors in {TOPICS} topics over {shard_count} subject shards, {query_count} queries, top {TOP_K}\n")
+    print(f"{'case':<40} {'p50 ms':>8} {'p95 ms':>8} {'recall@10':>9}")
+    print("-" * 68)
+    
+    vectors, subjects, queries, query_subjects = build_corpus(count, query_count, shard_count)
+    with tempfile.TemporaryDirectory() as data_root:
+        os.chdir(data_root)
+        run_backend("numpy", vectors, subjects, queries, query_subjects, shard_count)
+        run_backend("chroma", vectors[:chroma_count], subjects[:chroma_count], queries, query_subjects, shard_count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Document Summarization Benchmark
+Map-reduce summarization of a textbook-sized document against the stub
+Ollama server (two generation slots, like a local Ollama):
+
+- single prompt: size of the original all-chunks summarization prompt
+- cold, sequential vs parallel steps
+- repeat: every step served from the summary cache
+- edited: one chunk of the document changed (a re-upload gets a new file_id)
+
+Usage:
+    python benchmarks/bench_summarize.py [chunks]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# Add backend directory to path to import from app
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.db.vector_store import get_vector_store
+from app.rag import summarize
+from app.rag.chunking import estimate_tokens
+from app.rag.prompts import create_summarization_prompt
+from app.rag.summary_cache import get_summary_cache
+from app.utils import ollama_client
+from app.utils.ollama_client import CHAT_CONTEXT_WINDOW
+from stub_ollama import StubOllamaServer, fake_embedding
+
+
+GENERATION_SLOTS = 2
+EDITED_CHUNK = 37
+
+
+def chunk_texts(count: int, edited: bool = False) -> list:
+    texts = []
+    for i in range(count):
+        sentences = [
+            f"Topic {i} sentence {j}: the definition, a worked example and the exam tip for part {i}."
+            for j in range(14)
+        ]
+        if edited and i == EDITED_CHUNK:
+            sentences[3] = f"Topic {i} now includes a corrected formula and a new example."
+        texts.append(" ".join(sentences))
+    return texts
+
+
+def store_document(file_id: str, texts: list):
+    get_vector_store().upsert(
+        ids=[f"{file_id}_chunk_{i}" for i in range(len(texts))],
+        embeddings=[fake_embedding(text) for text in texts],
+        documents=texts,
+        metadatas=[
+            {"file_id": file_id, "filename": "textbook.pdf", "chunk_index": i, "total_chunks": len(texts)}
+            for i in range(len(texts))
+        ]
+    )
+
+
+async def summarize_once(file_id: str) -> dict:
+    try:
+        return await summarize.generate_document_summary(file_id)
+    finally:
+        await ollama_client.close_http_client()
+
+
+def run_case(label: str, server: StubOllamaServer, file_id: str, concurrency: int):
+    summarize.SUMMARY_CONCURRENCY = concurrency
+    generations_before = server.generation_count
+    start = time.perf_counter()
+    result = asyncio.run(summarize_once(file_id))
+    elapsed = time.perf_counter() - start
+    
+    print(
+        f"{label:<28} {elapsed:7.2f} s {result['levels']:7d} "
+        f"{result['steps']['generated']:10d} {result['steps']['cached']:7d} "
+        f"{server.generation_count - generations_before:12d}"
+    )
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    
+    with tempfile.TemporaryDirectory() as data_root, StubOllamaServer(
+        prefill_latency=0.2,
+        token_latency=0.005,
+        generation_slots=GENERATION_SLOTS,
+        vary_answers=True
+    ) as server:
+        os.chdir(data_root)
+        ollama_client.OLLAMA_BASE_URL = server.base_url
+        
+        texts = chunk_texts(count)
+        store_document("bench_v1", texts)
+        store_document("bench_v2", chunk_texts(count, edited=True))
+        
+        single_prompt = create_summarization_prompt([{"text": text} for text in texts], "textbook.pdf")
+        print(f"{count} chunks, {sum(estimate_tokens(t) for t in texts)} tokens; "
+              f"single summarization prompt: {estimate_tokens(single_prompt)} tokens "
+              f"(context window {CHAT_CONTEXT_WINDOW})\n")
+        
+        print(f"{'case':<28} {'wall':>9} {'levels':>7} {'generated':>10} {'cached':>7} {'generations':>12}")
+        print("-" * 78)
+        run_case("cold, sequential", server, "bench_v1", concurrency=1)
+        get_summary_cache().clear()
+        run_case(f"cold, {GENERATION_SLOTS} in parallel", server, "bench_v1", concurrency=GENERATION_SLOTS)
+        run_case("repeat", server, "bench_v1", concurrency=GENERATION_SLOTS)
+        run_case(f"chunk {EDITED_CHUNK} edited", server, "bench_v2", concurrency=GENERATION_SLOTS)
+        
+        print(f"\nSummary cache: {get_summary_cache().stats()}")
+
+
+if __name__ == "__main__":
+    main()
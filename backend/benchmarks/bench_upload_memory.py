@@ -0,0 +1,84 @@
+"""
+Upload Memory Benchmark
+Compares peak Python memory of buffering whole uploads against streaming
+them to disk, for several concurrent large uploads
+
+Usage:
+    python benchmarks/bench_upload_memory.py [size_mb] [concurrency]
+"""
+
+import asyncio
+import hashlib
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Add backend directory to path to import from app
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from fastapi import UploadFile
+
+from app.utils.upload_utils import save_upload_to_temp
+
+
+async def buffered_save(upload: UploadFile, dest_dir: str):
+    """Original upload path: read everything, hash, then write"""
+    content = await upload.read()
+    digest = hashlib.sha256(content).hexdigest()
+    path = os.path.join(dest_dir, f"{digest}.pdf")
+    with open(path, "wb") as buffer:
+        buffer.write(content)
+    return path
+
+
+async def streamed_save(upload: UploadFile, dest_dir: str):
+    temp_path, digest, _ = await save_upload_to_temp(upload, dest_dir)
+    path = os.path.join(dest_dir, f"{digest}.pdf")
+    os.replace(temp_path, path)
+    return path
+
+
+def run_case(label: str, save, source_path: str, concurrency: int):
+    with tempfile.TemporaryDirectory() as dest_dir:
+        async def run():
+            files = [open(source_path, "rb") for _ in range(concurrency)]
+            try:
+                uploads = [UploadFile(file=f, filename="bundle.pdf") for f in files]
+                await asyncio.gather(*(save(upload, dest_dir) for upload in uploads))
+            finally:
+                for f in files:
+                    f.close()
+        
+        tracemalloc.start()
+        start = time.perf_counter()
+        asyncio.run(run())
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    
+    print(f"{label:<12} {elapsed:8.2f}s {peak / (1024 * 1024):12.1f} MB peak")
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as source:
+        for _ in range(size_mb):
+            source.write(os.urandom(1024 * 1024))
+        source_path = source.name
+    
+    try:
+        print(f"{concurrency} concurrent uploads of {size_mb} MB\n")
+        print(f"{'mode':<12} {'time':>9} {'memory':>20}")
+        print("-" * 44)
+        run_case("buffered", buffered_save, source_path, concurrency)
+        run_case("streamed", streamed_save, source_path, concurrency)
+    finally:
+        os.remove(source_path)
+
+
+if __name__ == "__main__":
+    main()
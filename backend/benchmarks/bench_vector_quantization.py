@@ -0,0 +1,85 @@
+"""
+Vector Quantization Benchmark
+Memory and recall of the in-process vector index's storage modes on clustered
+768-dim embeddings (same corpus as bench_vector_search.py):
+
+- float32 / float16 / int8 / pq: size of the scanned matrix per vector, and
+  the index's total size on disk (quantized modes keep the float32 originals
+  next to the codes; ChromaDB's own float32 copy and HNSW graph come on top)
+- recall@10 against an exact float32 search, from the quantized codes alone
+  and with the top candidates rescored from the float32 originals
+- IVF + pq: the coarse quantizer combined with pq codes
+
+Usage:
+    python benchmarks/bench_vector_quantization.py [vectors] [queries]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# Add backend directory to path to import from app
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+
+from app.db import vector_index
+from app.db.vector_index import VectorIndex
+from bench_vector_search import TOP_K, build_corpus, build_index, exact_top_k
+
+
+def measure(index: VectorIndex, queries: np.ndarray, truth: list, rescore: bool):
+    vector_index.VECTOR_RESCORE = rescore
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        found = index.search(query, TOP_K)
+        latencies.append(time.perf_counter() - start)
+        recalls.append(len({chunk_id for chunk_id, _ in found} & expected) / TOP_K)
+    return np.percentile(np.array(latencies) * 1000, 50), np.mean(recalls)
+
+
+def report(label: str, index: VectorIndex, queries: np.ndarray, truth: list, count: int):
+    stats = index.stats()
+    bytes_per_vector = stats["scanned_mb"] * 1024 * 1024 / count
+    disk_mb = stats["scanned_mb"] + (stats["originals_mb"] if index.quantization != "float32" else 0)
+    plain_ms, plain_recall = measure(index, queries, truth, rescore=False)
+    if index.quantization == "float32":
+        rescored = "-"
+    else:
+        rescored_ms, rescored_recall = measure(index, queries, truth, rescore=True)
+        rescored = f"{rescored_recall:.3f} / {rescored_ms:.1f} ms"
+    print(
+        f"{label:<16} {stats['scanned_mb']:9.1f} {disk_mb:10.1f} {bytes_per_vector:7.0f} {3072 / bytes_per_vector:6.1f}x "
+        f"{plain_recall:.3f} / {plain_ms:5.1f} ms   {rescored}"
+    )
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    query_count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    
+    vectors, queries = build_corpus(count, query_count)
+    truth = exact_top_k(vectors, queries)
+    
+    with tempfile.TemporaryDirectory() as data_root:
+        os.chdir(data_root)
+        print(f"{count} vectors x {vectors.shape[1]} dims, {query_count} queries, top {TOP_K}, "
+              f"rescoring {vector_index.VECTOR_RESCORE_FACTOR * TOP_K} candidates\n")
+        print(f"{'storage':<16} {'RAM (MB)':>9} {'disk (MB)':>10} {'B/vec':>7} {'ratio':>7} {'recall / p50':<22} {'rescored recall / p50'}")
+        print("-" * 97)
+        
+        for quantization in ("float32", "float16", "int8", "pq"):
+            index = build_index(quantization, quantization, vectors, ann_threshold=count)
+            report(quantization, index, queries, truth, count)
+            
+            if quantization == "pq":
+                index.ann_threshold = 0
+                index.train()
+                report("IVF + pq", index, queries, truth, count)
+            del index
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Vector Search Benchmark
+Dense top-10 retrieval over clustered 768-dim embeddings (like nomic-embed-text
+chunks of many documents):
+
+- ChromaDB collection.query (HNSW) on a corpus it can build in reasonable time
+- in-process index, exact scan, float32 / float16 / int8 storage
+- in-process index, IVF, for a range of probed lists
+
+Recall@10 is measured against an exact float32 search of the same corpus.
+
+Usage:
+    python benchmarks/bench_vector_search.py [vectors] [chroma_vectors] [queries]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# Add backend directory to path to import from app
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+
+from app.db import vector_index
+from app.db.vector_index import VectorIndex
+from app.db.vector_store import get_vector_store
+from stub_ollama import EMBEDDING_DIM
+
+
+TOP_K = 10
+TOPICS = 1000  # Topics (clusters) across the corpus
+INSERT_BATCH = 5000
+
+
+def build_corpus(count: int, queries: int):
+    """Vectors clustered around topic centres, and queries near random chunks"""
+    rng = np.random.default_rng(11)
+    centres = rng.normal(size=(TOPICS, EMBEDDING_DIM)).astype(np.float32)
+    topics = rng.integers(TOPICS, size=count)
+    vectors = np.empty((count, EMBEDDING_DIM), dtype=np.float32)
+    for start in range(0, count, INSERT_BATCH):
+        stop = min(start + INSERT_BATCH, count)
+        vectors[start:stop] = centres[topics[start:stop]] + rng.normal(scale=1.0, size=(stop - start, EMBEDDING_DIM))
+    targets = rng.integers(count, size=queries)
+    query_vectors = vectors[targets] + rng.normal(scale=1.0, size=(queries, EMBEDDING_DIM)).astype(np.float32)
+    return vectors, query_vectors
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray) -> list:
+    norms = np.einsum("ij,ij->i", vectors, vectors)
+    truth = []
+    for query in queries:
+        distances = norms - 2.0 * (vectors @ query)
+        top = np.argpartition(distances, TOP_K)[:TOP_K]
+        truth.append({f"c{i}" for i in top})
+    return truth
+
+
+def report(label: str, latencies: list, results: list, truth: list):
+    latencies_ms = np.array(latencies) * 1000
+    recall = np.mean([len(set(found) & expected) / TOP_K for found, expected in zip(results, truth)])
+    print(
+        f"{label:<34} {np.percentile(latencies_ms, 50):8.2f} {np.percentile(latencies_ms, 95):8.2f} "
+        f"{recall:9.3f}"
+    )
+
+
+def run_chroma(vectors: np.ndarray, queries: np.ndarray, truth: list):
+    vector_store = get_vector_store()
+    start = time.perf_counter()
+    for offset in range(0, len(vectors), INSERT_BATCH):
+        batch = vectors[offset:offset + INSERT_BATCH]
+        vector_store.add(
+            ids=[f"c{i}" for i in range(offset, offset + len(batch))],
+            embeddings=batch.tolist(),
+            documents=[""] * len(batch),
+            metadatas=[{"file_id": f"doc{i // 200}"} for i in range(offset, offset + len(batch))]
+        )
+    print(f"   (ChromaDB insert of {len(vectors)} vectors: {time.perf_counter() - start:.1f} s)")
+    
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        found = vector_store.query(query_embeddings=[query.tolist()], n_results=TOP_K)
+        latencies.append(time.perf_counter() - start)
+        results.append(found["ids"][0])
+    report(f"chroma HNSW, {len(vectors)}", latencies, results, truth)
+
+
+def build_index(path: str, quantization: str, vectors: np.ndarray, ann_threshold: int) -> VectorIndex:
+    index = VectorIndex(path, quantization=quantization, ann_threshold=ann_threshold)
+    for offset in range(0, len(vectors), INSERT_BATCH):
+        batch = vectors[offset:offset + INSERT_BATCH]
+        index.upsert(
+            ids=[f"c{i}" for i in range(offset, offset + len(batch))],
+            embeddings=batch,
+            documents=[""] * len(batch),
+            metadatas=[{"file_id": f"doc{i // 200}"} for i in range(offset, offset + len(batch))]
+        )
+    index.train()
+    return index
+
+
+def run_index(label: str, index: VectorIndex, queries: np.ndarray, truth: list):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        found = index.search(query, TOP_K)
+        latencies.append(time.perf_counter() - start)
+        results.append([chunk_id for chunk_id, _ in found])
+    report(label, latencies, results, truth)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    chroma_count = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+    query_count = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    
+    vectors, queries = build_corpus(count, query_count)
+    truth = exact_top_k(vectors, queries)
+    
+    with tempfile.TemporaryDirectory() as data_root:
+        os.chdir(data_root)
+        print(f"{count} vectors x {EMBEDDING_DIM} dims in {TOPICS} topics, {query_count} queries, top {TOP_K}\n")
+        print(f"{'case':<34} {'p50 ms':>8} {'p95 ms':>8} {'recall@10':>9}")
+        print("-" * 62)
+        
+        small = vectors[:chroma_count]
+        small_truth = exact_top_k(small, queries)
+        run_chroma(small, queries, small_truth)
+        small_index = build_index("small_float32", "float32", small, ann_threshold=count)
+        run_index(f"numpy exact float32, {chroma_count}", small_index, queries, small_truth)
+        del small_index
+        
+        for dtype in ("float32", "float16", "int8"):
+            index = build_index(dtype, dtype, vectors, ann_threshold=count)
+            run_index(f"numpy exact {dtype}, {count}", index, queries, truth)
+            
+            if dtype in ("float32", "int8"):
+                index.ann_threshold = 0
+                index.train()
+                for probes in (4, 12, 32):
+                    vector_index.IVF_PROBES = probes
+                    run_index(f"IVF {dtype}, {probes} probes, {count}", index, queries, truth)
+            
+            print(f"   ({dtype} matrix: {index.stats()['scanned_mb']} MB)")
+            del index
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+Stub Ollama Server
+Minimal local imitation of the Ollama REST API for benchmarks
+
+Embeddings are deterministic pseudo-random vectors derived from the text,
+generation returns a canned answer token by token, and every request sleeps
+for a configurable latency to model network and inference cost, so numbers
+reflect request patterns rather than real model speed.
+
+Generation also imitates the llama.cpp runner behind Ollama: the model is
+unloaded after keep_alive seconds of idleness (reloading costs load_latency),
+and each of a few parallel slots keeps the KV cache of its last prompt, so
+only the part of a prompt after the longest cached prefix is prefilled.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional, Union
+
+
+EMBEDDING_DIM = 768
+CHARS_PER_TOKEN = 4  # Prompt length in characters per simulated token
+DEFAULT_KEEP_ALIVE = 300.0  # Ollama unloads idle models after 5 minutes by default
+CANNED_ANSWER = (
+    "Photosynthesis converts light energy into chemical energy. "
+    "It takes place in the chloroplasts of plant cells, using carbon dioxide "
+    "and water to produce glucose and oxygen."
+)
+
+
+def fake_embedding(text: str, dim: int = EMBEDDING_DIM) -> List[float]:
+    """Deterministic unit-length vector for a piece of text"""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dim)]
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+
+def parse_keep_alive(value: Union[str, int, float, None]) -> float:
+    """Seconds for an Ollama keep_alive value ("30m", "1h", 300, -1 = forever)"""
+    if value is None:
+        return DEFAULT_KEEP_ALIVE
+    if isinstance(value, (int, float)):
+        return float("inf") if value < 0 else float(value)
+    units = {"s": 1, "m": 60, "h": 3600}
+    if value[-1] in units:
+        seconds = float(value[:-1]) * units[value[-1]]
+    else:
+        seconds = float(value)
+    return float("inf") if seconds < 0 else seconds
+
+
+def render_messages(messages: List[dict]) -> str:
+    """Flatten chat messages the way a chat template does"""
+    return "".join(f"<|{m.get('role', 'user')}|>\n{m.get('content', '')}\n" for m in messages)
+
+
+class StubOllamaServer:
+    """
+    Threaded HTTP server imitating the Ollama endpoints used by the backend
+    
+    Args:
+        request_latency: Fixed seconds slept per HTTP request
+        item_latency: Additional seconds slept per embedded text
+        batch_endpoint: Whether /api/embed (multi-input) is available
+        prefill_latency: Seconds slept before the first generated token
+        token_latency: Seconds slept per generated token
+        prompt_token_latency: Additional prefill seconds per uncached prompt token
+        load_latency: Seconds slept when the model has to be (re)loaded
+        cache_slots: Parallel slots, each keeping the KV cache of its last prompt
+        generation_slots: Generations processed at once (0 = unlimited); further
+            requests wait, like OLLAMA_NUM_PARALLEL
+        vary_answers: End each answer with a digest of its prompt, so different
+            prompts get different answers
+        answer_fn: Builds the answer from the prompt instead of the canned answer
+    """
+    
+    def __init__(
+        self,
+        request_latency: float = 0.02,
+        item_latency: float = 0.002,
+        batch_endpoint: bool = True,
+        prefill_latency: float = 0.5,
+        token_latency: float = 0.02,
+        prompt_token_latency: float = 0.0,
+        load_latency: float = 0.0,
+        cache_slots: int = 4,
+        generation_slots: int = 0,
+        vary_answers: bool = False,
+        answer_fn: Optional[Callable[[str], str]] = None,
+        port: int = 0
+    ):
+        self.request_latency = request_latency
+        self.item_latency = item_latency
+        self.batch_endpoint = batch_endpoint
+        self.prefill_latency = prefill_latency
+        self.token_latency = token_latency
+        self.prompt_token_latency = prompt_token_latency
+        self.load_latency = load_latency
+        self.cache_slots = cache_slots
+        self.vary_answers = vary_answers
+        self.answer_fn = answer_fn
+        self.request_count = 0
+        self.generation_count = 0
+        self._lock = threading.Lock()
+        self._generation_slots = (
+            threading.BoundedSemaphore(generation_slots) if generation_slots else contextlib.nullcontext()
+        )
+        self._model_lock = threading.Lock()
+        self._clock_offset = 0.0  # Simulated idle time added by advance()
+        self._unload_at: Optional[float] = None  # None = model not loaded
+        self._slots: List[str] = []  # Cached prompts, most recently used last
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+    
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def start(self) -> "StubOllamaServer":
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+    
+    def __enter__(self) -> "StubOllamaServer":
+        return self.start()
+    
+    def __exit__(self, *exc):
+        self.stop()
+    
+    def _count_request(self):
+        with self._lock:
+            self.request_count += 1
+    
+    def now(self) -> float:
+        return time.monotonic() + self._clock_offset
+    
+    def advance(self, seconds: float):
+        """Simulate idle time (keep_alive expiry) without sleeping"""
+        self._clock_offset += seconds
+    
+    def _prefill(self, prompt: str, keep_alive) -> dict:
+        """
+        Load the model if needed and prefill the uncached part of a prompt
+        
+        Returns the timing fields Ollama reports (durations in nanoseconds).
+        """
+        with self._model_lock:
+            load_seconds = 0.0
+            if self._unload_at is None or self.now() >= self._unload_at:
+                load_seconds = self.load_latency
+                self._slots = []
+            
+            cached = max((len(os.path.commonprefix([prompt, slot])) for slot in self._slots), default=0)
+            prompt_tokens = max(len(prompt) // CHARS_PER_TOKEN, 1)
+            evaluated = max(prompt_tokens - cached // CHARS_PER_TOKEN, 1)
+            prefill_seconds = self.prefill_latency + evaluated * self.prompt_token_latency
+            
+            self._slots = [slot for slot in self._slots if slot != prompt] + [prompt]
+            self._slots = self._slots[-self.cache_slots:]
+            self._unload_at = self.now() + load_seconds + prefill_seconds + parse_keep_alive(keep_alive)
+        
+        time.sleep(load_seconds + prefill_seconds)
+        return {
+            "prompt_eval_count": evaluated,
+            "prompt_eval_duration": int(prefill_seconds * 1e9),
+            "load_duration": int(load_seconds * 1e9)
+        }
+    
+    def _make_handler(self):
+        stub = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+            
+            def log_message(self, format, *args):
+                pass
+            
+            def _read_json(self) -> dict:
+                length = int(self.headers.get("Content-Length", 0))
+                return json.loads(self.rfile.read(length) or b"{}")
+            
+            def _send_json(self, payload: dict, status: int = 200):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def _send_stream(self, events):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for event in events:
+                    line = json.dumps(event).encode("utf-8") + b"\n"
+                    self.wfile.write(f"{len(line):X}\r\n".encode() + line + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+            
+            def _generate(self, payload: dict, chat: bool):
+                prompt = render_messages(payload.get("messages", [])) if chat else payload.get("prompt", "")
+                answer = stub.answer_fn(prompt) if stub.answer_fn else CANNED_ANSWER
+                if stub.vary_answers:
+                    answer += f" [{hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]}]"
+                tokens = answer.split(" ")
+                tokens = [token + " " for token in tokens[:-1]] + tokens[-1:]
+                max_tokens = payload.get("options", {}).get("num_predict")
+                if max_tokens and max_tokens > 0:
+                    tokens = tokens[:max_tokens]
+                
+                def event(text: str, done: bool, **fields) -> dict:
+                    if chat:
+                        return {"message": {"role": "assistant", "content": text}, "done": done, **fields}
+                    return {"response": text, "done": done, **fields}
+                
+                def events():
+                    stats = stub._prefill(prompt, payload.get("keep_alive"))
+                    for token in tokens:
+                        time.sleep(stub.token_latency)
+                        yield event(token, False)
+                    yield event("", True, eval_count=len(tokens), **stats)
+                
+                with stub._lock:
+                    stub.generation_count += 1
+                
+                with stub._generation_slots:
+                    if payload.get("stream", True):
+                        self._send_stream(events())
+                    else:
+                        stats = stub._prefill(prompt, payload.get("keep_alive"))
+                        time.sleep(stub.token_latency * len(tokens))
+                        self._send_json(event("".join(tokens), True, eval_count=len(tokens), **stats))
+            
+            def do_GET(self):
+                stub._count_request()
+                if self.path == "/api/tags":
+                    self._send_json({"models": [{"name": "nomic-embed-text:latest"}]})
+                else:
+                    self._send_json({"error": "not found"}, status=404)
+            
+            def do_POST(self):
+                stub._count_request()
+                payload = self._read_json()
+                
+                if self.path == "/api/embeddings":
+                    time.sleep(stub.request_latency + stub.item_latency)
+                    self._send_json({"embedding": fake_embedding(payload.get("prompt", ""))})
+                
+                elif self.path == "/api/embed" and stub.batch_endpoint:
+                    inputs = payload.get("input", [])
+                    if isinstance(inputs, str):
+                        inputs = [inputs]
+                    time.sleep(stub.request_latency + stub.item_latency * len(inputs))
+                    self._send_json({"embeddings": [fake_embedding(text) for text in inputs]})
+                
+                elif self.path == "/api/generate":
+                    self._generate(payload, chat=False)
+                
+                elif self.path == "/api/chat":
+                    self._generate(payload, chat=True)
+                
+                else:
+                    self._send_json({"error": "not found"}, status=404)
+        
+        return Handler
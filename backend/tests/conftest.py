@@ -0,0 +1,19 @@
+"""
+Test configuration
+Run from the backend directory: python -m pytest -q
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add backend directory to path to import from app
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    """Run every test in its own directory, so data/ stores start empty"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,142 @@
+"""
+Tests for map-reduce document summarization (app/rag/summarize.py)
+The chat model and the vector store are replaced by stubs.
+"""
+
+import asyncio
+import hashlib
+import threading
+
+import pytest
+
+from app.rag import summarize, summary_cache
+from app.rag.prompts import estimate_prompt_tokens
+from app.rag.summarize import SUMMARY_SECTION_TOKENS, group_texts
+
+
+def chunk_texts(count: int) -> list:
+    return [
+        " ".join(f"Topic {i} sentence {j}: a definition and a worked example for part {i}." for j in range(12))
+        for i in range(count)
+    ]
+
+
+class StubModel:
+    """Stands in for generate_chat_completion and records the prompts it answers"""
+    
+    def __init__(self, reply=None):
+        self.prompts = []
+        self.reply = reply
+    
+    async def __call__(self, prompt: str, **kwargs) -> str:
+        self.prompts.append(prompt)
+        if self.reply is not None:
+            return self.reply
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+        return f"Summary {digest}: " + "key point " * 60
+
+
+@pytest.fixture
+def document(monkeypatch, data_dir):
+    """Serve a 40-chunk document and use a fresh summary cache"""
+    texts = chunk_texts(40)
+    chunks = [{"id": f"doc_chunk_{i}", "text": text, "metadata": {"filename": "book.pdf"}} for i, text in enumerate(texts)]
+    monkeypatch.setattr(summarize, "get_document_chunks", lambda file_id: chunks if file_id == "doc" else [])
+    monkeypatch.setattr(summary_cache, "_summary_cache", summary_cache.SummaryCache(str(data_dir / "summaries.sqlite3")))
+    return texts
+
+
+def summarize_document(file_id: str = "doc") -> list:
+    async def collect():
+        return [event async for event in summarize._stream_summary(file_id)]
+    
+    def run():
+        try:
+            outcome["events"] = asyncio.run(collect())
+        except Exception as e:
+            outcome["error"] = e
+    
+    # A loop that stops converging may never yield to the event loop, so time out from another thread
+    outcome = {}
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+    worker.join(timeout=10)
+    assert not worker.is_alive(), "summarization did not finish"
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["events"]
+
+
+def test_groups_fit_the_budget_and_keep_order():
+    texts = chunk_texts(40)
+    groups = group_texts(texts)
+    
+    assert [text for group in groups for text in group] == texts
+    assert all(len(group) >= 2 for group in groups)
+    for group in groups:
+        # Only the second text of a group may push it over the budget (groups hold at least two)
+        assert sum(estimate_prompt_tokens(text) for text in group[:-1]) <= SUMMARY_SECTION_TOKENS
+
+
+def test_repeated_grouping_converges():
+    texts = chunk_texts(200)
+    levels = 0
+    while len(texts) > 1:
+        groups = group_texts(texts)
+        assert len(groups) < len(texts)
+        texts = [f"summary {levels}.{i} " + "point " * 150 for i in range(len(groups))]
+        levels += 1
+    
+    assert levels < 10
+    assert group_texts(["only one"]) == [["only one"]]
+    assert group_texts([]) == []
+
+
+def test_summary_reduces_to_one_document_step(document, monkeypatch):
+    model = StubModel()
+    monkeypatch.setattr(summarize, "generate_chat_completion", model)
+    
+    events = summarize_document()
+    started, done = events[0], events[-1]
+    
+    assert started["type"] == "started" and started["chunks"] == len(document)
+    assert done["type"] == "done" and done["summary"].startswith("Summary ")
+    assert done["levels"] >= 2
+    assert done["steps"] == {"generated": len(model.prompts), "cached": 0}
+    progress = [event for event in events if event["type"] == "progress"]
+    assert len(progress) == len(model.prompts)
+    assert progress[-1]["stage"] == summarize.STEP_DOCUMENT and progress[-1]["total"] == 1
+
+
+def test_repeat_summary_reuses_cached_steps(document, monkeypatch):
+    model = StubModel()
+    monkeypatch.setattr(summarize, "generate_chat_completion", model)
+    
+    first = summarize_document()[-1]
+    calls = len(model.prompts)
+    second = summarize_document()[-1]
+    
+    assert len(model.prompts) == calls
+    assert second["summary"] == first["summary"]
+    assert second["steps"] == {"generated": 0, "cached": first["steps"]["generated"]}
+
+
+def test_empty_replies_fail_instead_of_looping(document, monkeypatch):
+    model = StubModel(reply="   ")
+    monkeypatch.setattr(summarize, "generate_chat_completion", model)
+    
+    with pytest.raises(Exception, match="empty summaries"):
+        summarize_document()
+    
+    # Empty replies are not cached, so a retry asks the model again
+    calls = len(model.prompts)
+    with pytest.raises(Exception, match="empty summaries"):
+        summarize_document()
+    assert len(model.prompts) == 2 * calls
+
+
+def test_unknown_document_fails(document, monkeypatch):
+    monkeypatch.setattr(summarize, "generate_chat_completion", StubModel())
+    
+    with pytest.raises(Exception, match="no indexed text"):
+        summarize_document("missing")
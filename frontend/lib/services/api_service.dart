@@ -37,7 +37,8 @@ class ApiService {
 
       final response = await http.Response.fromStream(streamedResponse);
 
-      if (response.statusCode == 200) {
+      // 202: accepted and queued for background processing
+      if (response.statusCode == 200 || response.statusCode == 202) {
         return json.decode(response.body);
       } else {
         final error = json.decode(response.body);